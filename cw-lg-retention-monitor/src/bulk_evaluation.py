@@ -0,0 +1,197 @@
+"""
+Bulk compliance evaluation over columnar log group snapshots.
+
+evaluate_columns takes a whole snapshot as columns (names, retention with a null mask,
+storedBytes and optionally creationTime) and computes every compliance verdict and
+excess storage estimate in one vectorized pass, instead of calling determine_compliance
+and create_annotation once per log group. Annotations are only formatted for the rows
+asked for. Results are identical to the scalar functions in lambda_function.
+
+NumPy is used when it is installed; otherwise the same pass runs over plain Python
+sequences, which is slower but needs nothing beyond the standard library.
+"""
+import time
+
+from lambda_function import create_annotation
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional
+    numpy = None
+
+# Compliance type of each compliance code
+COMPLIANCE_TYPES = ('COMPLIANT', 'NON_COMPLIANT')
+COMPLIANT, NON_COMPLIANT = 0, 1
+
+# Milliseconds in a day, for the age of a log group from its creationTime
+MILLISECONDS_PER_DAY = 86400000
+
+
+def split_nulls(values, null_mask=None):
+    """(values, null mask) of a column; without a mask, None entries are the nulls"""
+    if null_mask is not None:
+        return values, null_mask
+    return [0 if value is None else value for value in values], [value is None for value in values]
+
+
+def broadcast(value, count):
+    """A column of count values from a sequence, or a scalar repeated count times"""
+    if value is None or not hasattr(value, '__len__'):
+        return [value] * count
+    return value
+
+
+class BulkEvaluation:
+    """
+    Verdicts of a columnar evaluation.
+
+    compliance holds a code per row indexing COMPLIANCE_TYPES, and counts the number of
+    rows per compliance type. Excess storage is known only for rows kept longer than
+    their maximum, as with the excess_bytes of an EvaluationRecord.
+    """
+
+    def __init__(self, names, retention, retention_null, minimum, maximum, maximum_null,
+                 compliance, excess_bytes, excess_null):
+        self.names = names
+        self.retention = retention
+        self.retention_null = retention_null
+        self.minimum = minimum
+        self.maximum = maximum
+        self.maximum_null = maximum_null
+        self.compliance = compliance
+        self.excess_bytes = excess_bytes
+        self.excess_null = excess_null
+        non_compliant = int(compliance.sum()) if numpy is not None and isinstance(compliance, numpy.ndarray) \
+            else compliance.count(NON_COMPLIANT)
+        self.counts = {'COMPLIANT': len(names) - non_compliant, 'NON_COMPLIANT': non_compliant}
+
+    def __len__(self):
+        return len(self.names)
+
+    def compliance_type(self, row):
+        return COMPLIANCE_TYPES[self.compliance[row]]
+
+    def current_retention(self, row):
+        return None if self.retention_null[row] else int(self.retention[row])
+
+    def maximum_retention_days(self, row):
+        return None if self.maximum_null[row] else int(self.maximum[row])
+
+    def excess_bytes_at(self, row):
+        return None if self.excess_null[row] else int(self.excess_bytes[row])
+
+    def non_compliant_rows(self):
+        """Indexes of the NON_COMPLIANT rows, in order"""
+        if numpy is not None and isinstance(self.compliance, numpy.ndarray):
+            return numpy.flatnonzero(self.compliance).tolist()
+        return [row for row, code in enumerate(self.compliance) if code]
+
+    def annotation(self, row):
+        """The annotation create_annotation gives the log group in row"""
+        return create_annotation(
+            self.names[row], self.current_retention(row), int(self.minimum[row]),
+            self.maximum_retention_days(row), self.excess_bytes_at(row)
+        )
+
+    def annotations(self, rows):
+        """Annotations of the given rows, in the order given"""
+        return [self.annotation(row) for row in rows]
+
+
+def evaluate_columns(names, retention, minimum, maximum=None, stored_bytes=None, creation_time=None,
+                     retention_null=None, maximum_null=None, stored_bytes_null=None, creation_time_null=None,
+                     now_ms=None):
+    """
+    Evaluate a columnar snapshot of log groups.
+
+    retention, stored_bytes and creation_time are columns with one value per name; each
+    can come with a null mask, or else mark nulls with None entries. minimum and maximum
+    are either one value for every row or a column of per-row requirements (from a
+    retention policy); a maximum of None is unbounded. Without stored_bytes no excess
+    storage is estimated.
+    """
+    count = len(names)
+    now_ms = time.time() * 1000 if now_ms is None else now_ms
+    retention, retention_null = split_nulls(retention, retention_null)
+    minimum = broadcast(minimum, count)
+    maximum, maximum_null = split_nulls(broadcast(maximum, count), maximum_null)
+    if stored_bytes is None:
+        stored_bytes, stored_bytes_null = [0] * count, [True] * count
+    else:
+        stored_bytes, stored_bytes_null = split_nulls(stored_bytes, stored_bytes_null)
+    if creation_time is None:
+        creation_time, creation_time_null = [0] * count, [True] * count
+    else:
+        creation_time, creation_time_null = split_nulls(creation_time, creation_time_null)
+
+    evaluate = evaluate_numpy if numpy is not None else evaluate_python
+    return BulkEvaluation(names, *evaluate(
+        retention, retention_null, minimum, maximum, maximum_null,
+        stored_bytes, stored_bytes_null, creation_time, creation_time_null, now_ms
+    ))
+
+
+def evaluate_numpy(retention, retention_null, minimum, maximum, maximum_null,
+                   stored_bytes, stored_bytes_null, creation_time, creation_time_null, now_ms):
+    """Vectorized pass with NumPy; returns the columns of a BulkEvaluation after names"""
+    retention = numpy.asarray(retention, dtype=numpy.int64)
+    retention_null = numpy.asarray(retention_null, dtype=bool)
+    minimum = numpy.asarray(minimum, dtype=numpy.int64)
+    maximum = numpy.asarray(maximum, dtype=numpy.int64)
+    maximum_null = numpy.asarray(maximum_null, dtype=bool)
+
+    non_compliant = retention_null | (retention < minimum) | (~maximum_null & (retention > maximum))
+    compliance = non_compliant.astype(numpy.uint8)
+
+    # Days of data held: the retention period, or the age when that is shorter or retention is infinite
+    held_days = numpy.where(retention_null, numpy.inf, retention.astype(numpy.float64))
+    creation_time_null = numpy.asarray(creation_time_null, dtype=bool)
+    age_days = numpy.maximum(now_ms - numpy.asarray(creation_time, dtype=numpy.float64), 0) / MILLISECONDS_PER_DAY
+    held_days = numpy.where(creation_time_null, held_days, numpy.minimum(held_days, age_days))
+
+    known = non_compliant & ~maximum_null & ~numpy.asarray(stored_bytes_null, dtype=bool) & numpy.isfinite(held_days)
+    maximum_days = maximum.astype(numpy.float64)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        excess = numpy.asarray(stored_bytes, dtype=numpy.float64) * (1 - maximum_days / held_days)
+    excess_bytes = numpy.where(known & (held_days > maximum_days), numpy.trunc(excess), 0).astype(numpy.int64)
+    return (retention, retention_null, minimum, maximum, maximum_null, compliance, excess_bytes, ~known)
+
+
+def evaluate_python(retention, retention_null, minimum, maximum, maximum_null,
+                    stored_bytes, stored_bytes_null, creation_time, creation_time_null, now_ms):
+    """The same pass over plain sequences, for when NumPy is not installed"""
+    compliance = bytearray(
+        NON_COMPLIANT if null or value < low or (not high_null and value > high) else COMPLIANT
+        for value, null, low, high, high_null in zip(retention, retention_null, minimum, maximum, maximum_null)
+    )
+
+    excess_bytes = [0] * len(compliance)
+    excess_null = [True] * len(compliance)
+    rows = zip(compliance, retention, retention_null, maximum, maximum_null,
+               stored_bytes, stored_bytes_null, creation_time, creation_time_null)
+    for row, (code, value, null, high, high_null, stored, stored_null, created, created_null) in enumerate(rows):
+        if not code or high_null or stored_null:
+            continue
+        held_days = None if null else value
+        if not created_null:
+            age_days = max(now_ms - created, 0) / MILLISECONDS_PER_DAY
+            held_days = age_days if held_days is None else min(held_days, age_days)
+        if held_days is None:
+            continue
+        excess_null[row] = False
+        if held_days > high:
+            excess_bytes[row] = int(stored * (1 - high / held_days))
+    return (retention, retention_null, minimum, maximum, maximum_null, compliance, excess_bytes, excess_null)
+
+
+def evaluate_log_groups(log_groups, minimum, maximum=None, now_ms=None):
+    """Evaluate describe_log_groups entries by turning them into columns first"""
+    log_groups = list(log_groups)
+    return evaluate_columns(
+        [log_group['logGroupName'] for log_group in log_groups],
+        [log_group.get('retentionInDays') for log_group in log_groups],
+        minimum, maximum,
+        stored_bytes=[log_group.get('storedBytes') for log_group in log_groups],
+        creation_time=[log_group.get('creationTime') for log_group in log_groups],
+        now_ms=now_ms
+    )
@@ -0,0 +1,152 @@
+"""
+Batch consumer for buffered log group change events.
+
+Instead of one rule invocation and one single-item put_evaluations call per change,
+Config configuration item changes and CloudTrail log group API calls are routed by
+EventBridge into an SQS queue. This consumer receives up to the event source mapping's
+batch size at a time, evaluates each change with evaluate_single_log_group and submits
+the results in full put_evaluations batches.
+"""
+import json
+import os
+
+from lambda_function import (
+    METRICS,
+    SUBMITTED_EVALUATIONS,
+    EvaluationBuffer,
+    EvaluationContext,
+    EvaluationSubmissionError,
+    emit_invocation_metrics,
+    evaluate_single_log_group,
+    get_client,
+    get_configuration_item,
+    get_state_store,
+    load_result_token,
+    submit_evaluations,
+)
+from retry import RETRY_METRICS
+
+# CloudTrail calls that change a log group's existence or retention
+LOG_GROUP_API_CALLS = frozenset(['CreateLogGroup', 'PutRetentionPolicy', 'DeleteRetentionPolicy', 'DeleteLogGroup'])
+
+
+def configuration_item_from_api_call(detail):
+    """
+    Build a configuration item from a CloudTrail log group API call.
+
+    Returns None for failed calls and calls that do not affect retention.
+    """
+    if detail.get('eventName') not in LOG_GROUP_API_CALLS or detail.get('errorCode'):
+        return None
+    parameters = detail.get('requestParameters') or {}
+    log_group_name = parameters['logGroupName']
+    event_name = detail['eventName']
+
+    configuration = {'logGroupName': log_group_name}
+    if event_name == 'PutRetentionPolicy':
+        configuration['retentionInDays'] = parameters['retentionInDays']
+
+    return {
+        'resourceType': 'AWS::Logs::LogGroup',
+        'resourceId': log_group_name,
+        'configurationItemStatus': 'ResourceDeleted' if event_name == 'DeleteLogGroup' else 'OK',
+        'configurationItemCaptureTime': detail['eventTime'],
+        'configuration': configuration
+    }
+
+
+def parse_change_message(message, config_client):
+    """
+    Turn one buffered message into (configuration_item, result_token).
+
+    Accepts EventBridge events for Config configuration item changes and CloudTrail
+    API calls, and Config rule events forwarded as-is, which also carry a result token.
+    configuration_item is None for messages that are not about a log group.
+    """
+    if 'invokingEvent' in message:
+        evaluation_context = EvaluationContext.from_event(message)
+        configuration_item = get_configuration_item(evaluation_context.invoking_event, config_client)
+        result_token = evaluation_context.result_token
+    elif message.get('detail-type') == 'AWS API Call via CloudTrail':
+        configuration_item = configuration_item_from_api_call(message['detail'])
+        result_token = None
+    else:
+        configuration_item = get_configuration_item(message['detail'], config_client)
+        result_token = None
+
+    if not configuration_item or configuration_item.get('resourceType') != 'AWS::Logs::LogGroup':
+        return None, result_token
+    return configuration_item, result_token
+
+
+def get_rule_event():
+    """Stand-in event identifying the rule whose saved state the consumer reads"""
+    return {'configRuleName': os.environ.get('CONFIG_RULE_NAME')}
+
+
+def change_batch_handler(event, context):
+    """
+    SQS-triggered handler that evaluates a batch of buffered log group changes.
+
+    Evaluations are submitted under the newest result token in the batch, or else the
+    token the rule function last saved to the state store. Without any token the changes
+    are left for the next reconciliation sweep. A log group changed more than once, or
+    reported by both Config and CloudTrail, is submitted once in its latest state, and a
+    change older than one this container already submitted is dropped. Messages that
+    cannot be parsed and messages whose log group was in a failed put_evaluations batch
+    are reported as batch item failures, so SQS redelivers only those messages.
+    """
+    RETRY_METRICS.clear()
+    METRICS.clear()
+    records = event.get('Records', [])
+    required_retention_days = int(os.environ.get('REQUIRED_RETENTION_DAYS', '1'))
+    rule_context = EvaluationContext.from_event(get_rule_event())
+    filters = rule_context.log_group_filters
+    policy = rule_context.retention_policy
+    config_client = get_client('config')
+
+    # Several messages can describe one log group, from both sources or successive changes
+    evaluations = EvaluationBuffer(SUBMITTED_EVALUATIONS)
+    message_resource_ids = []
+    failures = []
+    result_token = None
+
+    for record in records:
+        try:
+            configuration_item, message_token = parse_change_message(json.loads(record['body']), config_client)
+        except Exception as e:
+            print(f"Could not process message {record.get('messageId')}: {e}")
+            failures.append(record['messageId'])
+            continue
+        result_token = message_token or result_token
+        if configuration_item is None:
+            continue
+        evaluation = evaluate_single_log_group(
+            configuration_item, required_retention_days, filters, policy, rule_context.maximum_retention_days
+        )
+        evaluations.add(evaluation)
+        message_resource_ids.append((record['messageId'], evaluation['ComplianceResourceId']))
+
+    print(f"Evaluated {len(message_resource_ids)} log group changes to {len(evaluations)} log groups "
+          f"from {len(records)} messages")
+
+    if evaluations:
+        result_token = result_token or load_result_token(get_state_store(), get_rule_event())
+        if result_token is None:
+            print(f"No result token saved yet, leaving {len(evaluations)} changes to the next reconciliation sweep")
+        else:
+            rejected = set()
+            try:
+                submit_evaluations(config_client, list(evaluations), {'resultToken': result_token}, rejected=rejected)
+                evaluations.record_submitted(rejected)
+            except EvaluationSubmissionError as e:
+                evaluations.record_submitted(e.failed_resource_ids | rejected)
+                failures.extend(
+                    message_id for message_id, resource_id in message_resource_ids
+                    if resource_id in e.failed_resource_ids
+                )
+
+    METRICS.count('ChangeMessages', len(records))
+    METRICS.count('FailedChangeMessages', len(failures))
+    emit_invocation_metrics(get_rule_event())
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in failures]}
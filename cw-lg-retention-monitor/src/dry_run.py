@@ -0,0 +1,383 @@
+"""
+Dry-run evaluation for the CloudWatch Log Group Retention Monitor.
+
+Evaluates log groups exactly as the rule does, with the same filters, retention policy,
+compliance logic and annotations, but writes the verdicts to a file instead of
+submitting them to AWS Config. Log groups come from the account itself or from a saved
+describe_log_groups dump, and results are evaluated and written a page at a time, so
+memory stays constant however many log groups there are.
+
+Usage:
+    python src/dry_run.py --minimum-retention-days 30 --output verdicts.jsonl
+    python src/dry_run.py --input log-groups.json --output verdicts.csv --policy-file policy.json
+    aws logs describe-log-groups --output json > log-groups.json
+
+Dumps are the JSON the AWS CLI writes ({"logGroups": [...]}, also as a bare list), or
+JSON Lines with one log group or one describe_log_groups page per line; either may be
+gzipped. A log group in a dump may carry a "tags" object for tag rules of the policy.
+"""
+import argparse
+import contextlib
+import csv
+import gzip
+import json
+import os
+import sys
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from json.encoder import encode_basestring_ascii as encode_json_string
+
+from lambda_function import (
+    EvaluationContext,
+    create_annotation,
+    create_log_group_record,
+    get_client,
+    iter_batches,
+    iter_log_group_evaluations,
+)
+from retention_policy import RetentionRequirement
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet output is optional
+    pyarrow = None
+
+# Columns of every output format, in order
+COLUMNS = (
+    'resource_id', 'compliance_type', 'retention_in_days', 'minimum_retention_days',
+    'maximum_retention_days', 'excess_stored_bytes', 'annotation'
+)
+
+# Characters read from a JSON dump at a time
+DUMP_CHUNK_SIZE = 1 << 20
+
+# Whitespace and commas between the elements of a JSON array
+ARRAY_SEPARATOR = re.compile(r'[\s,]*')
+
+# Rows evaluated and written at a time
+OUTPUT_PAGE_SIZE = 1000
+
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 65536
+
+# Output formats by file extension; anything else is JSON Lines
+FORMAT_EXTENSIONS = {'.csv': 'csv', '.parquet': 'parquet', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+def open_text(path, mode='r'):
+    """Open a file as UTF-8 text, through gzip when its name ends in .gz; '-' is stdin"""
+    if path == '-':
+        return contextlib.nullcontext(sys.stdin)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def iter_json_array(stream, key=None, chunk_size=DUMP_CHUNK_SIZE):
+    """
+    Yield the elements of a JSON array read from stream a chunk at a time.
+
+    The array is the first one in the document, or the value of key when given. Only the
+    element being decoded is held in memory, so a dump of any size is read in constant space.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+
+    def fill():
+        nonlocal buffer, position
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return False
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    marker = f'"{key}"' if key else '['
+    while True:
+        index = buffer.find(marker, position)
+        if index >= 0:
+            position = index + len(marker)
+            break
+        position = max(position, len(buffer) - len(marker))
+        if not fill():
+            raise ValueError(f"No {marker} array in log group dump")
+    if key:
+        while True:
+            index = buffer.find('[', position)
+            if index >= 0:
+                position = index + 1
+                break
+            position = len(buffer)
+            if not fill():
+                raise ValueError(f"No {marker} array in log group dump")
+
+    while True:
+        position = ARRAY_SEPARATOR.match(buffer, position).end()
+        if position == len(buffer):
+            if not fill():
+                raise ValueError("Log group dump ends inside an array")
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # The element runs past the end of the buffer; a truly invalid one fails at end of file
+            if not fill():
+                raise
+            continue
+        yield item
+        position = end
+
+
+def iter_dump_log_groups(path):
+    """Yield the log groups of a describe_log_groups dump, one at a time"""
+    name = path[:-3] if path.endswith('.gz') else path
+    with open_text(path) as stream:
+        if name.endswith(('.jsonl', '.ndjson')):
+            for line in stream:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if 'logGroups' in item:
+                    yield from item['logGroups']
+                else:
+                    yield item
+            return
+        first = stream.read(1)
+        while first and first.isspace():
+            first = stream.read(1)
+        # Put the peeked character back in front of the rest of the stream
+        reader = PeekedStream(first, stream)
+        yield from iter_json_array(reader, key=None if first == '[' else 'logGroups')
+
+
+class PeekedStream:
+    """Stream whose first read returns text already taken from the underlying stream"""
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size):
+        head, self.head = self.head, ''
+        return head + self.stream.read(size)
+
+
+def iter_dump_evaluations(log_groups, event):
+    """
+    Evaluate log groups from a dump the way a sweep evaluates a listed page.
+
+    Log groups the rule's filters exclude are skipped, and each remaining one is held to the
+    requirement the retention policy sets for it, using the dump's tags for tag rules.
+    """
+    event = EvaluationContext.from_event(event)
+    filters = event.log_group_filters
+    policy = event.retention_policy
+    requirement = default_requirement = RetentionRequirement(event.required_retention_days,
+                                                             event.maximum_retention_days)
+    ordering_timestamp = event.ordering_timestamp
+    now_ms = time.time() * 1000
+    for log_group in log_groups:
+        log_group_name = log_group['logGroupName']
+        if not filters.matches(log_group_name, log_group.get('logGroupClass')):
+            continue
+        if policy:
+            requirement = policy.requirement(log_group_name, log_group.get('tags'), default_requirement)
+        yield create_log_group_record(log_group, requirement, ordering_timestamp, now_ms)
+
+
+def to_row(record):
+    """Output row of an EvaluationRecord in COLUMNS order, with the annotation the rule would submit"""
+    return (
+        record.resource_id, record.compliance_type, record.current_retention, record.required_retention_days,
+        record.maximum_retention_days, record.excess_bytes,
+        create_annotation(record.resource_id, record.current_retention, record.required_retention_days,
+                          record.maximum_retention_days, record.excess_bytes)
+    )
+
+
+class JsonLinesWriter:
+    """
+    Writes one JSON object per row.
+
+    Lines are filled into a template with each string escaped by the json module, which
+    is several times faster than encoding a dict per row and produces the same JSON.
+    """
+    TEMPLATE = '{' + ', '.join(f'"{column}": %s' for column in COLUMNS) + '}\n'
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write_rows(self, rows):
+        template = self.TEMPLATE
+        self.stream.write(''.join([
+            template % (
+                encode_json_string(resource_id), encode_json_string(compliance_type),
+                'null' if retention is None else retention, minimum, 'null' if maximum is None else maximum,
+                'null' if excess_bytes is None else excess_bytes, encode_json_string(annotation)
+            )
+            for resource_id, compliance_type, retention, minimum, maximum, excess_bytes, annotation in rows
+        ]))
+
+    def close(self):
+        pass
+
+
+class CsvWriter:
+    """Writes rows as CSV with a header; missing values are empty cells"""
+
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(COLUMNS)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    """Writes rows to a Parquet file, buffering one row group of columns at a time"""
+
+    def __init__(self, path, row_group_size=PARQUET_ROW_GROUP_SIZE):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output requires pyarrow (pip install pyarrow)")
+        self.schema = pyarrow.schema([
+            ('resource_id', pyarrow.string()),
+            ('compliance_type', pyarrow.string()),
+            ('retention_in_days', pyarrow.int32()),
+            ('minimum_retention_days', pyarrow.int32()),
+            ('maximum_retention_days', pyarrow.int32()),
+            ('excess_stored_bytes', pyarrow.int64()),
+            ('annotation', pyarrow.string())
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            columns = dict(zip(COLUMNS, map(list, zip(*self.rows))))
+            self.writer.write_table(pyarrow.Table.from_pydict(columns, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+def get_output_format(path, output_format=None):
+    """Output format given explicitly, or from the output file's extension"""
+    if output_format:
+        return output_format
+    name = path[:-3] if path.endswith('.gz') else path
+    return FORMAT_EXTENSIONS.get(os.path.splitext(name)[1], 'jsonl')
+
+
+def build_event(rule_parameters):
+    """Scheduled rule event for the dry run; it carries no result token, so nothing can be submitted"""
+    return {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': datetime.now(timezone.utc).isoformat()
+        }),
+        'ruleParameters': json.dumps(rule_parameters),
+        'configRuleName': 'dry-run'
+    }
+
+
+def run_dry_run(event, output_path='-', output_format=None, input_path=None, logs_client=None):
+    """
+    Evaluate every log group in scope and write the verdicts; returns the count per compliance type.
+
+    Log groups are listed from the account with logs_client (or the default Logs client),
+    or read from the dump at input_path. The rule's own messages go to stderr so that
+    output to stdout stays parseable.
+    """
+    event = EvaluationContext.from_event(event)
+    output_format = get_output_format(output_path, output_format)
+    stdout = sys.stdout
+    counts = Counter()
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        if input_path:
+            records = iter_dump_evaluations(iter_dump_log_groups(input_path), event)
+        else:
+            records = iter_log_group_evaluations(
+                logs_client or get_client('logs'), event.required_retention_days, event, reconcile=False
+            )
+
+        if output_format == 'parquet':
+            if output_path == '-':
+                raise ValueError("Parquet output needs an output file")
+            writer = ParquetWriter(output_path)
+        else:
+            stream = stdout if output_path == '-' else stack.enter_context(open_text(output_path, 'w'))
+            writer = JsonLinesWriter(stream) if output_format == 'jsonl' else CsvWriter(stream)
+
+        try:
+            for page in iter_batches(records, OUTPUT_PAGE_SIZE):
+                rows = [to_row(record) for record in page]
+                writer.write_rows(rows)
+                counts.update(row[1] for row in rows)
+                counts['excess_stored_bytes'] += sum(row[5] for row in rows if row[5])
+        finally:
+            writer.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Evaluate log group retention like the Config rule, without submitting evaluations'
+    )
+    parser.add_argument('--input', help='describe_log_groups dump (JSON or JSON Lines, optionally .gz); '
+                                        'the account is listed when omitted')
+    parser.add_argument('--output', default='-', help='output file, or - for stdout (default)')
+    parser.add_argument('--format', choices=('jsonl', 'csv', 'parquet'),
+                        help='output format (default: from the output extension, else jsonl)')
+    parser.add_argument('--rule-parameters', default='{}', help="the rule's InputParameters as JSON")
+    parser.add_argument('--minimum-retention-days', type=int, help='overrides MinimumRetentionDays')
+    parser.add_argument('--maximum-retention-days', type=int, help='overrides MaximumRetentionDays')
+    parser.add_argument('--policy-file', help='retention policy document; overrides RetentionPolicy')
+    parser.add_argument('--profile', help='AWS profile for listing the account')
+    parser.add_argument('--region', help='AWS region for listing the account')
+    args = parser.parse_args(argv)
+
+    rule_parameters = json.loads(args.rule_parameters)
+    if args.minimum_retention_days is not None:
+        rule_parameters['MinimumRetentionDays'] = args.minimum_retention_days
+    if args.maximum_retention_days is not None:
+        rule_parameters['MaximumRetentionDays'] = args.maximum_retention_days
+    if args.policy_file:
+        with open(args.policy_file, encoding='utf-8') as policy_file:
+            rule_parameters['RetentionPolicy'] = policy_file.read()
+    if args.profile:
+        os.environ['AWS_PROFILE'] = args.profile
+    if args.region:
+        os.environ['AWS_DEFAULT_REGION'] = args.region
+
+    started = time.monotonic()
+    counts = run_dry_run(EvaluationContext(build_event(rule_parameters)), args.output, args.format, args.input)
+    elapsed = time.monotonic() - started
+    total = counts['COMPLIANT'] + counts['NON_COMPLIANT']
+    print(
+        f"Evaluated {total} log groups in {elapsed:.1f}s: {counts['COMPLIANT']} COMPLIANT, "
+        f"{counts['NON_COMPLIANT']} NON_COMPLIANT, {counts['excess_stored_bytes']} bytes of excess storage",
+        file=sys.stderr
+    )
+
+
+if __name__ == '__main__':
+    main()
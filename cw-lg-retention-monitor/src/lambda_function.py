@@ -1,8 +1,710 @@
 import json
 import boto3
 import botocore
+import botocore.config
 import os
-from datetime import datetime
+import queue
+import re
+import string
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from functools import cached_property, partial
+from itertools import islice
+
+from metrics import MetricsRecorder, metric_name
+from retention_policy import RetentionPolicy, RetentionRequirement
+from retry import (
+    RETRY_METRICS,
+    call_with_retry,
+    get_rate_limit_scope,
+    get_retry_metrics,
+    paginate_with_retry,
+    rate_limit_scope,
+)
+from state_store import FileStateStore, S3StateStore
+
+# Config accepts maximum 100 evaluations per PutEvaluations request
+MAX_EVALUATIONS_PER_REQUEST = 100
+
+# Config rejects an evaluation whose Annotation is longer than this many characters
+MAX_ANNOTATION_LENGTH = 256
+
+# Marks the part of an annotation cut to fit MAX_ANNOTATION_LENGTH
+ANNOTATION_ELLIPSIS = '...'
+
+# Payload budget of one PutEvaluations request body; a batch is closed at 100
+# evaluations or this many bytes of JSON, whichever comes first
+MAX_EVALUATIONS_REQUEST_BYTES = 256 * 1024
+
+# JSON bytes of an evaluation besides its string values (keys, quotes and separators),
+# and of a request besides its evaluations and result token
+EVALUATION_PAYLOAD_OVERHEAD_BYTES = 120
+REQUEST_PAYLOAD_OVERHEAD_BYTES = 64
+
+# Number of put_evaluations requests in flight at once (1 = sequential)
+DEFAULT_SUBMIT_CONCURRENCY = 1
+
+# Characters allowed in CloudWatch log group names, used to split the keyspace into shards
+LOG_GROUP_NAME_CHARACTERS = string.ascii_letters + string.digits + '_-/.#'
+
+# Prefix expanded one character per level when sharding, since most log groups live under it
+DEFAULT_SHARD_EXPANSION_PATH = '/aws/'
+
+# Remaining invocation time at which a sweep stops listing, flushes and checkpoints
+DEFAULT_CHECKPOINT_MARGIN_SECONDS = 60
+
+# Slack allowed when deciding whether a reconciliation sweep is due, since daily
+# scheduled notifications do not arrive exactly 24 hours apart
+RECONCILIATION_TOLERANCE = timedelta(hours=1)
+
+# Connections kept open per client beyond the submit workers, for listing and lookups
+CLIENT_POOL_HEADROOM = 4
+
+# Oversized configuration items remembered across warm invocations, and for how long
+DEFAULT_CONFIGURATION_ITEM_CACHE_SIZE = 1024
+DEFAULT_CONFIGURATION_ITEM_CACHE_TTL_SECONDS = 900
+
+# OrderingTimestamps of change evaluations already submitted, remembered across warm
+# invocations so a change that has since been replaced is not submitted after it
+DEFAULT_SUBMITTED_EVALUATION_CACHE_SIZE = 10000
+DEFAULT_SUBMITTED_EVALUATION_CACHE_TTL_SECONDS = 3600
+
+# Include/exclude patterns are case-sensitive substrings, limited to what logGroupNamePattern accepts
+LOG_GROUP_NAME_PATTERN = re.compile(r'^[.\-_/#A-Za-z0-9]+$')
+
+# Values of describe_log_groups' logGroupClass filter
+LOG_GROUP_CLASSES = frozenset(['STANDARD', 'INFREQUENT_ACCESS', 'DELIVERY'])
+
+# Listing units (prefixes or patterns) paged in parallel, and pages buffered per unit ahead of the sweep
+DEFAULT_LIST_CONCURRENCY = 4
+LIST_PREFETCH_PAGES = 4
+
+# Where a scheduled sweep lists log groups: the CloudWatch Logs API, or an advanced query
+# over the configuration items Config already records
+INVENTORY_SOURCES = frozenset(['logs', 'config'])
+
+# Results per select_resource_config page (the API maximum)
+ADVANCED_QUERY_PAGE_SIZE = 100
+
+# Log group fields every advanced query selects; the rest are selected only when the rule uses them
+ADVANCED_QUERY_FIELDS = ('resourceId', 'configuration.retentionInDays')
+
+# Fields of a log group configuration document the rule evaluates: retention, the storage
+# and age behind the excess estimate, and the class the LogGroupClass filter reads. Tag
+# values are always strings, so a quoted tag named like a numeric field cannot match.
+CONFIGURATION_NUMBER_FIELDS = ('retentionInDays', 'storedBytes', 'creationTime')
+CONFIGURATION_STRING_FIELDS = ('logGroupClass',)
+CONFIGURATION_FIELD_PATTERN = re.compile(
+    r'"(retentionInDays|storedBytes|creationTime)"\s*:\s*(null|\d+)'
+    r'|"(logGroupClass)"\s*:\s*(null|"[^"\\]*")'
+)
+
+
+# Error codes Config returns for a put_evaluations batch holding an invalid evaluation.
+# Such a batch is bisected to isolate the evaluation instead of being retried.
+REJECTED_BATCH_ERROR_CODES = frozenset([
+    'InvalidParameterValueException',
+    'ValidationException',
+])
+
+
+def is_rejected_batch_error(error):
+    """Check whether a botocore ClientError rejects the evaluations of a put_evaluations batch"""
+    return error.response.get('Error', {}).get('Code') in REJECTED_BATCH_ERROR_CODES
+
+
+# Stage timings and counters of the current invocation, emitted as Embedded Metric Format records
+METRICS = MetricsRecorder()
+
+
+def is_debug_logging():
+    """Check whether LOG_LEVEL asks for debug output such as full event dumps"""
+    return os.environ.get('LOG_LEVEL', 'INFO').upper() == 'DEBUG'
+
+
+def emit_invocation_metrics(event, dimensions=None):
+    """
+    Add this invocation's API call counters to METRICS and flush them as EMF records.
+    
+    Metrics are dimensioned by the rule name unless other dimensions are given.
+    """
+    event = EvaluationContext.from_event(event)
+    api_metrics = get_retry_metrics()
+    for operation, metrics in api_metrics.items():
+        METRICS.count(metric_name(operation, 'Calls'), metrics['calls'])
+        METRICS.count(metric_name(operation, 'Retries'), metrics['retries'])
+    METRICS.count('ApiCalls', sum(metrics['calls'] for metrics in api_metrics.values()))
+    METRICS.count('ApiRetries', sum(metrics['retries'] for metrics in api_metrics.values()))
+    
+    properties = {'MessageType': event.message_type}
+    if event.shard is not None:
+        properties['Shard'] = event.shard['index']
+    METRICS.flush(dimensions or {'ConfigRuleName': event.config_rule_name or 'unknown'}, properties)
+
+
+# Clients created on first use and reused by every warm invocation of the container
+CLIENT_CACHE = {}
+_client_lock = threading.Lock()
+
+
+def get_client_config():
+    """Build the botocore config shared by all clients"""
+    return botocore.config.Config(
+        # Throttling is retried by call_with_retry, so botocore's own retries stay minimal
+        # instead of multiplying the attempts of the outer retry loop
+        retries={'max_attempts': 2, 'mode': 'standard'},
+        # Enough pooled connections for every submit worker so no request waits on a socket
+        max_pool_connections=max(10, get_submit_concurrency() + CLIENT_POOL_HEADROOM),
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=30
+    )
+
+
+def get_client(service_name):
+    """
+    Get the client for a service, creating it on first use.
+    
+    Clients live at module scope so warm invocations skip endpoint resolution, credential
+    loading and TLS handshakes, and keep-alive connections are reused between invocations.
+    """
+    client = CLIENT_CACHE.get(service_name)
+    if client is None:
+        with _client_lock:
+            client = CLIENT_CACHE.get(service_name)
+            if client is None:
+                client = boto3.client(service_name, config=get_client_config())
+                CLIENT_CACHE[service_name] = client
+    return client
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl_seconds after they were stored"""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or an expired entry"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        """Hit, miss and size counters"""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Oversized configuration items by (resourceId, configurationItemCaptureTime)
+CONFIGURATION_ITEM_CACHE = TTLCache(
+    int(os.environ.get('CONFIGURATION_ITEM_CACHE_SIZE', DEFAULT_CONFIGURATION_ITEM_CACHE_SIZE)),
+    float(os.environ.get('CONFIGURATION_ITEM_CACHE_TTL_SECONDS', DEFAULT_CONFIGURATION_ITEM_CACHE_TTL_SECONDS))
+)
+
+# Newest OrderingTimestamp and verdict submitted per resource ID by change-triggered evaluations
+SUBMITTED_EVALUATIONS = TTLCache(
+    int(os.environ.get('SUBMITTED_EVALUATION_CACHE_SIZE', DEFAULT_SUBMITTED_EVALUATION_CACHE_SIZE)),
+    float(os.environ.get('SUBMITTED_EVALUATION_CACHE_TTL_SECONDS', DEFAULT_SUBMITTED_EVALUATION_CACHE_TTL_SECONDS))
+)
+
+
+class EvaluationSubmissionError(Exception):
+    """Raised after a submission run when one or more put_evaluations batches failed"""
+
+    def __init__(self, errors, batch_count, failed_resource_ids=()):
+        self.errors = errors
+        self.batch_count = batch_count
+        self.failed_resource_ids = frozenset(failed_resource_ids)
+        details = '; '.join(f"batch {batch_number}: {error}" for batch_number, error in errors)
+        super().__init__(f"{len(errors)} of {batch_count} evaluation batches failed to submit ({details})")
+
+
+class LogGroupFilters:
+    """
+    Which log groups the rule covers, from its include/exclude rule parameters.
+    
+    Include prefixes and patterns are listed server-side with logGroupNamePrefix and
+    logGroupNamePattern; a log group is in scope if it matches any of them, or always when
+    none is given. Exclusions have no server-side form, so excluded log groups are dropped
+    from each page before they are evaluated. log_group_class is passed as logGroupClass.
+    """
+    
+    # Rule parameter and environment variable of each filter; values are comma-separated
+    PARAMETERS = {
+        'include_prefixes': ('IncludeLogGroupPrefixes', 'INCLUDE_LOG_GROUP_PREFIXES'),
+        'exclude_prefixes': ('ExcludeLogGroupPrefixes', 'EXCLUDE_LOG_GROUP_PREFIXES'),
+        'include_patterns': ('IncludeLogGroupPatterns', 'INCLUDE_LOG_GROUP_PATTERNS'),
+        'exclude_patterns': ('ExcludeLogGroupPatterns', 'EXCLUDE_LOG_GROUP_PATTERNS'),
+    }
+    
+    def __init__(self, include_prefixes=(), exclude_prefixes=(), include_patterns=(), exclude_patterns=(),
+                 log_group_class=None):
+        for pattern in list(include_patterns) + list(exclude_patterns):
+            if not LOG_GROUP_NAME_PATTERN.match(pattern):
+                raise ValueError(f"Invalid log group name pattern: {pattern!r}")
+        if log_group_class and log_group_class not in LOG_GROUP_CLASSES:
+            raise ValueError(f"Invalid log group class: {log_group_class!r}")
+        
+        # Drop include prefixes covered by a shorter one, so prefix listings never overlap
+        self.include_prefixes = []
+        for prefix in sorted(set(include_prefixes)):
+            if not self.include_prefixes or not prefix.startswith(self.include_prefixes[-1]):
+                self.include_prefixes.append(prefix)
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.include_patterns = sorted(set(include_patterns))
+        self.exclude_patterns = tuple(exclude_patterns)
+        self.log_group_class = log_group_class or None
+    
+    @classmethod
+    def from_rule_parameters(cls, rule_parameters):
+        """Build filters from rule parameters, falling back to the environment"""
+        values = {}
+        for name, (parameter, variable) in cls.PARAMETERS.items():
+            value = rule_parameters.get(parameter, os.environ.get(variable, ''))
+            values[name] = [item.strip() for item in value.split(',') if item.strip()]
+        values['log_group_class'] = rule_parameters.get('LogGroupClass', os.environ.get('LOG_GROUP_CLASS', ''))
+        return cls(**values)
+    
+    @property
+    def has_includes(self):
+        return bool(self.include_prefixes or self.include_patterns)
+    
+    def matches(self, log_group_name, log_group_class=None):
+        """Check whether a log group is in scope; an unknown class is assumed to match"""
+        if self.log_group_class and log_group_class and log_group_class != self.log_group_class:
+            return False
+        if self.has_includes and not (
+            log_group_name.startswith(tuple(self.include_prefixes))
+            or any(pattern in log_group_name for pattern in self.include_patterns)
+        ):
+            return False
+        return not (
+            log_group_name.startswith(self.exclude_prefixes)
+            or any(pattern in log_group_name for pattern in self.exclude_patterns)
+        )
+    
+    def list_kwargs(self):
+        """describe_log_groups arguments shared by every listing unit"""
+        return {'logGroupClass': self.log_group_class} if self.log_group_class else {}
+
+
+def load_retention_policy(rule_parameters):
+    """
+    Compile the retention policy of a rule.
+    
+    The RetentionPolicy rule parameter holds the policy inline, falling back to the
+    RETENTION_POLICY environment variable and then to the file at RETENTION_POLICY_FILE,
+    for policies larger than a rule parameter allows. No policy is an empty policy.
+    """
+    document = rule_parameters.get('RetentionPolicy', os.environ.get('RETENTION_POLICY', ''))
+    if not document.strip() and os.environ.get('RETENTION_POLICY_FILE'):
+        with open(os.environ['RETENTION_POLICY_FILE']) as policy_file:
+            document = policy_file.read()
+    return RetentionPolicy.from_document(document)
+
+
+def load_log_group_tags(tag_keys, tagging_client=None):
+    """
+    Get {log_group_name: {key: value}} for every log group tagged with one of tag_keys.
+    
+    describe_log_groups returns no tags, so they are read in bulk from the Resource Groups
+    Tagging API up front, 100 log groups per call, and only the keys the policy uses are kept.
+    GetResources returns only resources matching every one of its tag filters, so each key
+    is listed on its own and the results merged.
+    tagging_client defaults to the function's own account and region.
+    """
+    if tagging_client is None:
+        tagging_client = get_client('resourcegroupstaggingapi')
+    tags_by_name = {}
+    for key in sorted(tag_keys):
+        params = {
+            'ResourceTypeFilters': ['logs:log-group'],
+            'TagFilters': [{'Key': key}],
+            'ResourcesPerPage': 100
+        }
+        while True:
+            response = call_with_retry(tagging_client, 'get_resources', **params)
+            for resource in response.get('ResourceTagMappingList', []):
+                log_group_name = resource['ResourceARN'].split(':log-group:', 1)[-1].removesuffix(':*')
+                tags = tags_by_name.setdefault(log_group_name, {})
+                for tag in resource.get('Tags', []):
+                    if tag['Key'] in tag_keys:
+                        tags[tag['Key']] = tag['Value']
+            if not response.get('PaginationToken'):
+                break
+            params['PaginationToken'] = response['PaginationToken']
+    print(f"Loaded policy tags of {len(tags_by_name)} log groups")
+    return tags_by_name
+
+
+class EvaluationContext:
+    """
+    A Config rule event parsed once per invocation.
+    
+    lambda_handler builds it from the raw event and passes it down every evaluation path,
+    so invokingEvent and ruleParameters are decoded a single time instead of once per
+    log group. Functions that take an event accept either the raw event or this object.
+    """
+
+    def __init__(self, event):
+        self.event = event
+        self.invoking_event = json.loads(event['invokingEvent']) if 'invokingEvent' in event else {}
+        self.rule_parameters = json.loads(event['ruleParameters']) if event.get('ruleParameters') else {}
+        self.message_type = self.invoking_event.get('messageType')
+        self.ordering_timestamp = self.invoking_event.get('notificationCreationTime')
+        self.result_token = event.get('resultToken')
+        self.config_rule_name = event.get('configRuleName')
+        self.account_id = event.get('accountId')
+        self.shard = event.get('shard')
+
+    @cached_property
+    def required_retention_days(self):
+        """Minimum retention from the rule parameter, falling back to the environment"""
+        return int(self.rule_parameters.get('MinimumRetentionDays', os.environ.get('REQUIRED_RETENTION_DAYS', '1')))
+    
+    @cached_property
+    def maximum_retention_days(self):
+        """Optional maximum retention; empty means no upper bound"""
+        maximum = str(self.rule_parameters.get('MaximumRetentionDays', os.environ.get('MAXIMUM_RETENTION_DAYS', '')))
+        maximum_retention_days = int(maximum) if maximum.strip() else None
+        if maximum_retention_days is not None and maximum_retention_days < self.required_retention_days:
+            raise ValueError(
+                f"MaximumRetentionDays ({maximum_retention_days}) is below "
+                f"MinimumRetentionDays ({self.required_retention_days})"
+            )
+        return maximum_retention_days
+    
+    @cached_property
+    def inventory_source(self):
+        """Source of the log group inventory for scheduled sweeps"""
+        inventory_source = (
+            self.rule_parameters.get('InventorySource', os.environ.get('INVENTORY_SOURCE', '')).strip().lower() or 'logs'
+        )
+        if inventory_source not in INVENTORY_SOURCES:
+            raise ValueError(f"Invalid inventory source: {inventory_source!r}")
+        return inventory_source
+    
+    @cached_property
+    def log_group_filters(self):
+        """Log group filters from the rule parameters, parsed on first use"""
+        return LogGroupFilters.from_rule_parameters(self.rule_parameters)
+    
+    @cached_property
+    def retention_policy(self):
+        """Retention policy from the rule parameter or environment, compiled on first use"""
+        return load_retention_policy(self.rule_parameters)
+    
+    @classmethod
+    def from_event(cls, event):
+        """Parse a raw event, or return it unchanged if it already is an EvaluationContext"""
+        if isinstance(event, cls):
+            return event
+        return cls(event)
+
+
+def get_state_store():
+    """Get the configured sweep state store, or None when no store is configured"""
+    if os.environ.get('STATE_BUCKET'):
+        return S3StateStore(os.environ['STATE_BUCKET'], os.environ.get('STATE_PREFIX', ''), get_client('s3'))
+    if os.environ.get('STATE_DIRECTORY'):
+        return FileStateStore(os.environ['STATE_DIRECTORY'])
+    return None
+
+
+def is_incremental_enabled():
+    """Check whether scheduled sweeps should only submit changed log groups"""
+    return os.environ.get('INCREMENTAL_EVALUATION', 'false').lower() == 'true'
+
+
+def is_change_buffer_enabled():
+    """Check whether change events are buffered for the batch consumer, which needs the latest result token"""
+    return os.environ.get('CHANGE_BUFFER', 'false').lower() == 'true'
+
+
+def state_key(event, name):
+    """State store key of a sweep state document for this rule (and shard)"""
+    event = EvaluationContext.from_event(event)
+    rule_name = event.config_rule_name or 'default'
+    shard = event.shard
+    if shard:
+        return f"{rule_name}/{name}-{shard['index']}-of-{shard['count']}.json"
+    return f"{rule_name}/{name}.json"
+
+
+def snapshot_key(event):
+    """State store key of the last submitted log group snapshot"""
+    return state_key(event, 'snapshot')
+
+
+def load_snapshot(store, event, required_retention_days):
+    """
+    Load the last submitted state as {log_group_name: [retention, compliance]}.
+    
+    The snapshot doubles as the index of previously evaluated resources used for
+    deletion reconciliation. Returns None when it is missing or corrupt, in which
+    case the index is rebuilt from Config. If the retention bounds or the retention policy
+    have changed since the snapshot was taken every entry is blanked, so each log group is
+    re-submitted while deletions are still detected from the snapshot names.
+    """
+    try:
+        document = store.load(snapshot_key(event))
+        if document is None:
+            print("No previous snapshot, rebuilding evaluated resource index from Config")
+            return None
+        log_groups = document['log_groups']
+        if not isinstance(log_groups, dict):
+            raise TypeError(f"log_groups is a {type(log_groups).__name__}")
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Previous snapshot is corrupt ({e}), rebuilding evaluated resource index from Config")
+        return None
+    
+    event = EvaluationContext.from_event(event)
+    if (document.get('required_retention_days') != required_retention_days
+            or document.get('maximum_retention_days') != event.maximum_retention_days
+            or document.get('retention_policy') != event.retention_policy.fingerprint):
+        print("Retention requirements changed since last snapshot, re-submitting all log groups")
+        return dict.fromkeys(log_groups)
+    return log_groups
+
+
+def save_snapshot(store, event, required_retention_days, log_groups):
+    """Save the submitted state of every existing log group for the next sweep"""
+    event = EvaluationContext.from_event(event)
+    store.save(snapshot_key(event), {
+        'required_retention_days': required_retention_days,
+        'maximum_retention_days': event.maximum_retention_days,
+        'retention_policy': event.retention_policy.fingerprint,
+        'log_groups': log_groups
+    })
+    print(f"Saved snapshot of {len(log_groups)} log groups")
+
+
+class SweepProgress:
+    """Listing position and reconciliation state of a scheduled sweep, checkpointed between invocations"""
+
+    def __init__(self, position=None, evaluated_resources=()):
+        # [listing unit index, describe_log_groups nextToken] at which listing resumes
+        self.position = position
+        self.evaluated_resources = set(evaluated_resources)
+        self.complete = False
+
+
+def load_checkpoint(store, event):
+    """
+    Load the checkpoint of an unfinished sweep as (SweepProgress, current_snapshot).
+    
+    Only a checkpoint written for this invocation's resultToken is resumed; anything
+    else belongs to an earlier sweep and is ignored. Returns None when there is nothing to resume.
+    """
+    try:
+        document = store.load(state_key(event, 'checkpoint'))
+        if document is None:
+            return None
+        if document['result_token'] != EvaluationContext.from_event(event).result_token:
+            print("Ignoring checkpoint from a previous sweep")
+            return None
+        progress = SweepProgress(document['position'], document['evaluated_resources'])
+        current_snapshot = dict(document['current_snapshot'])
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Checkpoint is corrupt ({e}), starting the sweep from the beginning")
+        return None
+    
+    print(f"Resuming sweep at {progress.position} with {len(progress.evaluated_resources)} log groups already evaluated")
+    return progress, current_snapshot
+
+
+def save_checkpoint(store, event, progress, current_snapshot):
+    """Save the position and reconciliation state of an unfinished sweep"""
+    store.save(state_key(event, 'checkpoint'), {
+        'result_token': EvaluationContext.from_event(event).result_token,
+        'position': progress.position,
+        'evaluated_resources': sorted(progress.evaluated_resources),
+        'current_snapshot': current_snapshot
+    })
+    print(f"Saved checkpoint at {progress.position} after {len(progress.evaluated_resources)} log groups")
+
+
+def get_reconciliation_interval_days():
+    """Days between full reconciliation sweeps in hybrid mode (0 = sweep on every scheduled notification)"""
+    return max(0, int(os.environ.get('RECONCILIATION_INTERVAL_DAYS', '0')))
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp as sent by Config, including a trailing Z"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def is_reconciliation_due(store, event):
+    """
+    Check whether a scheduled notification should run a full reconciliation sweep.
+    
+    In hybrid mode change notifications keep compliance current and scheduled sweeps only
+    catch missed changes and deletions. Config cannot schedule a rule less often than every
+    24 hours, so notifications arriving within RECONCILIATION_INTERVAL_DAYS of the last
+    completed sweep are skipped. Without a state store every notification runs a sweep.
+    """
+    interval_days = get_reconciliation_interval_days()
+    if not interval_days or store is None:
+        return True
+    event = EvaluationContext.from_event(event)
+    try:
+        document = store.load(state_key(event, 'reconciliation'))
+        if document is None:
+            return True
+        elapsed = parse_timestamp(event.ordering_timestamp) - parse_timestamp(document['completed_at'])
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"Could not read last reconciliation time ({e}), running a full sweep")
+        return True
+    if elapsed + RECONCILIATION_TOLERANCE >= timedelta(days=interval_days):
+        return True
+    print(f"Last reconciliation sweep was {elapsed} ago, next is due after {interval_days} days")
+    return False
+
+
+def record_reconciliation(store, event):
+    """Record the time of a completed (or fully dispatched) reconciliation sweep"""
+    if store is not None and get_reconciliation_interval_days():
+        store.save(state_key(event, 'reconciliation'), {
+            'completed_at': EvaluationContext.from_event(event).ordering_timestamp
+        })
+
+
+def save_result_token(store, event):
+    """Save the result token of a Config invocation for the change batch consumer to submit under"""
+    event = EvaluationContext.from_event(event)
+    if store is not None and event.result_token:
+        store.save(state_key(event, 'result_token'), {
+            'result_token': event.result_token,
+            'received_at': event.ordering_timestamp
+        })
+
+
+def load_result_token(store, event):
+    """Load the most recently saved result token, or None if there is none"""
+    if store is None:
+        return None
+    try:
+        document = store.load(state_key(event, 'result_token'))
+        return document['result_token'] if document else None
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"Saved result token is unreadable ({e})")
+        return None
+
+
+def get_deadline_check(context):
+    """Build a check that is true once the invocation is close to its timeout, or None without a Lambda context"""
+    if not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    margin_ms = int(os.environ.get('CHECKPOINT_MARGIN_SECONDS', DEFAULT_CHECKPOINT_MARGIN_SECONDS)) * 1000
+    return lambda: context.get_remaining_time_in_millis() < margin_ms
+
+
+def get_shard_count():
+    """Get the number of worker invocations a scheduled sweep fans out to"""
+    return max(1, int(os.environ.get('SWEEP_SHARDS', '1')))
+
+
+def build_shard_units(expansion_path=DEFAULT_SHARD_EXPANSION_PATH):
+    """
+    Split the log group keyspace into disjoint listing units.
+    
+    Returns (prefixes, names). Starting from the empty prefix, each step along
+    expansion_path replaces a prefix P with P + c for every allowed character plus the
+    exact name P, so the units never overlap and together cover every possible name.
+    """
+    prefixes = ['']
+    names = []
+    for depth in range(len(expansion_path) + 1):
+        expanded = expansion_path[:depth]
+        prefixes.remove(expanded)
+        if expanded:
+            names.append(expanded)
+        prefixes.extend(expanded + character for character in LOG_GROUP_NAME_CHARACTERS)
+    return sorted(prefixes), names
+
+
+def build_shards(shard_count, expansion_path=DEFAULT_SHARD_EXPANSION_PATH):
+    """Distribute the keyspace units round-robin across shard_count shards"""
+    prefixes, names = build_shard_units(expansion_path)
+    return [
+        {
+            'index': index,
+            'count': shard_count,
+            'prefixes': prefixes[index::shard_count],
+            'names': names[index::shard_count]
+        }
+        for index in range(shard_count)
+    ]
+
+
+def in_shard(log_group_name, shard):
+    """Check whether a log group name falls in a shard's part of the keyspace"""
+    return log_group_name.startswith(tuple(shard['prefixes'])) or log_group_name in shard['names']
+
+
+class LambdaInvoker:
+    """Invokes a worker Lambda function asynchronously with a shard or continuation event"""
+
+    def __init__(self, function_name, lambda_client=None):
+        self.function_name = function_name
+        self.lambda_client = lambda_client or get_client('lambda')
+
+    def invoke(self, payload):
+        call_with_retry(
+            self.lambda_client,
+            'invoke',
+            FunctionName=self.function_name,
+            InvocationType='Event',
+            Payload=json.dumps(payload).encode('utf-8')
+        )
+
+
+def get_self_invoker(context):
+    """Get the invoker used to hand shards and continuations to new invocations of this function"""
+    return LambdaInvoker(context.invoked_function_arn)
+
+
+def dispatch_shards(event, context, shard_count):
+    """
+    Fan a scheduled sweep out to one worker invocation per shard.
+    
+    Every worker receives the original Config event, including its resultToken, so the
+    evaluations each worker submits land in the same compliance view.
+    """
+    invoker = get_self_invoker(context)
+    raw_event = EvaluationContext.from_event(event).event
+    for shard in build_shards(shard_count):
+        invoker.invoke(dict(raw_event, shard=shard))
+    print(f"Dispatched scheduled sweep to {shard_count} shards")
 
 
 def lambda_handler(event, context):
@@ -18,152 +720,572 @@ def lambda_handler(event, context):
     Does not modify or enforce retention policies - monitoring only.
     """
     
-    print(f"Received event: {json.dumps(event, default=str)}")
+    invocation_start = time.perf_counter()
+    RETRY_METRICS.clear()
+    METRICS.clear()
     
-    # Extract rule parameters
-    rule_parameters = {}
-    if 'ruleParameters' in event:
-        rule_parameters = json.loads(event['ruleParameters'])
+    # Parse the invoking event once for every evaluation path
+    evaluation_context = EvaluationContext.from_event(event)
+    message_type = evaluation_context.message_type
     
-    # Get minimum retention days from parameters or environment
-    required_retention_days = int(
-        rule_parameters.get('MinimumRetentionDays', 
-        os.environ.get('REQUIRED_RETENTION_DAYS', '1'))
-    )
-    
-    print(f"Minimum retention days: {required_retention_days}")
-    
-    # Parse invoking event
-    invoking_event = json.loads(event['invokingEvent'])
-    message_type = invoking_event['messageType']
+    # Serializing the whole event costs time and log volume on every invocation
+    if is_debug_logging():
+        print(f"Received event: {json.dumps(event, default=str)}")
+    else:
+        print(f"Received {message_type} for rule {evaluation_context.config_rule_name}")
     
-    # Initialize AWS clients
-    config_client = boto3.client('config')
-    logs_client = boto3.client('logs')
+    # Reuse AWS clients across warm invocations
+    config_client = get_client('config')
+    logs_client = get_client('logs')
     
-    evaluations = []
+    evaluations_count = 0
     
     try:
-        if message_type == 'ScheduledNotification':
-            # Periodic evaluation - check all log groups
-            evaluations = evaluate_all_log_groups(logs_client, required_retention_days, event)
+        # Rule parameters are validated on first use, so invalid ones reach the fallback below
+        required_retention_days = evaluation_context.required_retention_days
+        print(f"Minimum retention days: {required_retention_days}")
+        if evaluation_context.maximum_retention_days is not None:
+            print(f"Maximum retention days: {evaluation_context.maximum_retention_days}")
+        
+        if is_change_buffer_enabled() and evaluation_context.shard is None:
+            # The change batch consumer has no Config invocation of its own to take a token from
+            save_result_token(get_state_store(), evaluation_context)
+        
+        if (message_type == 'ScheduledNotification' and evaluation_context.shard is None
+                and not is_reconciliation_due(get_state_store(), evaluation_context)):
+            # Hybrid mode - change notifications keep compliance current between reconciliation sweeps
+            print("Skipping scheduled sweep until the next reconciliation is due")
+        elif message_type == 'ScheduledNotification' and evaluation_context.shard is None and get_shard_count() > 1:
+            # Large accounts - coordinator hands each part of the keyspace to a worker invocation
+            dispatch_shards(evaluation_context, context, get_shard_count())
+            record_reconciliation(get_state_store(), evaluation_context)
+        elif message_type == 'ScheduledNotification':
+            # Periodic evaluation - stream evaluations for all log groups to Config page by page
+            evaluations_count = run_scheduled_sweep(
+                config_client, logs_client, required_retention_days, evaluation_context, context
+            )
         elif message_type in ['ConfigurationItemChangeNotification', 'OversizedConfigurationItemChangeNotification']:
-            # Configuration change - evaluate specific log group
-            configuration_item = get_configuration_item(invoking_event, config_client)
+            # Configuration change - evaluate specific log group. Config may deliver a change
+            # after a newer one for the same log group, which this container already submitted.
+            evaluations = EvaluationBuffer(SUBMITTED_EVALUATIONS)
+            configuration_item = get_configuration_item(evaluation_context.invoking_event, config_client)
             if configuration_item and configuration_item.get('resourceType') == 'AWS::Logs::LogGroup':
-                evaluation = evaluate_single_log_group(configuration_item, required_retention_days)
+                evaluation = evaluate_single_log_group(
+                    configuration_item, required_retention_days, evaluation_context.log_group_filters,
+                    evaluation_context.retention_policy, evaluation_context.maximum_retention_days
+                )
                 if evaluation:
-                    evaluations.append(evaluation)
+                    evaluations.add(evaluation)
+            if evaluations:
+                rejected = set()
+                evaluations_count = submit_evaluations(
+                    config_client, list(evaluations), evaluation_context, rejected=rejected
+                )
+                evaluations.record_submitted(rejected)
         else:
             print(f"Unsupported message type: {message_type}")
             
     except Exception as e:
         print(f"Error during evaluation: {str(e)}")
-        # Return a NOT_APPLICABLE evaluation to prevent Config rule failure
-        evaluations = [{
+        # Submit a NOT_APPLICABLE evaluation to prevent Config rule failure.
+        # Batches already flushed by a scheduled sweep stay submitted.
+        evaluations_count = submit_evaluations(config_client, [{
             'ComplianceResourceType': 'AWS::::Account',
-            'ComplianceResourceId': event.get('accountId', 'unknown'),
+            'ComplianceResourceId': evaluation_context.account_id or 'unknown',
             'ComplianceType': 'NOT_APPLICABLE',
             'Annotation': f'Error during evaluation: {str(e)}',
             'OrderingTimestamp': datetime.now()
-        }]
+        }], evaluation_context)
     
-    # Submit evaluations to Config
-    if evaluations:
-        submit_evaluations(config_client, evaluations, event)
+    if RETRY_METRICS:
+        print(f"AWS API call metrics: {json.dumps(RETRY_METRICS)}")
+    if message_type == 'OversizedConfigurationItemChangeNotification':
+        print(f"Configuration item cache: {json.dumps(CONFIGURATION_ITEM_CACHE.stats())}")
+    METRICS.record_time('Invocation', time.perf_counter() - invocation_start)
+    emit_invocation_metrics(evaluation_context)
     
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'Config rule evaluation completed',
-            'evaluations_count': len(evaluations)
+            'evaluations_count': evaluations_count
         })
     }
 
 
+def run_scheduled_sweep(config_client, logs_client, required_retention_days, event, context=None):
+    """
+    Evaluate every log group and stream the evaluations to Config.
+    
+    With a state store configured, deletions are found by set difference against the
+    snapshot of the last submitted state instead of paging through every previous
+    compliance result, and in incremental mode only new, changed and removed log groups
+    are submitted. The snapshot is replaced only after every batch has been submitted.
+    
+    When the invocation nears its timeout the sweep stops at a page boundary, flushes what
+    it has, checkpoints its position and hands the rest to a follow-up invocation, which
+    resumes from the checkpoint instead of listing finished pages again.
+    """
+    event = EvaluationContext.from_event(event)
+    store = get_state_store()
+    incremental = is_incremental_enabled()
+    if store is None:
+        if incremental:
+            print("Incremental evaluation requires STATE_BUCKET or STATE_DIRECTORY, running a full sweep")
+        return sweep_and_submit(config_client, logs_client, required_retention_days, event)
+    
+    previous_snapshot = load_snapshot(store, event, required_retention_days)
+    progress, current_snapshot = load_checkpoint(store, event) or (SweepProgress(), {})
+    rejected = set()
+    evaluations_count = sweep_and_submit(
+        config_client, logs_client, required_retention_days, event,
+        rejected=rejected,
+        previous_snapshot=previous_snapshot,
+        current_snapshot=current_snapshot,
+        incremental=incremental,
+        progress=progress,
+        should_stop=get_deadline_check(context)
+    )
+    # Rejected evaluations were never recorded by Config, so the next sweep submits them again
+    for resource_id in rejected:
+        current_snapshot.pop(resource_id, None)
+    
+    if not progress.complete:
+        save_checkpoint(store, event, progress, current_snapshot)
+        get_self_invoker(context).invoke(EvaluationContext.from_event(event).event)
+        print("Handed the rest of the sweep to a follow-up invocation")
+        return evaluations_count
+    
+    save_snapshot(store, event, required_retention_days, current_snapshot)
+    store.delete(state_key(event, 'checkpoint'))
+    if event.shard is None:
+        record_reconciliation(store, event)
+    return evaluations_count
+
+
+def get_listing_units(shard=None, filters=None):
+    """
+    Listing units of a sweep as (kind, value) pairs.
+    
+    kind is 'prefix' (a logGroupNamePrefix, or None for every log group), 'name' (one exact
+    name) or 'pattern' (a logGroupNamePattern). Without include filters the units are the
+    shard's part of the keyspace, or one unfiltered unit when unsharded. Include prefixes are
+    intersected with the shard's prefixes. A pattern cannot be combined with a prefix, so
+    every shard lists each include pattern and keeps only its own log groups.
+    """
+    if filters is None or not filters.has_includes:
+        if shard is None:
+            return [('prefix', None)]
+        return [('prefix', prefix) for prefix in shard['prefixes']] + [('name', name) for name in shard['names']]
+    
+    include_prefixes = tuple(filters.include_prefixes)
+    if shard is None:
+        prefixes, names = include_prefixes, []
+    else:
+        prefixes = sorted({
+            include if include.startswith(shard_prefix) else shard_prefix
+            for shard_prefix in shard['prefixes']
+            for include in include_prefixes
+            if include.startswith(shard_prefix) or shard_prefix.startswith(include)
+        })
+        names = [name for name in shard['names'] if name.startswith(include_prefixes)] if include_prefixes else []
+    return (
+        [('prefix', prefix) for prefix in prefixes]
+        + [('name', name) for name in names]
+        + [('pattern', pattern) for pattern in filters.include_patterns]
+    )
+
+
+def get_list_concurrency():
+    """Get the number of listing units paged in parallel from the environment"""
+    return max(1, int(os.environ.get('LIST_CONCURRENCY', DEFAULT_LIST_CONCURRENCY)))
+
+
+def iter_unit_pages(logs_client, unit, starting_token=None, **kwargs):
+    """
+    Yield (log_groups, nextToken) for each describe_log_groups page of one listing unit.
+    
+    Exact-name units are checked with a single-item request, since a name sorts before
+    every longer name sharing its prefix.
+    """
+    kind, value = unit
+    if kind == 'name':
+        response = call_with_retry(logs_client, 'describe_log_groups', logGroupNamePrefix=value, limit=1, **kwargs)
+        yield [log_group for log_group in response['logGroups'] if log_group['logGroupName'] == value], None
+        return
+    
+    if value is not None:
+        kwargs['logGroupNamePrefix' if kind == 'prefix' else 'logGroupNamePattern'] = value
+    for page in paginate_with_retry(logs_client, 'describe_log_groups', starting_token=starting_token, **kwargs):
+        yield page['logGroups'], page.get('nextToken')
+
+
+def iter_log_group_pages(logs_client, shard=None, position=None, filters=None, concurrency=1):
+    """
+    Yield (log_groups, position) for each describe_log_groups page of a sweep.
+    
+    position is the [unit index, nextToken] at which listing resumes after that page, and
+    can be passed back in to continue a sweep where it stopped. Units are listed
+    server-side with logGroupNamePrefix or logGroupNamePattern; log groups the filters
+    exclude are dropped from each page. With concurrency above 1 several units are paged
+    in parallel, but pages are still yielded in unit order so positions stay valid.
+    """
+    units = get_listing_units(shard, filters)
+    start_unit, start_token = position or (0, None)
+    list_kwargs = filters.list_kwargs() if filters is not None else {}
+    
+    def list_unit(unit_index):
+        starting_token = start_token if unit_index == start_unit else None
+        for log_groups, next_token in iter_unit_pages(logs_client, units[unit_index], starting_token, **list_kwargs):
+            yield unit_index, log_groups, next_token
+    
+    producers = [partial(list_unit, unit_index) for unit_index in range(start_unit, len(units))]
+    if concurrency > 1 and len(producers) > 1:
+        pages = iter_prefetched(producers, concurrency, LIST_PREFETCH_PAGES)
+    else:
+        pages = (page for producer in producers for page in producer())
+    
+    for unit_index, log_groups, next_token in pages:
+        if filters is not None:
+            listed = len(log_groups)
+            pattern_unit = units[unit_index][0] == 'pattern' and shard is not None
+            log_groups = [
+                log_group for log_group in log_groups
+                if filters.matches(log_group['logGroupName'], log_group.get('logGroupClass'))
+                and not (pattern_unit and not in_shard(log_group['logGroupName'], shard))
+            ]
+            if listed > len(log_groups):
+                METRICS.count('ExcludedLogGroups', listed - len(log_groups))
+        yield log_groups, [unit_index, next_token] if next_token else [unit_index + 1, None]
+
+
+def build_log_group_query(fields, conditions=()):
+    """Advanced query selecting fields of every log group Config records, narrowed by conditions"""
+    where = ' AND '.join(("resourceType = 'AWS::Logs::LogGroup'",) + tuple(conditions))
+    return f"SELECT {', '.join(fields)} WHERE {where}"
+
+
+def get_log_group_query_fields(event):
+    """
+    Fields an advanced query selects for the rule.
+    
+    Storage and age are only needed to estimate excess storage when a maximum retention
+    applies, the log group class only to filter on it and tags only for tag rules, so each
+    is selected only then and pages stay small.
+    """
+    event = EvaluationContext.from_event(event)
+    policy = event.retention_policy
+    fields = list(ADVANCED_QUERY_FIELDS)
+    if event.maximum_retention_days is not None or any(maximum is not None for _, maximum in policy.bounds):
+        fields += ['configuration.storedBytes', 'configuration.creationTime']
+    if event.log_group_filters.log_group_class:
+        fields.append('configuration.logGroupClass')
+    if policy.tag_keys:
+        fields.append('tags')
+    return fields
+
+
+def iter_advanced_query_pages(expression, starting_token=None, aggregator_name=None):
+    """
+    Yield (results, next_token) for each page of a Config advanced query.
+    
+    Results arrive as JSON documents and are yielded parsed. With aggregator_name the
+    query runs against that configuration aggregator, across all its accounts and regions.
+    """
+    config_client = get_client('config')
+    params = {'Expression': expression, 'Limit': ADVANCED_QUERY_PAGE_SIZE}
+    operation = 'select_resource_config'
+    if aggregator_name:
+        operation = 'select_aggregate_resource_config'
+        params['ConfigurationAggregatorName'] = aggregator_name
+    next_token = starting_token
+    while True:
+        if next_token:
+            params['NextToken'] = next_token
+        response = call_with_retry(config_client, operation, **params)
+        next_token = response.get('NextToken')
+        yield [json.loads(result) for result in response.get('Results', [])], next_token
+        if not next_token:
+            return
+
+
+def config_result_to_log_group(result):
+    """Turn an advanced query result into a describe_log_groups entry, with tags as a dict if selected"""
+    log_group = dict(result.get('configuration') or {})
+    log_group['logGroupName'] = result['resourceId']
+    if 'tags' in result:
+        log_group['tags'] = {tag['key']: tag['value'] for tag in result['tags'] or ()}
+    return log_group
+
+
+def iter_config_log_group_pages(event, position=None):
+    """
+    Yield (log_groups, position) for each page of an advanced query over the recorded log groups.
+    
+    The Config counterpart of iter_log_group_pages: position is ['config', NextToken] after
+    each page, with a None token once the query is exhausted. Log groups the filters
+    exclude, and for a worker invocation those outside its shard, are dropped from each page.
+    """
+    event = EvaluationContext.from_event(event)
+    if position is not None and position[1] is None:
+        return
+    filters = event.log_group_filters
+    shard = event.shard
+    expression = build_log_group_query(get_log_group_query_fields(event))
+    for results, next_token in iter_advanced_query_pages(expression, position[1] if position else None):
+        log_groups = []
+        for result in results:
+            log_group = config_result_to_log_group(result)
+            if shard and not in_shard(log_group['logGroupName'], shard):
+                continue
+            if filters.matches(log_group['logGroupName'], log_group.get('logGroupClass')):
+                log_groups.append(log_group)
+            else:
+                METRICS.count('ExcludedLogGroups')
+        yield log_groups, ['config', next_token]
+
+
 def evaluate_all_log_groups(logs_client, required_retention_days, event):
-    """Evaluate all CloudWatch log groups in the account"""
-    evaluations = []
-    evaluated_resources = set()
+    """Evaluate all CloudWatch log groups in the account, one evaluation per resource"""
+    evaluations = EvaluationBuffer()
+    evaluations.extend(iter_log_group_evaluations(logs_client, required_retention_days, event))
+    return [materialize_evaluation(evaluation) for evaluation in evaluations]
+
+
+def iter_log_group_evaluations(logs_client, required_retention_days, event,
+                               previous_snapshot=None, current_snapshot=None, incremental=False,
+                               progress=None, should_stop=None, reconcile=True, tagging_client=None):
+    """
+    Yield evaluations for all CloudWatch log groups in the account, one describe_log_groups page at a time.
+    
+    Existing log groups are yielded as compact EvaluationRecords as soon as their page arrives,
+    so callers can submit full batches while pagination continues; records become Config
+    evaluation dicts only when their batch is submitted. Deleted log groups are yielded as dicts once every page has been read.
+    A worker invocation (event.shard) only lists and reconciles its own part of the keyspace.
+    With the rule's inventory source set to config, log groups are read from the configuration
+    items Config records, with an advanced query, instead of from describe_log_groups.
+    
+    With a previous_snapshot ({name: [retention, compliance]}) deletions are the snapshot names
+    that were not listed; otherwise they are found by scanning the rule's compliance results in
+    Config. In incremental mode log groups whose state matches the snapshot are skipped.
+    Each log group is held to the requirement the retention policy sets for it, or to
+    required_retention_days and the rule's maximum when the policy has no rule for it.
+    Log groups kept longer than their maximum carry the storage estimated to be in excess,
+    from the storedBytes and creationTime already in each page.
+    current_snapshot, if given, is filled with the state of every listed log group.
+    
+    progress carries the listing position and evaluated names, so a sweep resumed from a
+    checkpoint continues where it stopped. If should_stop() turns true at a page boundary
+    the generator ends early and progress.complete stays False. With reconcile False
+    the generator ends after listing and deletions are left to the caller.
+    tagging_client reads the policy's tags in the account and region logs_client lists.
+    """
+    event = EvaluationContext.from_event(event)
+    if progress is None:
+        progress = SweepProgress()
+    evaluated_resources = progress.evaluated_resources
+    evaluations_count = 0
+    ordering_timestamp = event.ordering_timestamp
+    policy = event.retention_policy
+    requirement = default_requirement = RetentionRequirement(required_retention_days, event.maximum_retention_days)
+    now_ms = time.time() * 1000
+    from_config = event.inventory_source == 'config'
+    position = progress.position
+    # A checkpoint written while listing from the other source is restarted; evaluated log groups are still skipped
+    if position is not None and (position[0] == 'config') != from_config:
+        position = None
     
     try:
-        # First, get all existing log groups and evaluate them
-        paginator = logs_client.get_paginator('describe_log_groups')
-        
-        for page in paginator.paginate():
-            for log_group in page['logGroups']:
+        # Advanced queries select tags with each log group; describe_log_groups returns none
+        log_group_tags = load_log_group_tags(policy.tag_keys, tagging_client) if policy.tag_keys and not from_config else {}
+        if from_config:
+            pages = iter_config_log_group_pages(event, position)
+            page_metric = 'SelectResourceConfigPage'
+        else:
+            pages = iter_log_group_pages(
+                logs_client, event.shard, position, event.log_group_filters, get_list_concurrency()
+            )
+            page_metric = 'DescribeLogGroupsPage'
+        for log_groups, position in METRICS.iter_timed(page_metric, pages):
+            METRICS.count('LogGroups', len(log_groups))
+            for log_group in log_groups:
                 log_group_name = log_group['logGroupName']
-                current_retention = log_group.get('retentionInDays')
-                
-                evaluation = create_evaluation(
-                    resource_id=log_group_name,
-                    resource_type='AWS::Logs::LogGroup',
-                    current_retention=current_retention,
-                    required_retention_days=required_retention_days,
-                    event=event
-                )
-                evaluations.append(evaluation)
+                # Include prefixes and patterns can both match a log group
+                if log_group_name in evaluated_resources:
+                    continue
                 evaluated_resources.add(log_group_name)
-        
-        # Get previously evaluated resources from Config to check for deletions
-        config_client = boto3.client('config')
-        try:
-            # Get all previously evaluated resources for this rule
-            config_rule_name = event.get('configRuleName')
-            if config_rule_name:
-                # Get paginated results for all previously evaluated resources
-                next_token = None
-                previously_evaluated = set()
                 
-                while True:
-                    params = {
-                        'ConfigRuleName': config_rule_name,
-                        'ComplianceTypes': ['COMPLIANT', 'NON_COMPLIANT']
-                    }
-                    if next_token:
-                        params['NextToken'] = next_token
-                    
-                    detail_response = config_client.get_compliance_details_by_config_rule(**params)
-                    
-                    for result in detail_response.get('EvaluationResults', []):
-                        resource_id = result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
-                        previously_evaluated.add(resource_id)
-                        
-                        # If this resource was previously evaluated but doesn't exist anymore, mark as NOT_APPLICABLE
-                        if resource_id not in evaluated_resources:
-                            evaluation = {
-                                'ComplianceResourceType': 'AWS::Logs::LogGroup',
-                                'ComplianceResourceId': resource_id,
-                                'ComplianceType': 'NOT_APPLICABLE',
-                                'Annotation': f"Log group '{resource_id}' no longer exists",
-                                'OrderingTimestamp': json.loads(event['invokingEvent'])['notificationCreationTime']
-                            }
-                            evaluations.append(evaluation)
-                            print(f"Marking deleted log group as NOT_APPLICABLE: {resource_id}")
-                    
-                    # Check if there are more results
-                    next_token = detail_response.get('NextToken')
-                    if not next_token:
-                        break
+                if policy:
+                    requirement = policy.requirement(
+                        log_group_name, log_group.get('tags') or log_group_tags.get(log_group_name),
+                        default_requirement
+                    )
+                evaluation = create_log_group_record(log_group, requirement, ordering_timestamp, now_ms)
                 
-                print(f"Found {len(previously_evaluated)} previously evaluated resources")
-                            
-        except Exception as e:
-            # If we can't get previous evaluations, just continue with current resources
-            print(f"Could not retrieve previous evaluations: {e}")
+                if current_snapshot is not None or incremental:
+                    state = [evaluation.current_retention, evaluation.compliance_type]
+                    if current_snapshot is not None:
+                        current_snapshot[log_group_name] = state
+                    if incremental and previous_snapshot is not None and previous_snapshot.get(log_group_name) == state:
+                        continue
+                
+                evaluations_count += 1
+                yield evaluation
+            
+            progress.position = position
+            if should_stop is not None and should_stop():
+                print(f"Stopping sweep before timeout after {evaluations_count} evaluations")
+                return
                 
     except botocore.exceptions.ClientError as e:
         print(f"Error describing log groups: {e}")
         raise e
+    
+    if reconcile:
+        if previous_snapshot is not None:
+            deleted_evaluations = (
+                create_unlisted_evaluation(resource_id, ordering_timestamp, event.log_group_filters)
+                for resource_id in previous_snapshot.keys() - evaluated_resources
+            )
+        else:
+            deleted_evaluations = iter_deleted_log_group_evaluations(evaluated_resources, event)
         
-    print(f"Evaluated {len(evaluations)} total resources ({len(evaluated_resources)} existing log groups)")
-    return evaluations
+        for evaluation in METRICS.iter_timed('Reconciliation', deleted_evaluations, per_item=False):
+            evaluations_count += 1
+            yield evaluation
+    
+    progress.complete = True
+    print(f"Evaluated {evaluations_count} total resources ({len(evaluated_resources)} existing log groups)")
+
+
+def create_log_group_record(log_group, requirement, ordering_timestamp, now_ms=None):
+    """Evaluate a describe_log_groups entry against its RetentionRequirement as an EvaluationRecord"""
+    current_retention = log_group.get('retentionInDays')
+    compliance_type = determine_compliance(current_retention, *requirement)
+    excess_bytes = None
+    if compliance_type == 'NON_COMPLIANT' and requirement.maximum is not None:
+        excess_bytes = estimate_excess_bytes(
+            current_retention, requirement.maximum, log_group.get('storedBytes'), log_group.get('creationTime'), now_ms
+        )
+        if excess_bytes:
+            METRICS.count('ExcessStoredBytes', excess_bytes)
+    return EvaluationRecord(
+        log_group['logGroupName'], current_retention, compliance_type, requirement.minimum, ordering_timestamp,
+        requirement.maximum, excess_bytes
+    )
+
+
+def create_deleted_evaluation(resource_id, ordering_timestamp):
+    """Create a NOT_APPLICABLE evaluation for a log group that no longer exists"""
+    print(f"Marking deleted log group as NOT_APPLICABLE: {resource_id}")
+    return {
+        'ComplianceResourceType': 'AWS::Logs::LogGroup',
+        'ComplianceResourceId': resource_id,
+        'ComplianceType': 'NOT_APPLICABLE',
+        'Annotation': f"Log group '{resource_id}' no longer exists",
+        'OrderingTimestamp': ordering_timestamp
+    }
+
+
+def create_excluded_evaluation(resource_id, ordering_timestamp):
+    """Create a NOT_APPLICABLE evaluation for a log group the rule's filters exclude"""
+    return {
+        'ComplianceResourceType': 'AWS::Logs::LogGroup',
+        'ComplianceResourceId': resource_id,
+        'ComplianceType': 'NOT_APPLICABLE',
+        'Annotation': f"Log group '{resource_id}' is excluded by the rule's log group filters",
+        'OrderingTimestamp': ordering_timestamp
+    }
+
+
+def create_unlisted_evaluation(resource_id, ordering_timestamp, filters):
+    """Evaluate a previously evaluated log group that the sweep did not list: excluded or deleted"""
+    if not filters.matches(resource_id):
+        return create_excluded_evaluation(resource_id, ordering_timestamp)
+    return create_deleted_evaluation(resource_id, ordering_timestamp)
+
+
+def iter_previous_resource_ids(event):
+    """Yield the resource ID of every COMPLIANT and NON_COMPLIANT result of the rule in Config"""
+    config_client = get_client('config')
+    next_token = None
+    
+    while True:
+        params = {
+            'ConfigRuleName': event.config_rule_name,
+            'ComplianceTypes': ['COMPLIANT', 'NON_COMPLIANT']
+        }
+        if next_token:
+            params['NextToken'] = next_token
+        
+        detail_response = call_with_retry(config_client, 'get_compliance_details_by_config_rule', **params)
+        
+        for result in detail_response.get('EvaluationResults', []):
+            yield result['EvaluationResultIdentifier']['EvaluationResultQualifier']['ResourceId']
+        
+        # Check if there are more results
+        next_token = detail_response.get('NextToken')
+        if not next_token:
+            break
+
+
+def iter_deleted_log_group_evaluations(evaluated_resources, event):
+    """Yield NOT_APPLICABLE evaluations for previously evaluated log groups that no longer exist"""
+    event = EvaluationContext.from_event(event)
+    ordering_timestamp = event.ordering_timestamp
+    shard = event.shard
+    try:
+        # Get previously evaluated resources from Config to check for deletions
+        if event.config_rule_name:
+            previously_evaluated = set()
+            
+            for resource_id in iter_previous_resource_ids(event):
+                previously_evaluated.add(resource_id)
+                
+                # Sharded workers only reconcile resources in their own part of the keyspace
+                if shard and not in_shard(resource_id, shard):
+                    continue
+                
+                # If this resource was previously evaluated but doesn't exist anymore, mark as NOT_APPLICABLE
+                if resource_id not in evaluated_resources:
+                    yield create_unlisted_evaluation(resource_id, ordering_timestamp, event.log_group_filters)
+            
+            print(f"Found {len(previously_evaluated)} previously evaluated resources")
+                        
+    except Exception as e:
+        # If we can't get previous evaluations, just continue with current resources
+        print(f"Could not retrieve previous evaluations: {e}")
 
 
-def evaluate_single_log_group(configuration_item, required_retention_days):
-    """Evaluate a single log group from configuration change"""
+def load_previous_resource_ids(event):
+    """
+    Collect the rule's previously evaluated resource IDs from Config.
+    
+    Like iter_deleted_log_group_evaluations, a failed scan keeps what was read so far
+    instead of failing the sweep.
+    """
+    event = EvaluationContext.from_event(event)
+    previously_evaluated = set()
+    if not event.config_rule_name:
+        return previously_evaluated
+    with METRICS.timer('Reconciliation'):
+        try:
+            previously_evaluated.update(iter_previous_resource_ids(event))
+        except Exception as e:
+            print(f"Could not retrieve previous evaluations: {e}")
+    print(f"Found {len(previously_evaluated)} previously evaluated resources")
+    return previously_evaluated
+
+
+def evaluate_single_log_group(configuration_item, required_retention_days, filters=None, policy=None,
+                              maximum_retention_days=None):
+    """Evaluate a single log group from configuration change, under the retention policy if given"""
     log_group_name = configuration_item['resourceId']
     
+    log_group_class = (configuration_item.get('configuration') or {}).get('logGroupClass')
+    if filters is not None and not filters.matches(log_group_name, log_group_class):
+        return create_excluded_evaluation(log_group_name, configuration_item['configurationItemCaptureTime'])
+    
     # Check if resource was deleted or is out of scope
     config_item_status = configuration_item.get('configurationItemStatus', 'OK')
     event_left_scope = configuration_item.get('eventLeftScope', False)
@@ -180,16 +1302,169 @@ def evaluate_single_log_group(configuration_item, required_retention_days):
     
     log_group_config = configuration_item['configuration']
     current_retention = log_group_config.get('retentionInDays')
+    if policy:
+        required_retention_days, maximum_retention_days = policy.requirement(
+            log_group_name, configuration_item.get('tags'),
+            RetentionRequirement(required_retention_days, maximum_retention_days)
+        )
+    compliance_type = determine_compliance(current_retention, required_retention_days, maximum_retention_days)
+    excess_bytes = None
+    if compliance_type == 'NON_COMPLIANT' and maximum_retention_days is not None:
+        excess_bytes = estimate_excess_bytes(
+            current_retention, maximum_retention_days, log_group_config.get('storedBytes'),
+            log_group_config.get('creationTime')
+        )
     
     return {
         'ComplianceResourceType': configuration_item['resourceType'],
         'ComplianceResourceId': log_group_name,
-        'ComplianceType': determine_compliance(current_retention, required_retention_days),
-        'Annotation': create_annotation(log_group_name, current_retention, required_retention_days),
+        'ComplianceType': compliance_type,
+        'Annotation': create_annotation(
+            log_group_name, current_retention, required_retention_days, maximum_retention_days, excess_bytes
+        ),
         'OrderingTimestamp': configuration_item['configurationItemCaptureTime']
     }
 
 
+class EvaluationRecord:
+    """
+    Compact evaluation of a listed log group.
+    
+    Holds only what the evaluation is built from; the Config evaluation dict and its
+    annotation text are created by to_evaluation() when the record's batch is submitted.
+    ordering_timestamp is shared by every record of a sweep, and the retention bounds by
+    every log group the same policy rule applies to. excess_bytes is set only for log
+    groups kept longer than their maximum.
+    """
+    __slots__ = ('resource_id', 'current_retention', 'compliance_type', 'required_retention_days', 'ordering_timestamp',
+                 'maximum_retention_days', 'excess_bytes')
+    
+    resource_type = 'AWS::Logs::LogGroup'
+    
+    def __init__(self, resource_id, current_retention, compliance_type, required_retention_days, ordering_timestamp,
+                 maximum_retention_days=None, excess_bytes=None):
+        self.resource_id = resource_id
+        self.current_retention = current_retention
+        self.compliance_type = compliance_type
+        self.required_retention_days = required_retention_days
+        self.ordering_timestamp = ordering_timestamp
+        self.maximum_retention_days = maximum_retention_days
+        self.excess_bytes = excess_bytes
+    
+    def to_evaluation(self):
+        """Build the put_evaluations entry for this record"""
+        return {
+            'ComplianceResourceType': self.resource_type,
+            'ComplianceResourceId': self.resource_id,
+            'ComplianceType': self.compliance_type,
+            'Annotation': create_annotation(
+                self.resource_id, self.current_retention, self.required_retention_days, self.maximum_retention_days,
+                self.excess_bytes
+            ),
+            'OrderingTimestamp': self.ordering_timestamp
+        }
+
+
+def materialize_evaluation(evaluation):
+    """Get the Config evaluation dict for an EvaluationRecord or an evaluation that already is one"""
+    if isinstance(evaluation, EvaluationRecord):
+        return evaluation.to_evaluation()
+    return evaluation
+
+
+def evaluation_resource_id(evaluation):
+    """ComplianceResourceId of an EvaluationRecord or evaluation dict"""
+    if isinstance(evaluation, EvaluationRecord):
+        return evaluation.resource_id
+    return evaluation['ComplianceResourceId']
+
+
+def evaluation_verdict(evaluation):
+    """
+    ComplianceType and Annotation of an EvaluationRecord or evaluation dict.
+    
+    The annotation names the retention bounds applied, so a verdict reached under other
+    rule parameters differs even when the compliance type does not.
+    """
+    evaluation = materialize_evaluation(evaluation)
+    return evaluation['ComplianceType'], evaluation.get('Annotation')
+
+
+def ordering_key(evaluation):
+    """
+    OrderingTimestamp of an EvaluationRecord or evaluation dict as a comparable datetime.
+    
+    Timestamps may be datetimes or ISO 8601 strings from Config or CloudTrail; naive
+    datetimes are taken as UTC.
+    """
+    if isinstance(evaluation, EvaluationRecord):
+        timestamp = evaluation.ordering_timestamp
+    else:
+        timestamp = evaluation['OrderingTimestamp']
+    if isinstance(timestamp, str):
+        timestamp = parse_timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+class EvaluationBuffer:
+    """
+    Evaluations waiting to be submitted, at most one per resource.
+    
+    When a resource is added again the evaluation with the newer OrderingTimestamp is
+    kept, or on a tie the one added last, so a log group recreated or changed twice is
+    submitted once in its latest state. Evaluations keep the position their resource was
+    first added at. With a submitted cache (a TTLCache such as SUBMITTED_EVALUATIONS), an
+    evaluation older than the one last submitted for its resource is dropped as well, and
+    so is one with the same timestamp and verdict. Config re-evaluates an unchanged
+    configuration item with its original capture time after a rule parameter change, so
+    a different verdict for the same timestamp is still submitted. Dropped evaluations are
+    counted as SupersededEvaluations.
+    """
+    
+    def __init__(self, submitted=None):
+        self.submitted = submitted
+        # resource ID -> (ordering key, evaluation)
+        self.entries = {}
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def __iter__(self):
+        return (evaluation for _, evaluation in self.entries.values())
+    
+    def add(self, evaluation):
+        """Add an evaluation; returns False when a newer one for its resource is already known"""
+        resource_id = evaluation_resource_id(evaluation)
+        key = ordering_key(evaluation)
+        buffered = self.entries.get(resource_id)
+        if buffered is not None:
+            METRICS.count('SupersededEvaluations')
+            if buffered[0] > key:
+                return False
+        elif self.submitted is not None:
+            submitted = self.submitted.get(resource_id)
+            if submitted is not None and (submitted[0] > key or submitted == (key, evaluation_verdict(evaluation))):
+                METRICS.count('SupersededEvaluations')
+                return False
+        self.entries[resource_id] = (key, evaluation)
+        return True
+    
+    def extend(self, evaluations):
+        """Add evaluations in order"""
+        for evaluation in evaluations:
+            self.add(evaluation)
+    
+    def record_submitted(self, failed_resource_ids=()):
+        """Remember the OrderingTimestamp and verdict of every buffered evaluation that was accepted"""
+        if self.submitted is None:
+            return
+        for resource_id, (key, evaluation) in self.entries.items():
+            if resource_id not in failed_resource_ids:
+                self.submitted.put(resource_id, (key, evaluation_verdict(evaluation)))
+
+
 def create_evaluation(resource_id, resource_type, current_retention, required_retention_days, event):
     """Create a Config evaluation for a log group"""
     return {
@@ -197,45 +1472,137 @@ def create_evaluation(resource_id, resource_type, current_retention, required_re
         'ComplianceResourceId': resource_id,
         'ComplianceType': determine_compliance(current_retention, required_retention_days),
         'Annotation': create_annotation(resource_id, current_retention, required_retention_days),
-        'OrderingTimestamp': json.loads(event['invokingEvent'])['notificationCreationTime']
+        'OrderingTimestamp': EvaluationContext.from_event(event).ordering_timestamp
     }
 
 
-def determine_compliance(current_retention, required_retention_days):
-    """Determine compliance status based on minimum retention values"""
+def determine_compliance(current_retention, required_retention_days, maximum_retention_days=None):
+    """Determine compliance status based on minimum and optional maximum retention values"""
     if current_retention is None:
         return 'NON_COMPLIANT'  # Infinite retention
     elif current_retention < required_retention_days:
         return 'NON_COMPLIANT'  # Below minimum retention period
+    elif maximum_retention_days is not None and current_retention > maximum_retention_days:
+        return 'NON_COMPLIANT'  # Above maximum retention period
     else:
         return 'COMPLIANT'      # Meets or exceeds minimum retention period
 
 
-def create_annotation(log_group_name, current_retention, required_retention_days):
-    """Create annotation message for the evaluation"""
-    if current_retention is None:
+def create_annotation(log_group_name, current_retention, required_retention_days, maximum_retention_days=None,
+                      excess_bytes=None):
+    """Create annotation message for the evaluation, with the estimated excess storage if known"""
+    excess = f" Estimated excess storage: {format_bytes(excess_bytes)}." if excess_bytes else ''
+    if current_retention is None and maximum_retention_days is not None:
+        return f"Log group '{log_group_name}' has infinite retention (null). Maximum allowed: {maximum_retention_days} days.{excess}"
+    elif current_retention is None:
         return f"Log group '{log_group_name}' has infinite retention (null). Minimum required: {required_retention_days} days."
     elif current_retention < required_retention_days:
         return f"Log group '{log_group_name}' has {current_retention} days retention. Minimum required: {required_retention_days} days."
+    elif maximum_retention_days is not None and current_retention > maximum_retention_days:
+        return f"Log group '{log_group_name}' has {current_retention} days retention. Maximum allowed: {maximum_retention_days} days.{excess}"
+    elif maximum_retention_days is not None:
+        return f"Log group '{log_group_name}' has {current_retention} days retention, within the required {required_retention_days} to {maximum_retention_days} days."
     else:
         return f"Log group '{log_group_name}' has {current_retention} days retention, meets minimum requirement of {required_retention_days} days."
 
 
+def estimate_excess_bytes(current_retention, maximum_retention_days, stored_bytes, creation_time=None, now_ms=None):
+    """
+    Estimate the stored bytes a log group holds beyond its maximum retention.
+    
+    Assumes steady ingestion, so storedBytes is spread evenly over the days of data held:
+    the retention period, or the log group's age when that is shorter or retention is
+    infinite. Returns None when storedBytes, or the age of a never-expiring log group,
+    is unknown.
+    """
+    if stored_bytes is None:
+        return None
+    held_days = current_retention
+    if creation_time is not None:
+        now_ms = time.time() * 1000 if now_ms is None else now_ms
+        age_days = max(now_ms - creation_time, 0) / 86400000
+        held_days = age_days if held_days is None else min(held_days, age_days)
+    if held_days is None:
+        return None
+    if held_days <= maximum_retention_days:
+        return 0
+    return int(stored_bytes * (1 - maximum_retention_days / held_days))
+
+
+def format_bytes(size):
+    """Format a byte count for an annotation, e.g. 1536 -> '1.5 KiB'"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def extract_configuration(configuration):
+    """
+    Read the evaluated fields from a configuration document without deserializing all of it.
+    
+    Oversized log group documents are mostly tags and subscriptions the rule never uses.
+    Returns {field: value} with retentionInDays always present; other fields only when set.
+    A field found more than once, such as a tag named logGroupClass, is read by parsing
+    the whole document instead.
+    """
+    if isinstance(configuration, str):
+        found = {}
+        for match in CONFIGURATION_FIELD_PATTERN.finditer(configuration):
+            field, value = (match.group(1), match.group(2)) if match.group(1) else (match.group(3), match.group(4))
+            if field in found:
+                return extract_configuration(json.loads(configuration))
+            found[field] = None if value == 'null' else int(value) if field in CONFIGURATION_NUMBER_FIELDS \
+                else value[1:-1]
+    else:
+        configuration = configuration if isinstance(configuration, dict) else {}
+        found = {field: configuration.get(field) for field in CONFIGURATION_NUMBER_FIELDS + CONFIGURATION_STRING_FIELDS}
+    extracted = {field: value for field, value in found.items() if value is not None}
+    extracted.setdefault('retentionInDays', None)
+    return extracted
+
+
+def extract_retention_in_days(configuration):
+    """Read retentionInDays from a configuration document without deserializing all of it"""
+    return extract_configuration(configuration)['retentionInDays']
+
+
 def get_configuration_item(invoking_event, config_client):
-    """Get configuration item from invoking event or API call"""
+    """
+    Get configuration item from invoking event or API call.
+    
+    Oversized items are fetched from the configuration history, reduced to the fields the
+    rule evaluates and cached by (resourceId, configurationItemCaptureTime), so repeated
+    notifications for the same item within the cache TTL make no API call.
+    """
     if invoking_event['messageType'] == 'OversizedConfigurationItemChangeNotification':
         # Get configuration item via API for oversized notifications
         configuration_item_summary = invoking_event['configurationItemSummary']
-        response = config_client.get_resource_config_history(
+        cache_key = (configuration_item_summary['resourceId'], configuration_item_summary['configurationItemCaptureTime'])
+        config_item = CONFIGURATION_ITEM_CACHE.get(cache_key)
+        if config_item is not None:
+            return config_item
+        
+        response = call_with_retry(
+            config_client,
+            'get_resource_config_history',
             resourceType=configuration_item_summary['resourceType'],
             resourceId=configuration_item_summary['resourceId'],
             laterTime=configuration_item_summary['configurationItemCaptureTime'],
             limit=1
         )
         if response['configurationItems']:
-            config_item = response['configurationItems'][0]
-            # Convert API format to invoking event format
-            config_item['configuration'] = json.loads(config_item['configuration'])
+            history_item = response['configurationItems'][0]
+            # Convert API format to invoking event format, keeping only what is evaluated
+            config_item = {
+                'resourceType': history_item['resourceType'],
+                'resourceId': history_item['resourceId'],
+                'configurationItemStatus': history_item.get('configurationItemStatus', 'OK'),
+                'configurationItemCaptureTime': history_item['configurationItemCaptureTime'],
+                'configuration': extract_configuration(history_item.get('configuration')),
+                'tags': history_item.get('tags') or {}
+            }
+            CONFIGURATION_ITEM_CACHE.put(cache_key, config_item)
             return config_item
     else:
         # Standard configuration item in invoking event
@@ -244,26 +1611,423 @@ def get_configuration_item(invoking_event, config_client):
     return None
 
 
-def submit_evaluations(config_client, evaluations, event):
-    """Submit evaluations to AWS Config in batches"""
-    result_token = event['resultToken']
+def iter_prefetched(producers, concurrency, buffer_size):
+    """
+    Run generator functions in a thread pool and yield all their items in producer order.
     
-    # Config accepts maximum 100 evaluations per request
-    batch_size = 100
-    for i in range(0, len(evaluations), batch_size):
-        batch = evaluations[i:i + batch_size]
-        
-        # Convert datetime objects to strings for JSON serialization
-        for evaluation in batch:
-            if isinstance(evaluation['OrderingTimestamp'], datetime):
-                evaluation['OrderingTimestamp'] = evaluation['OrderingTimestamp'].isoformat()
-        
+    Up to concurrency producers run at once, each buffering at most buffer_size items
+    ahead of the consumer, so later producers are already fetching while earlier ones are
+    consumed. Producers inherit the caller's rate limit scope. Closing the generator stops
+    every producer at its next item; a producer's exception is raised at its turn.
+    """
+    scope = get_rate_limit_scope()
+    stop = threading.Event()
+    finished = object()
+    
+    def put(items, entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def run(producer, items):
         try:
-            config_client.put_evaluations(
+            with rate_limit_scope(scope):
+                for item in producer():
+                    if not put(items, (None, item)):
+                        return
+            put(items, (None, finished))
+        except Exception as e:
+            put(items, (e, None))
+    
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    queues = {}
+    
+    def start(index):
+        if index < len(producers):
+            queues[index] = queue.Queue(maxsize=buffer_size)
+            executor.submit(run, producers[index], queues[index])
+    
+    try:
+        for index in range(min(concurrency, len(producers))):
+            start(index)
+        for index in range(len(producers)):
+            items = queues.pop(index)
+            while True:
+                error, item = items.get()
+                if error is not None:
+                    raise error
+                if item is finished:
+                    break
+                yield item
+            start(index + concurrency)
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def iter_batches(items, batch_size):
+    """Yield lists of up to batch_size items from any iterable without materializing it"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def truncate_annotation(annotation, limit=MAX_ANNOTATION_LENGTH):
+    """
+    Shorten an annotation to Config's length limit by cutting out its middle.
+    
+    Annotations name the log group first and give the verdict last, so an overlong
+    log group name is cut rather than the retention and requirement that follow it.
+    """
+    if annotation is None or len(annotation) <= limit:
+        return annotation
+    tail = (limit - len(ANNOTATION_ELLIPSIS)) // 2
+    head = limit - len(ANNOTATION_ELLIPSIS) - tail
+    return annotation[:head] + ANNOTATION_ELLIPSIS + annotation[-tail:]
+
+
+def prepare_evaluation(evaluation):
+    """
+    Build the put_evaluations entry for an evaluation without changing the one given.
+    
+    The OrderingTimestamp is converted to a string for JSON serialization and the
+    annotation truncated to MAX_ANNOTATION_LENGTH.
+    """
+    if isinstance(evaluation, EvaluationRecord):
+        prepared = evaluation.to_evaluation()
+    else:
+        prepared = dict(evaluation)
+    if isinstance(prepared['OrderingTimestamp'], datetime):
+        prepared['OrderingTimestamp'] = prepared['OrderingTimestamp'].isoformat()
+    annotation = prepared.get('Annotation')
+    if annotation is not None and len(annotation) > MAX_ANNOTATION_LENGTH:
+        prepared['Annotation'] = truncate_annotation(annotation)
+    return prepared
+
+
+def evaluation_payload_bytes(evaluation):
+    """
+    Upper estimate of the JSON bytes a prepared evaluation adds to a put_evaluations request.
+    
+    String values needing no escaping, which is all of them for ASCII log group names,
+    are measured with one scan of their concatenation instead of being JSON-encoded.
+    """
+    values = [value for value in evaluation.values() if isinstance(value, str)]
+    text = ''.join(values)
+    if text.isascii() and text.isprintable() and '"' not in text and '\\' not in text:
+        return EVALUATION_PAYLOAD_OVERHEAD_BYTES + len(text) + 2 * len(values)
+    return EVALUATION_PAYLOAD_OVERHEAD_BYTES + sum(len(json.dumps(value)) for value in values)
+
+
+class EvaluationBatchBuilder:
+    """
+    Pack evaluations into as few put_evaluations requests as Config's limits allow.
+    
+    Evaluations are prepared as they are added, and the open batch is closed as soon as it
+    holds MAX_EVALUATIONS_PER_REQUEST evaluations or the next evaluation would take its
+    payload past max_bytes, so every request but the last is as full as it can be. Only
+    the open batch holds prepared evaluations, so memory stays bounded for any sweep.
+    """
+    
+    def __init__(self, result_token=None, max_bytes=MAX_EVALUATIONS_REQUEST_BYTES,
+                 max_count=MAX_EVALUATIONS_PER_REQUEST):
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.request_bytes = REQUEST_PAYLOAD_OVERHEAD_BYTES + len(result_token or '')
+        self.batch = []
+        self.batch_bytes = self.request_bytes
+    
+    def add(self, evaluation):
+        """Add one evaluation and return the batches it closed, usually none"""
+        evaluation = prepare_evaluation(evaluation)
+        size = evaluation_payload_bytes(evaluation)
+        closed = []
+        if self.batch and self.batch_bytes + size > self.max_bytes:
+            closed.append(self.flush())
+        self.batch.append(evaluation)
+        self.batch_bytes += size
+        if len(self.batch) >= self.max_count:
+            closed.append(self.flush())
+        return closed
+    
+    def extend(self, evaluations):
+        """Add evaluations and return the batches they closed"""
+        closed = []
+        for evaluation in evaluations:
+            closed += self.add(evaluation)
+        return closed
+    
+    def flush(self):
+        """Close the open batch and return it, empty when nothing was added since the last one"""
+        batch = self.batch
+        self.batch = []
+        self.batch_bytes = self.request_bytes
+        return batch
+
+
+def iter_prepared_batches(evaluations, result_token=None):
+    """
+    Yield put_evaluations-ready batches packed by EvaluationBatchBuilder.
+    
+    EvaluationRecords are materialized one batch at a time, so only the batch being
+    submitted holds full evaluation dicts and annotation strings.
+    """
+    builder = EvaluationBatchBuilder(result_token)
+    for evaluation in evaluations:
+        yield from builder.add(evaluation)
+    batch = builder.flush()
+    if batch:
+        yield batch
+
+
+def get_submit_concurrency():
+    """Get the number of concurrent put_evaluations requests from the environment"""
+    return max(1, int(os.environ.get('SUBMIT_CONCURRENCY', DEFAULT_SUBMIT_CONCURRENCY)))
+
+
+def put_evaluation_batch(config_client, batch, result_token, rejected=None):
+    """
+    Submit one prepared batch to Config and return the number of evaluations accepted.
+    
+    A batch Config rejects as invalid is split in half and each half submitted on its own,
+    down to the single evaluation at fault. That evaluation is logged and counted as
+    RejectedEvaluations and left out, so it does not fail the rest of the sweep with it.
+    Its resource ID is added to the rejected set, if given, so callers do not record it
+    as submitted. Evaluations Config accepts the request for but lists as
+    FailedEvaluations are logged, counted and added to the rejected set the same way.
+    """
+    try:
+        with METRICS.timer('SubmitBatch'):
+            response = call_with_retry(
+                config_client,
+                'put_evaluations',
                 Evaluations=batch,
                 ResultToken=result_token
             )
-            print(f"Submitted {len(batch)} evaluations to Config")
+    except botocore.exceptions.ClientError as e:
+        if not is_rejected_batch_error(e):
+            raise
+        if len(batch) == 1:
+            print(f"Config rejected the evaluation of {batch[0]['ComplianceResourceId']}: {e}")
+            METRICS.count('RejectedEvaluations')
+            if rejected is not None:
+                rejected.add(batch[0]['ComplianceResourceId'])
+            return 0
+        print(f"Config rejected a batch of {len(batch)} evaluations, submitting it in halves: {e}")
+        METRICS.count('SplitBatches')
+        middle = len(batch) // 2
+        return (put_evaluation_batch(config_client, batch[:middle], result_token, rejected)
+                + put_evaluation_batch(config_client, batch[middle:], result_token, rejected))
+    failed_resource_ids = {evaluation['ComplianceResourceId'] for evaluation in response.get('FailedEvaluations', [])}
+    if failed_resource_ids:
+        print(f"Config failed {len(failed_resource_ids)} evaluations: {sorted(failed_resource_ids)}")
+        METRICS.count('RejectedEvaluations', len(failed_resource_ids))
+        if rejected is not None:
+            rejected.update(failed_resource_ids)
+    accepted = [evaluation for evaluation in batch if evaluation['ComplianceResourceId'] not in failed_resource_ids]
+    for compliance_type, count in Counter(evaluation['ComplianceType'] for evaluation in accepted).items():
+        METRICS.count(metric_name(compliance_type, 'Evaluations'), count)
+    print(f"Submitted {len(accepted)} evaluations to Config")
+    return len(accepted)
+
+
+def submit_evaluations(config_client, evaluations, event, concurrency=None, rejected=None):
+    """
+    Submit evaluations to AWS Config in batches.
+    
+    Accepts any iterable, including a generator, and sends each batch as soon as it is full.
+    With concurrency above 1 batches are sent from a thread pool, keeping at most two batches
+    per worker queued so memory stays bounded. A failed batch does not stop the others; all
+    failures are raised together as an EvaluationSubmissionError once every batch has been tried.
+    Resource IDs of evaluations Config rejected as invalid are added to rejected, if given.
+    Returns the number of evaluations submitted.
+    """
+    result_token = EvaluationContext.from_event(event).result_token
+    if concurrency is None:
+        concurrency = get_submit_concurrency()
+    
+    submitted_count = 0
+    batch_count = 0
+    errors = []
+    failed_resource_ids = set()
+    
+    def put_batch(batch):
+        return put_evaluation_batch(config_client, batch, result_token, rejected)
+    
+    def failed(batch_number, batch, error):
+        print(f"Error submitting evaluations: {str(error)}")
+        errors.append((batch_number, error))
+        failed_resource_ids.update(evaluation['ComplianceResourceId'] for evaluation in batch)
+    
+    def collect(future, batch_number, batch):
+        nonlocal submitted_count
+        try:
+            submitted_count += future.result()
+        except Exception as e:
+            failed(batch_number, batch, e)
+    
+    if concurrency == 1:
+        for batch_count, batch in enumerate(iter_prepared_batches(evaluations, result_token), 1):
+            try:
+                submitted_count += put_batch(batch)
+            except Exception as e:
+                failed(batch_count, batch, e)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            pending = {}
+            for batch_count, batch in enumerate(iter_prepared_batches(evaluations, result_token), 1):
+                if len(pending) >= concurrency * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future, *pending.pop(future))
+                
+                pending[executor.submit(put_batch, batch)] = (batch_count, batch)
+            
+            for future in wait(pending).done:
+                collect(future, *pending[future])
+    
+    if errors:
+        raise EvaluationSubmissionError(
+            sorted(errors, key=lambda error: error[0]), batch_count, failed_resource_ids
+        )
+    
+    return submitted_count
+
+
+def get_evaluation_engine():
+    """Get the sweep engine from the environment: 'sync' (default) or 'async'"""
+    return os.environ.get('EVALUATION_ENGINE', 'sync').lower()
+
+
+def sweep_and_submit(config_client, logs_client, required_retention_days, event, rejected=None, **sweep_options):
+    """
+    Evaluate every log group of a sweep and submit the evaluations with the configured engine.
+    
+    sweep_options are passed on to iter_log_group_evaluations. Resource IDs of evaluations
+    Config rejected are added to rejected, if given. Returns the number of evaluations submitted.
+    """
+    if get_evaluation_engine() == 'async':
+        # Deferred so the default sync engine does not pay for importing asyncio on cold start
+        import asyncio
+        return asyncio.run(sweep_and_submit_async(
+            config_client, logs_client, required_retention_days, event, rejected=rejected, **sweep_options
+        ))
+    return submit_evaluations(
+        config_client,
+        iter_log_group_evaluations(logs_client, required_retention_days, event, **sweep_options),
+        event,
+        rejected=rejected
+    )
+
+
+async def sweep_and_submit_async(config_client, logs_client, required_retention_days, event,
+                                 progress=None, should_stop=None, rejected=None, **sweep_options):
+    """
+    Asyncio engine for a sweep that overlaps listing, reconciliation and submission.
+    
+    The blocking boto3 calls run in worker threads through asyncio.to_thread: one pulls
+    evaluations from the listing a batch at a time, one pages through the rule's previous
+    results in Config alongside it, and up to SUBMIT_CONCURRENCY submit finished batches.
+    Without a snapshot, deletions are the previous results left over once listing is done.
+    A sweep that may checkpoint (should_stop) scans Config only after listing completes.
+    Failed batches are raised together as an EvaluationSubmissionError, like submit_evaluations.
+    """
+    import asyncio
+    
+    event = EvaluationContext.from_event(event)
+    if progress is None:
+        progress = SweepProgress()
+    concurrency = get_submit_concurrency()
+    scope = get_rate_limit_scope()
+    
+    # Listing, the Config scan and every in-flight batch each hold one thread
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 2))
+    
+    def in_scope(function, *args):
+        with rate_limit_scope(scope):
+            return function(*args)
+    
+    def to_thread(function, *args):
+        return asyncio.to_thread(in_scope, function, *args)
+    
+    reconcile_from_config = sweep_options.get('previous_snapshot') is None
+    previous_task = None
+    if reconcile_from_config and should_stop is None:
+        previous_task = asyncio.create_task(to_thread(load_previous_resource_ids, event))
+    
+    slots = asyncio.Semaphore(concurrency)
+    pending = set()
+    errors = []
+    failed_resource_ids = set()
+    submitted_count = 0
+    batch_count = 0
+    builder = EvaluationBatchBuilder(event.result_token)
+    
+    async def put_batch(batch_number, batch):
+        nonlocal submitted_count
+        try:
+            count = await to_thread(put_evaluation_batch, config_client, batch, event.result_token, rejected)
+            submitted_count += count
         except Exception as e:
             print(f"Error submitting evaluations: {str(e)}")
-            raise e
\ No newline at end of file
+            errors.append((batch_number, e))
+            failed_resource_ids.update(evaluation['ComplianceResourceId'] for evaluation in batch)
+        finally:
+            slots.release()
+    
+    async def submit(batch):
+        nonlocal batch_count
+        batch_count += 1
+        await slots.acquire()
+        task = asyncio.create_task(put_batch(batch_count, batch))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    
+    evaluations = iter_log_group_evaluations(
+        logs_client, required_retention_days, event,
+        progress=progress, should_stop=should_stop, reconcile=not reconcile_from_config, **sweep_options
+    )
+    # A short read means listing is done; its records share a batch with the deletions
+    while True:
+        records = await to_thread(lambda: list(islice(evaluations, MAX_EVALUATIONS_PER_REQUEST)))
+        if len(records) < MAX_EVALUATIONS_PER_REQUEST:
+            break
+        for batch in await to_thread(builder.extend, records):
+            await submit(batch)
+    
+    for batch in builder.extend(records):
+        await submit(batch)
+    
+    if reconcile_from_config and progress.complete:
+        if previous_task is None:
+            previous_task = asyncio.create_task(to_thread(load_previous_resource_ids, event))
+        deletions = (
+            create_unlisted_evaluation(resource_id, event.ordering_timestamp, event.log_group_filters)
+            for resource_id in sorted(await previous_task - progress.evaluated_resources)
+            if event.shard is None or in_shard(resource_id, event.shard)
+        )
+        # Deletions go through the builder a request at a time, like the listing
+        for records in iter_batches(deletions, MAX_EVALUATIONS_PER_REQUEST):
+            for batch in builder.extend(records):
+                await submit(batch)
+    
+    batch = builder.flush()
+    if batch:
+        await submit(batch)
+    
+    if pending:
+        await asyncio.wait(list(pending))
+    if errors:
+        raise EvaluationSubmissionError(
+            sorted(errors, key=lambda error: error[0]), batch_count, failed_resource_ids
+        )
+    return submitted_count
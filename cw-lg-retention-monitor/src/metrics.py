@@ -0,0 +1,159 @@
+"""
+CloudWatch Embedded Metric Format (EMF) instrumentation.
+
+Stage timings and counters are accumulated in memory during an invocation and written
+out as EMF records when the invocation ends. Lambda sends stdout to CloudWatch Logs,
+which extracts the metrics from the records without any PutMetricData calls.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_METRICS_NAMESPACE = 'CWLogGroupRetentionMonitor'
+
+# EMF accepts at most 100 metrics per record and 100 values per metric
+MAX_METRICS_PER_RECORD = 100
+MAX_VALUES_PER_METRIC = 100
+
+
+class StdoutMetricsBackend:
+    """Write EMF records to stdout, where Lambda forwards them to CloudWatch Logs"""
+
+    def emit(self, record):
+        print(json.dumps(record))
+
+
+class NullMetricsBackend:
+    """Discard metrics (tests and local runs)"""
+
+    def emit(self, record):
+        pass
+
+
+def get_metrics_backend():
+    """Get the metrics backend configured by METRICS_BACKEND ('emf' or 'none')"""
+    if os.environ.get('METRICS_BACKEND', 'emf').lower() == 'none':
+        return NullMetricsBackend()
+    return StdoutMetricsBackend()
+
+
+class MetricsRecorder:
+    """
+    Thread-safe accumulator of counters and timing samples for one invocation.
+
+    Counters are summed into a single value. Timings keep every sample in milliseconds,
+    so percentiles are available in CloudWatch; flush() spreads samples over as many
+    records as the EMF limits require.
+    """
+
+    def __init__(self, backend=None, namespace=None):
+        self.backend = backend or get_metrics_backend()
+        self.namespace = namespace or os.environ.get('METRICS_NAMESPACE', DEFAULT_METRICS_NAMESPACE)
+        self.counters = {}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        """Add value to a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_time(self, name, seconds):
+        """Record one timing sample of a stage"""
+        with self.lock:
+            self.timings.setdefault(name, []).append(round(seconds * 1000, 3))
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block as one sample of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(name, time.perf_counter() - start)
+
+    def iter_timed(self, name, iterable, per_item=True):
+        """
+        Yield from iterable, timing only the work done producing each item.
+
+        Time the consumer spends between items is not counted, so a generator feeding
+        submit_evaluations is measured without the submissions. With per_item False the
+        production time of all items is recorded as a single sample.
+        """
+        iterator = iter(iterable)
+        total = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    total += time.perf_counter() - start
+                    break
+                elapsed = time.perf_counter() - start
+                if per_item:
+                    self.record_time(name, elapsed)
+                else:
+                    total += elapsed
+                yield item
+        finally:
+            if not per_item:
+                self.record_time(name, total)
+
+    def clear(self):
+        """Drop everything recorded so far"""
+        with self.lock:
+            self.counters.clear()
+            self.timings.clear()
+
+    def build_records(self, dimensions=None, properties=None):
+        """Build the EMF records for everything recorded so far"""
+        dimensions = dimensions or {}
+        with self.lock:
+            metrics = [(name, 'Count', [value]) for name, value in sorted(self.counters.items())]
+            metrics += [(name, 'Milliseconds', values) for name, values in sorted(self.timings.items())]
+
+        # Split samples into chunks of at most MAX_VALUES_PER_METRIC, one chunk per record
+        chunks = []
+        for name, unit, values in metrics:
+            for index, start in enumerate(range(0, len(values), MAX_VALUES_PER_METRIC)):
+                while len(chunks) <= index:
+                    chunks.append([])
+                chunks[index].append((name, unit, values[start:start + MAX_VALUES_PER_METRIC]))
+
+        records = []
+        timestamp = int(time.time() * 1000)
+        for chunk in chunks:
+            for start in range(0, len(chunk), MAX_METRICS_PER_RECORD):
+                part = chunk[start:start + MAX_METRICS_PER_RECORD]
+                record = {
+                    '_aws': {
+                        'Timestamp': timestamp,
+                        'CloudWatchMetrics': [{
+                            'Namespace': self.namespace,
+                            'Dimensions': [sorted(dimensions)],
+                            'Metrics': [{'Name': name, 'Unit': unit} for name, unit, _ in part]
+                        }]
+                    }
+                }
+                record.update(properties or {})
+                record.update(dimensions)
+                for name, _, values in part:
+                    record[name] = values[0] if len(values) == 1 else values
+                records.append(record)
+        return records
+
+    def flush(self, dimensions=None, properties=None):
+        """Emit everything recorded so far through the backend and start over"""
+        records = self.build_records(dimensions, properties)
+        self.clear()
+        for record in records:
+            self.backend.emit(record)
+        return records
+
+
+def metric_name(identifier, suffix):
+    """Metric name from a snake or upper case identifier, e.g. put_evaluations -> PutEvaluationsCalls"""
+    return ''.join(part.capitalize() for part in identifier.lower().split('_')) + suffix
@@ -0,0 +1,365 @@
+"""
+Organization sweep for the CloudWatch Log Group Retention Monitor.
+
+Evaluates log group retention across many accounts and regions from a single
+invocation instead of one rule deployment per account and region. Each member
+account is entered by assuming a role; every (account, region) pair is swept with
+the rule's own log group evaluation and the results are merged into one consolidated report.
+
+With a Config aggregator the whole organization is covered by one advanced query
+instead: no member role is assumed and no Logs API is called, since every log group
+the aggregator records is read, with its account and region, from the aggregator account.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+
+from metrics import metric_name
+from lambda_function import (
+    METRICS,
+    EvaluationContext,
+    EvaluationRecord,
+    build_log_group_query,
+    config_result_to_log_group,
+    create_log_group_record,
+    emit_invocation_metrics,
+    get_client,
+    get_client_config,
+    get_log_group_query_fields,
+    iter_advanced_query_pages,
+    iter_log_group_evaluations,
+)
+from retention_policy import RetentionRequirement
+from retry import RETRY_METRICS, call_with_retry, rate_limit_scope
+
+# Role assumed in every member account (read-only Logs and EC2 access is enough)
+DEFAULT_MEMBER_ROLE_NAME = 'cw-lg-retention-monitor-member'
+
+# (account, region) sweeps running at once across the whole organization
+DEFAULT_SWEEP_CONCURRENCY = 32
+
+# Sweeps running at once inside one account, which shares API quotas across its regions
+DEFAULT_ACCOUNT_CONCURRENCY = 4
+
+# Non-compliant log group names listed per region in the report; counts are always complete
+MAX_REPORTED_LOG_GROUPS = 1000
+
+
+class AccountSession:
+    """
+    Clients for one member account, built from credentials of an assumed role.
+
+    A boto3 Session is not thread-safe, and the regions of an account are swept from
+    several worker threads, so clients are created under a lock and reused per region.
+    """
+
+    def __init__(self, account_id, credentials):
+        self.account_id = account_id
+        self.session = boto3.Session(
+            aws_access_key_id=credentials['AccessKeyId'],
+            aws_secret_access_key=credentials['SecretAccessKey'],
+            aws_session_token=credentials['SessionToken']
+        )
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def client(self, service_name, region_name):
+        with self.lock:
+            client = self.clients.get((service_name, region_name))
+            if client is None:
+                client = self.session.client(service_name, region_name=region_name, config=get_client_config())
+                self.clients[(service_name, region_name)] = client
+            return client
+
+
+def get_member_role_arn(account_id, role_name, partition='aws'):
+    """Build the ARN of the role assumed in a member account"""
+    return f"arn:{partition}:iam::{account_id}:role/{role_name}"
+
+
+def assume_account_role(account_id, role_name, partition='aws', sts_client=None):
+    """Assume the member role in an account and return an AccountSession"""
+    sts_client = sts_client or get_client('sts')
+    response = call_with_retry(
+        sts_client,
+        'assume_role',
+        RoleArn=get_member_role_arn(account_id, role_name, partition),
+        RoleSessionName='cw-lg-retention-monitor'
+    )
+    return AccountSession(account_id, response['Credentials'])
+
+
+def list_organization_accounts(organizations_client=None):
+    """List the IDs of all active accounts in the organization"""
+    organizations_client = organizations_client or get_client('organizations')
+    account_ids = []
+    next_token = None
+    while True:
+        params = {'NextToken': next_token} if next_token else {}
+        response = call_with_retry(organizations_client, 'list_accounts', **params)
+        account_ids.extend(
+            account['Id'] for account in response.get('Accounts', []) if account.get('Status') == 'ACTIVE'
+        )
+        next_token = response.get('NextToken')
+        if not next_token:
+            return account_ids
+
+
+def list_enabled_regions(account_session, home_region):
+    """List the regions enabled in a member account"""
+    ec2_client = account_session.client('ec2', home_region)
+    response = call_with_retry(ec2_client, 'describe_regions', AllRegions=False)
+    return sorted(region['RegionName'] for region in response.get('Regions', []))
+
+
+def summarize_evaluations(evaluations):
+    """
+    Count evaluation records by compliance type and list the non-compliant log groups.
+
+    Reads the compact records directly, so no annotation text is built for the report.
+    Storage estimated to be kept beyond the maximum retention is summed as well.
+    """
+    summary = new_summary()
+    for record in evaluations:
+        if isinstance(record, EvaluationRecord):
+            add_to_summary(summary, record)
+    return summary
+
+
+def new_summary():
+    """Empty per-region summary"""
+    return {'log_groups': 0, 'COMPLIANT': 0, 'NON_COMPLIANT': 0, 'excess_stored_bytes': 0,
+            'non_compliant_log_groups': []}
+
+
+def add_to_summary(summary, record):
+    """Count one evaluation record into a per-region summary"""
+    summary['log_groups'] += 1
+    summary[record.compliance_type] += 1
+    summary['excess_stored_bytes'] += record.excess_bytes or 0
+    if record.compliance_type == 'NON_COMPLIANT' and len(summary['non_compliant_log_groups']) < MAX_REPORTED_LOG_GROUPS:
+        summary['non_compliant_log_groups'].append(record.resource_id)
+
+
+def quote_list(values):
+    """Quoted, comma-separated values for an advanced query IN condition"""
+    return ', '.join("'" + value.replace("'", "''") + "'" for value in values)
+
+
+def sweep_aggregator(aggregator_name, required_retention_days, event, account_ids=None, regions=None):
+    """
+    Evaluate every log group a Config aggregator records, as {account_id: {region: summary}}.
+
+    A single paginated advanced query reads each log group's account, region and retention,
+    narrowed to account_ids and regions when given. Filters and the retention policy apply
+    as in a member sweep, with tags read by the same query. Requested accounts without
+    log groups are reported with no regions.
+    """
+    event = EvaluationContext.from_event(event)
+    conditions = []
+    if account_ids:
+        conditions.append(f"accountId IN ({quote_list(account_ids)})")
+    if regions:
+        conditions.append(f"awsRegion IN ({quote_list(regions)})")
+    expression = build_log_group_query(['accountId', 'awsRegion'] + get_log_group_query_fields(event), conditions)
+
+    filters = event.log_group_filters
+    policy = event.retention_policy
+    requirement = default_requirement = RetentionRequirement(required_retention_days, event.maximum_retention_days)
+    now_ms = time.time() * 1000
+    results = {account_id: {} for account_id in account_ids or ()}
+    for page, _ in iter_advanced_query_pages(expression, aggregator_name=aggregator_name):
+        for result in page:
+            log_group = config_result_to_log_group(result)
+            log_group_name = log_group['logGroupName']
+            if not filters.matches(log_group_name, log_group.get('logGroupClass')):
+                continue
+            if policy:
+                requirement = policy.requirement(log_group_name, log_group.get('tags'), default_requirement)
+            record = create_log_group_record(log_group, requirement, event.ordering_timestamp, now_ms)
+            regions_result = results.setdefault(result['accountId'], {})
+            summary = regions_result.get(result['awsRegion'])
+            if summary is None:
+                summary = regions_result[result['awsRegion']] = new_summary()
+            add_to_summary(summary, record)
+    return results
+
+
+def sweep_account_region(account_session, region, required_retention_days, event):
+    """Evaluate every log group in one account and region"""
+    # Quotas are per account and region, so each pair gets its own rate limiters
+    with rate_limit_scope((account_session.account_id, region)):
+        logs_client = account_session.client('logs', region)
+        tagging_client = account_session.client('resourcegroupstaggingapi', region)
+        return summarize_evaluations(iter_log_group_evaluations(logs_client, required_retention_days, event,
+                                                                tagging_client=tagging_client))
+
+
+def build_report(results, required_retention_days, generated_at):
+    """Merge per-account, per-region results into one consolidated compliance report"""
+    report = {
+        'generated_at': generated_at,
+        'required_retention_days': required_retention_days,
+        'summary': {
+            'accounts': 0,
+            'regions_evaluated': 0,
+            'regions_failed': 0,
+            'log_groups': 0,
+            'COMPLIANT': 0,
+            'NON_COMPLIANT': 0,
+            'excess_stored_bytes': 0,
+        },
+        'accounts': {},
+    }
+    summary = report['summary']
+
+    for account_id in sorted(results):
+        account_result = results[account_id]
+        summary['accounts'] += 1
+        if 'error' in account_result:
+            report['accounts'][account_id] = account_result
+            continue
+
+        regions = {}
+        for region in sorted(account_result):
+            region_result = account_result[region]
+            regions[region] = region_result
+            if 'error' in region_result:
+                summary['regions_failed'] += 1
+                continue
+            summary['regions_evaluated'] += 1
+            for key in ('log_groups', 'COMPLIANT', 'NON_COMPLIANT', 'excess_stored_bytes'):
+                summary[key] += region_result.get(key, 0)
+        report['accounts'][account_id] = {'regions': regions}
+
+    return report
+
+
+def run_organization_sweep(account_ids, required_retention_days, role_name=DEFAULT_MEMBER_ROLE_NAME,
+                           regions=None, home_region='us-east-1', partition='aws',
+                           sweep_concurrency=DEFAULT_SWEEP_CONCURRENCY,
+                           account_concurrency=DEFAULT_ACCOUNT_CONCURRENCY, aggregator_name=None):
+    """
+    Sweep every account and region and return a consolidated compliance report.
+
+    Roles are assumed once per account, with accounts entered in parallel. Regions default
+    to those enabled in each account. Up to sweep_concurrency (account, region) sweeps run
+    at once, and never more than account_concurrency of them in the same account. Pairs are queued region by region
+    so concurrent workers are spread across accounts rather than waiting on one account's
+    limit. A failed account or region is recorded in the report without stopping the others.
+    With aggregator_name the report comes from sweep_aggregator instead, and account_ids
+    and regions only narrow it.
+    """
+    generated_at = datetime.now(timezone.utc).isoformat()
+    # Member sweeps only list and evaluate; there is no rule to reconcile deletions against.
+    # They list with each member's Logs client, whatever inventory source the rule uses.
+    event = EvaluationContext({
+        'invokingEvent': json.dumps({'notificationCreationTime': generated_at}),
+        'ruleParameters': json.dumps({'InventorySource': 'logs'})
+    })
+
+    if aggregator_name:
+        results = sweep_aggregator(aggregator_name, required_retention_days, event, account_ids, regions)
+        report = build_report(results, required_retention_days, generated_at)
+        print(f"Organization sweep summary from aggregator {aggregator_name}: {json.dumps(report['summary'])}")
+        return report
+
+    results = {}
+    sessions = {}
+    account_regions = {}
+
+    def enter(account_id):
+        try:
+            sessions[account_id] = assume_account_role(account_id, role_name, partition)
+            with rate_limit_scope((account_id, home_region)):
+                account_regions[account_id] = regions or list_enabled_regions(sessions[account_id], home_region)
+            results[account_id] = {}
+        except Exception as e:
+            print(f"Could not enter account {account_id}: {e}")
+            sessions.pop(account_id, None)
+            results[account_id] = {'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=max(1, sweep_concurrency)) as executor:
+        list(executor.map(enter, account_ids))
+
+        account_limits = {account_id: threading.BoundedSemaphore(account_concurrency) for account_id in sessions}
+
+        def sweep(account_id, region):
+            with account_limits[account_id]:
+                try:
+                    result = sweep_account_region(sessions[account_id], region, required_retention_days, event)
+                except Exception as e:
+                    print(f"Error sweeping {account_id}/{region}: {e}")
+                    result = {'error': str(e)}
+            results[account_id][region] = result
+
+        # Region-major order interleaves accounts in the work queue
+        work = []
+        for region_index in range(max((len(names) for names in account_regions.values()), default=0)):
+            for account_id in account_ids:
+                names = account_regions.get(account_id, ())
+                if region_index < len(names):
+                    work.append((account_id, names[region_index]))
+
+        for future in [executor.submit(sweep, account_id, region) for account_id, region in work]:
+            future.result()
+
+    report = build_report(results, required_retention_days, generated_at)
+    print(f"Organization sweep summary: {json.dumps(report['summary'])}")
+    return report
+
+
+def organization_handler(event, context):
+    """
+    Lambda handler for a scheduled organization sweep.
+
+    Accounts, regions and limits come from the event, falling back to environment
+    variables; without an account list every active account in the organization is swept.
+    The report is written to REPORT_BUCKET when set and returned either way.
+    """
+    RETRY_METRICS.clear()
+    METRICS.clear()
+    required_retention_days = int(event.get('MinimumRetentionDays', os.environ.get('REQUIRED_RETENTION_DAYS', '1')))
+    aggregator_name = event.get('aggregator_name', os.environ.get('CONFIGURATION_AGGREGATOR_NAME', ''))
+    # An aggregator already knows the organization's accounts
+    account_ids = event.get('accounts') or ([] if aggregator_name else list_organization_accounts())
+    regions = event.get('regions') or [
+        region for region in os.environ.get('ORGANIZATION_REGIONS', '').split(',') if region
+    ]
+
+    report = run_organization_sweep(
+        account_ids,
+        required_retention_days,
+        role_name=event.get('role_name', os.environ.get('MEMBER_ROLE_NAME', DEFAULT_MEMBER_ROLE_NAME)),
+        regions=regions or None,
+        home_region=os.environ.get('AWS_REGION', 'us-east-1'),
+        partition=event.get('partition', 'aws'),
+        sweep_concurrency=int(os.environ.get('ORGANIZATION_SWEEP_CONCURRENCY', DEFAULT_SWEEP_CONCURRENCY)),
+        account_concurrency=int(os.environ.get('ACCOUNT_CONCURRENCY', DEFAULT_ACCOUNT_CONCURRENCY)),
+        aggregator_name=aggregator_name or None
+    )
+
+    report_bucket = os.environ.get('REPORT_BUCKET')
+    if report_bucket:
+        key = f"{os.environ.get('REPORT_PREFIX', '')}organization-report-{report['generated_at']}.json"
+        call_with_retry(get_client('s3'), 'put_object', Bucket=report_bucket, Key=key,
+                        Body=json.dumps(report).encode('utf-8'), ContentType='application/json')
+        print(f"Wrote organization report to s3://{report_bucket}/{key}")
+
+    for compliance_type in ('COMPLIANT', 'NON_COMPLIANT'):
+        METRICS.count(metric_name(compliance_type, 'Evaluations'), report['summary'][compliance_type])
+    METRICS.count('RegionsFailed', report['summary']['regions_failed'])
+    emit_invocation_metrics({}, dimensions={'Sweep': 'organization'})
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Organization sweep completed',
+            'summary': report['summary']
+        })
+    }
@@ -0,0 +1,224 @@
+"""
+Per-log-group retention requirements from a policy of prefix, glob and tag rules.
+
+A policy is a JSON list of rules, checked in order; the first rule that matches a log
+group sets its minimum and maximum retention. Bounds a rule leaves out, and log groups
+no rule matches, keep the rule-wide defaults:
+
+    [
+        {"Prefix": "/aws/cloudtrail", "MinimumRetentionDays": 365},
+        {"Pattern": "/aws/lambda/dev-*", "MinimumRetentionDays": 7, "MaximumRetentionDays": 30},
+        {"Tags": {"retention-class": "audit"}, "MinimumRetentionDays": 2557}
+    ]
+
+Patterns are case-sensitive globs (*, ? and [...]) over the whole name. The policy is
+compiled once into a prefix trie holding the prefix rules and every pattern with a
+literal prefix, a trie of reversed suffixes for patterns that only start with a wildcard,
+one combined regex for patterns with wildcards at both ends, and an index of tag rules.
+A lookup walks the name from each end once, testing only the patterns anchored on the
+way, instead of testing every rule.
+"""
+import hashlib
+import json
+import re
+from collections import namedtuple
+from fnmatch import translate
+
+# Keys of a policy rule; a rule has exactly one matcher
+MATCHER_KEYS = ('Prefix', 'Pattern', 'Tags')
+RULE_KEYS = frozenset(MATCHER_KEYS + ('MinimumRetentionDays', 'MaximumRetentionDays'))
+
+# Characters that start and end a wildcard in a pattern; log group names contain neither [ nor ]
+GLOB_START = re.compile(r'[*?\[]')
+GLOB_END = re.compile(r'[*?\]]')
+
+# Minimum and maximum retention in days a log group is held to; maximum None is unbounded
+RetentionRequirement = namedtuple('RetentionRequirement', ['minimum', 'maximum'])
+
+
+class PrefixTrie:
+    """
+    Character trie of rule prefixes.
+
+    Each node keeps the lowest index of a prefix rule ending there, plus the pattern rules
+    whose literal prefix ends there as (index, compiled pattern) in rule order. Built
+    from reversed suffixes, the same trie anchors patterns on the end of the name.
+    """
+    __slots__ = ('children', 'prefix_rule', 'pattern_rules')
+
+    def __init__(self):
+        self.children = {}
+        self.prefix_rule = None
+        self.pattern_rules = []
+
+    def node(self, prefix):
+        """Get the node of prefix, creating it and its parents as needed"""
+        node = self
+        for character in prefix:
+            child = node.children.get(character)
+            if child is None:
+                child = node.children[character] = PrefixTrie()
+            node = child
+        return node
+
+    def first_match(self, key, limit, name=None):
+        """
+        Lowest rule index below limit among prefix rules and patterns on the path of key.
+
+        Patterns are tested against name, which defaults to key; pass the reversed name as
+        key to walk a suffix trie.
+        """
+        if name is None:
+            name = key
+        best = limit
+        node = self
+        position = 0
+        length = len(key)
+        while True:
+            if node.prefix_rule is not None and node.prefix_rule < best:
+                best = node.prefix_rule
+            for index, pattern in node.pattern_rules:
+                if index >= best:
+                    break
+                if pattern.match(name):
+                    best = index
+                    break
+            if position == length:
+                return best
+            node = node.children.get(key[position])
+            if node is None:
+                return best
+            position += 1
+
+
+class RetentionPolicy:
+    """
+    Compiled retention policy.
+
+    requirement(name, tags, default) is the RetentionRequirement of the first matching
+    rule, with anything the rule leaves out taken from default. An empty policy always
+    returns default without looking at the name.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = [validate_rule(rule, index) for index, rule in enumerate(rules)]
+        self.bounds = [
+            (rule.get('MinimumRetentionDays'), rule.get('MaximumRetentionDays')) for rule in self.rules
+        ]
+        self.fingerprint = hashlib.sha256(
+            json.dumps(self.rules, sort_keys=True).encode()
+        ).hexdigest()[:16] if self.rules else None
+
+        self.trie = PrefixTrie()
+        self.suffix_trie = PrefixTrie()
+        unanchored = []
+        # (key, value) of the first tag of each tag rule -> [(index, all required tags)]
+        self.tag_rules = {}
+        for index, rule in enumerate(self.rules):
+            if 'Prefix' in rule:
+                node = self.trie.node(rule['Prefix'])
+                if node.prefix_rule is None:
+                    node.prefix_rule = index
+            elif 'Pattern' in rule:
+                pattern = rule['Pattern']
+                literal_prefix = GLOB_START.split(pattern, 1)[0]
+                literal_suffix = GLOB_END.split(pattern)[-1]
+                if literal_prefix:
+                    self.trie.node(literal_prefix).pattern_rules.append((index, re.compile(translate(pattern))))
+                elif literal_suffix:
+                    self.suffix_trie.node(literal_suffix[::-1]).pattern_rules.append(
+                        (index, re.compile(translate(pattern)))
+                    )
+                else:
+                    unanchored.append((index, pattern))
+            else:
+                tags = rule['Tags']
+                anchor = next(iter(tags.items()))
+                self.tag_rules.setdefault(anchor, []).append((index, tags))
+
+        # Alternatives are tried in rule order, so lastgroup names the first matching rule
+        self.wildcard_pattern = re.compile('|'.join(
+            f'(?P<r{index}>{translate(pattern)})' for index, pattern in unanchored
+        )) if unanchored else None
+        # Every key a tag rule requires, since a rule matches only when all of its tags are present
+        self.tag_keys = frozenset(key for rule in self.rules if 'Tags' in rule for key in rule['Tags'])
+
+    @classmethod
+    def from_document(cls, document):
+        """Compile a policy from its JSON text; an empty document is an empty policy"""
+        if not document or not document.strip():
+            return cls()
+        try:
+            rules = json.loads(document)
+        except ValueError as e:
+            raise ValueError(f"Retention policy is not valid JSON: {e}")
+        if not isinstance(rules, list):
+            raise ValueError("Retention policy must be a JSON list of rules")
+        return cls(rules)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, name, tags=None):
+        """Index of the first rule matching a log group, or None"""
+        best = len(self.rules)
+        if tags and self.tag_rules:
+            for item in tags.items():
+                for index, required in self.tag_rules.get(item, ()):
+                    if index >= best:
+                        break
+                    if all(tags.get(key) == value for key, value in required.items()):
+                        best = index
+                        break
+        best = self.trie.first_match(name, best)
+        if self.suffix_trie.children:
+            best = self.suffix_trie.first_match(name[::-1], best, name)
+        if self.wildcard_pattern is not None:
+            match = self.wildcard_pattern.match(name)
+            if match is not None:
+                best = min(best, int(match.lastgroup[1:]))
+        return best if best < len(self.rules) else None
+
+    def requirement(self, name, tags, default):
+        """RetentionRequirement of a log group, filling in what its rule leaves out from default"""
+        if not self.rules:
+            return default
+        index = self.match(name, tags)
+        if index is None:
+            return default
+        minimum, maximum = self.bounds[index]
+        if minimum is None or maximum is None:
+            return RetentionRequirement(
+                default.minimum if minimum is None else minimum,
+                default.maximum if maximum is None else maximum
+            )
+        return RetentionRequirement(minimum, maximum)
+
+
+def validate_rule(rule, index):
+    """Check a policy rule and return it; raises ValueError describing the first problem"""
+    if not isinstance(rule, dict):
+        raise ValueError(f"Retention policy rule {index} is not an object")
+    unknown = set(rule) - RULE_KEYS
+    if unknown:
+        raise ValueError(f"Retention policy rule {index} has unknown keys: {', '.join(sorted(unknown))}")
+    matchers = [key for key in MATCHER_KEYS if key in rule]
+    if len(matchers) != 1:
+        raise ValueError(f"Retention policy rule {index} needs exactly one of {', '.join(MATCHER_KEYS)}")
+    matcher = matchers[0]
+    if matcher == 'Tags':
+        tags = rule['Tags']
+        if not isinstance(tags, dict) or not tags or not all(
+                isinstance(key, str) and isinstance(value, str) for key, value in tags.items()):
+            raise ValueError(f"Retention policy rule {index} Tags must map tag keys to string values")
+    elif not isinstance(rule[matcher], str) or not rule[matcher]:
+        raise ValueError(f"Retention policy rule {index} {matcher} must be a non-empty string")
+    for key in ('MinimumRetentionDays', 'MaximumRetentionDays'):
+        value = rule.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+            raise ValueError(f"Retention policy rule {index} {key} must be a positive number of days")
+    if 'MinimumRetentionDays' not in rule and 'MaximumRetentionDays' not in rule:
+        raise ValueError(f"Retention policy rule {index} sets neither MinimumRetentionDays nor MaximumRetentionDays")
+    if rule.get('MaximumRetentionDays', float('inf')) < rule.get('MinimumRetentionDays', 0):
+        raise ValueError(f"Retention policy rule {index} MaximumRetentionDays is below MinimumRetentionDays")
+    return rule
@@ -0,0 +1,216 @@
+"""
+Client-side rate limiting and retries for AWS API calls.
+
+Every call goes through a token bucket per API operation whose refill rate sits under
+the service quota, halves after a throttle and recovers on success. Throttled calls
+are retried with full-jitter exponential backoff; paginated listings resume from the
+last page token instead of starting over. Buckets and retry counters live at module
+scope so quota usage is tracked across warm invocations.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import botocore.exceptions
+
+# Error codes AWS returns when a call is throttled or exceeds its request quota
+THROTTLING_ERROR_CODES = frozenset([
+    'ThrottlingException',
+    'Throttling',
+    'LimitExceededException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'SlowDown',
+])
+
+# Client-side rate limits and retry budget per API. Rates sit under the default
+# service quotas so sweeps run at the highest sustained throughput without being
+# throttled; the limiter halves its rate after a throttle and recovers on success.
+API_RETRY_SETTINGS = {
+    'describe_log_groups': {'rate': 8.0, 'burst': 10, 'max_attempts': 8},
+    'put_evaluations': {'rate': 8.0, 'burst': 10, 'max_attempts': 8},
+    'get_compliance_details_by_config_rule': {'rate': 4.0, 'burst': 5, 'max_attempts': 8},
+    'get_resource_config_history': {'rate': 4.0, 'burst': 5, 'max_attempts': 5},
+    'assume_role': {'rate': 50.0, 'burst': 50, 'max_attempts': 5},
+    'get_resources': {'rate': 4.0, 'burst': 5, 'max_attempts': 8},
+    'select_resource_config': {'rate': 4.0, 'burst': 5, 'max_attempts': 8},
+    'select_aggregate_resource_config': {'rate': 4.0, 'burst': 5, 'max_attempts': 8},
+}
+DEFAULT_RETRY_SETTINGS = {'rate': 4.0, 'burst': 5, 'max_attempts': 5}
+
+# Full-jitter exponential backoff bounds for throttled calls
+BASE_BACKOFF_SECONDS = 0.2
+MAX_BACKOFF_SECONDS = 20.0
+
+
+class TokenBucket:
+    """Thread-safe token bucket that adapts its refill rate to throttling feedback"""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until it is available. Returns the seconds waited."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Reserve the token up front so concurrent callers queue behind each other
+            self.tokens -= 1
+            wait_seconds = max(0.0, -self.tokens / self.rate)
+        if wait_seconds:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+    def throttled(self):
+        """Halve the refill rate after the service throttled a request"""
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def succeeded(self):
+        """Recover the refill rate gradually after a successful request"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+# Rate limiters and retry metrics are kept at module scope so quota usage is tracked across warm invocations
+RATE_LIMITERS = {}
+RETRY_METRICS = {}
+_retry_lock = threading.Lock()
+_rate_limit_context = threading.local()
+
+
+@contextmanager
+def rate_limit_scope(scope):
+    """
+    Give the calls made by this thread their own rate limiters.
+    
+    Service quotas apply per account and region, so a sweep covering several of them
+    scopes each one (e.g. by (account_id, region)) instead of sharing a single bucket.
+    """
+    previous = getattr(_rate_limit_context, 'scope', None)
+    _rate_limit_context.scope = scope
+    try:
+        yield
+    finally:
+        _rate_limit_context.scope = previous
+
+
+def get_rate_limit_scope():
+    """Get the rate limit scope of the calling thread, None outside any rate_limit_scope"""
+    return getattr(_rate_limit_context, 'scope', None)
+
+
+def get_rate_limiter(operation):
+    """Get the shared token bucket for an API operation in the current rate limit scope"""
+    key = (get_rate_limit_scope(), operation)
+    with _retry_lock:
+        if key not in RATE_LIMITERS:
+            settings = API_RETRY_SETTINGS.get(operation, DEFAULT_RETRY_SETTINGS)
+            RATE_LIMITERS[key] = TokenBucket(settings['rate'], settings['burst'])
+        return RATE_LIMITERS[key]
+
+
+def record_retry_metrics(operation, calls=0, retries=0, throttle_seconds=0.0):
+    """Accumulate call, retry and throttle-time counters for an API operation"""
+    with _retry_lock:
+        metrics = RETRY_METRICS.setdefault(operation, {'calls': 0, 'retries': 0, 'throttle_seconds': 0.0})
+        metrics['calls'] += calls
+        metrics['retries'] += retries
+        metrics['throttle_seconds'] += throttle_seconds
+
+
+def get_retry_metrics():
+    """Copy the call, retry and throttle-time counters of every API operation"""
+    with _retry_lock:
+        return {operation: dict(metrics) for operation, metrics in RETRY_METRICS.items()}
+
+
+def is_throttling_error(error):
+    """Check whether a botocore ClientError is a throttling or quota error"""
+    return error.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff delay in seconds for a retry attempt"""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** (attempt - 1)))
+
+
+def call_with_retry(client, operation, **kwargs):
+    """
+    Call an AWS API under its client-side rate limit, retrying throttling errors.
+    
+    Throttled calls are retried with full-jitter exponential backoff up to the API's
+    max_attempts; any other error is raised immediately.
+    """
+    settings = API_RETRY_SETTINGS.get(operation, DEFAULT_RETRY_SETTINGS)
+    limiter = get_rate_limiter(operation)
+    
+    for attempt in range(1, settings['max_attempts'] + 1):
+        waited = limiter.acquire()
+        try:
+            response = getattr(client, operation)(**kwargs)
+        except botocore.exceptions.ClientError as e:
+            if not is_throttling_error(e) or attempt == settings['max_attempts']:
+                record_retry_metrics(operation, calls=1, throttle_seconds=waited)
+                raise
+            limiter.throttled()
+            backoff = backoff_delay(attempt)
+            print(f"{operation} throttled (attempt {attempt}), retrying in {backoff:.2f}s: {e}")
+            record_retry_metrics(operation, calls=1, retries=1, throttle_seconds=waited + backoff)
+            time.sleep(backoff)
+            continue
+        limiter.succeeded()
+        record_retry_metrics(operation, calls=1, throttle_seconds=waited)
+        return response
+
+
+def paginate_with_retry(client, operation, starting_token=None, **kwargs):
+    """
+    Yield pages from a boto3 paginator under the API's rate limit.
+    
+    A throttled page request is retried with backoff by restarting the paginator from
+    the last page token received, so pages already yielded are never fetched again.
+    Listing can also start part-way through from a saved starting_token.
+    """
+    settings = API_RETRY_SETTINGS.get(operation, DEFAULT_RETRY_SETTINGS)
+    limiter = get_rate_limiter(operation)
+    paginator = client.get_paginator(operation)
+    page_token = starting_token
+    attempt = 1
+    
+    while True:
+        if page_token:
+            pages = iter(paginator.paginate(PaginationConfig={'StartingToken': page_token}, **kwargs))
+        else:
+            pages = iter(paginator.paginate(**kwargs))
+        
+        while True:
+            waited = limiter.acquire()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            except botocore.exceptions.ClientError as e:
+                if not is_throttling_error(e) or attempt == settings['max_attempts']:
+                    record_retry_metrics(operation, calls=1, throttle_seconds=waited)
+                    raise
+                limiter.throttled()
+                backoff = backoff_delay(attempt)
+                print(f"{operation} throttled (attempt {attempt}), resuming in {backoff:.2f}s: {e}")
+                record_retry_metrics(operation, calls=1, retries=1, throttle_seconds=waited + backoff)
+                time.sleep(backoff)
+                attempt += 1
+                break
+            
+            attempt = 1
+            limiter.succeeded()
+            record_retry_metrics(operation, calls=1, throttle_seconds=waited)
+            page_token = page.get('nextToken') or page.get('NextToken')
+            yield page
@@ -0,0 +1,78 @@
+"""
+Stores for the JSON documents that carry sweep state between invocations.
+
+A store maps keys such as "<rule>/snapshot.json" to JSON documents with load, save and
+delete. S3StateStore keeps them in a bucket for deployed functions; FileStateStore keeps
+them in a local directory for tests and local runs. What goes into each document is up
+to the caller.
+"""
+import json
+import os
+
+import boto3
+import botocore.exceptions
+
+from retry import call_with_retry
+
+
+class FileStateStore:
+    """Sweep state store backed by JSON files in a local directory (tests and local runs)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def load(self, key):
+        """Load a JSON document, returning None if it does not exist"""
+        try:
+            with open(os.path.join(self.directory, key)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, document):
+        """Save a JSON document, replacing any previous version"""
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(document, f, separators=(',', ':'))
+
+    def delete(self, key):
+        """Delete a JSON document if it exists"""
+        try:
+            os.remove(os.path.join(self.directory, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3StateStore:
+    """Sweep state store backed by JSON objects in an S3 bucket"""
+
+    def __init__(self, bucket, prefix='', s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.s3_client = s3_client or boto3.client('s3')
+
+    def load(self, key):
+        """Load a JSON document, returning None if it does not exist"""
+        try:
+            response = call_with_retry(self.s3_client, 'get_object', Bucket=self.bucket, Key=self.prefix + key)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+        return json.loads(response['Body'].read())
+
+    def save(self, key, document):
+        """Save a JSON document, replacing any previous version"""
+        call_with_retry(
+            self.s3_client,
+            'put_object',
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=json.dumps(document, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def delete(self, key):
+        """Delete a JSON document if it exists"""
+        call_with_retry(self.s3_client, 'delete_object', Bucket=self.bucket, Key=self.prefix + key)
@@ -0,0 +1,319 @@
+"""
+End-to-end benchmark of lambda_handler against the in-process Logs and Config fakes.
+
+Runs a scheduled sweep over a synthetic account and reports throughput, peak memory
+and API calls. Throughput is measured in a run of its own, because tracemalloc slows
+allocation-heavy code down severalfold.
+
+Usage:
+    python tests/benchmark.py --log-groups 1000,10000,100000,500000
+    python tests/benchmark.py --log-groups 100000 --latency-ms 20 --throttle-rate 0.02 --submit-concurrency 4
+    python tests/benchmark.py --log-groups 20000 --latency-ms 10 --deleted 5000 --http --engine sync,async
+    python tests/benchmark.py --log-groups 100000 --policy-rules 1000
+    python tests/benchmark.py --log-groups 20000 --http --inventory logs,config
+    python tests/benchmark.py --log-groups 1000,10000 --startup
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from unittest.mock import patch
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIRECTORY)
+
+import lambda_function
+import retry
+from fake_aws import (
+    FakeConfigClient, FakeLogsClient, FakeTaggingClient, FaultInjector, SyntheticLogGroups, synthetic_policy
+)
+from http_stand_in import HttpStandIn
+from metrics import NullMetricsBackend
+
+BENCHMARK_EVENT = {
+    'invokingEvent': json.dumps({
+        'messageType': 'ScheduledNotification',
+        'notificationCreationTime': '2024-01-01T00:00:00.000Z',
+        'awsAccountId': '123456789012'
+    }),
+    'resultToken': 'benchmark-token',
+    'configRuleName': 'benchmark-rule',
+    'accountId': '123456789012'
+}
+
+# Client-side rate limits that never wait, so runs measure the code rather than the quotas
+UNLIMITED_RATE = {'rate': 1e9, 'burst': 1e9}
+
+
+def run_handler(log_groups, required_retention_days=30, latency_seconds=0.0, throttle_rate=0.0,
+                deleted_count=0, environment=None, client_rate_limits=False, trace_memory=False, seed=0,
+                http=False):
+    """
+    Invoke lambda_handler once for a scheduled sweep of log_groups and return its measurements.
+
+    With http set, the handler gets real boto3 clients talking to an HttpStandIn instead
+    of the fakes themselves.
+    """
+    faults = FaultInjector(latency_seconds, throttle_rate, seed)
+    clients = {
+        'logs': FakeLogsClient(log_groups, faults),
+        'config': FakeConfigClient(log_groups, deleted_count, faults=faults),
+        'resourcegroupstaggingapi': FakeTaggingClient(log_groups, faults)
+    }
+    with contextlib.ExitStack() as stack:
+        if http:
+            stand_in = stack.enter_context(
+                HttpStandIn(clients['logs'], clients['config'], clients['resourcegroupstaggingapi'])
+            )
+            create_client = stand_in.client
+        else:
+            create_client = lambda service_name, **kwargs: clients[service_name]
+        measurements = _run_handler(create_client, required_retention_days, environment, client_rate_limits,
+                                    trace_memory)
+        if http:
+            measurements['response_bytes'] = dict(stand_in.response_bytes)
+    measurements.update({
+        'api_calls': dict(faults.calls),
+        'throttles': dict(faults.throttles),
+        'peak_in_flight': dict(faults.peak_in_flight),
+        'overlaps': {operation: sorted(others) for operation, others in faults.overlaps.items()},
+        'submitted': dict(clients['config'].submitted)
+    })
+    return measurements
+
+
+def _run_handler(create_client, required_retention_days, environment, client_rate_limits, trace_memory):
+    for state in (lambda_function.CLIENT_CACHE, retry.RATE_LIMITERS, retry.RETRY_METRICS):
+        state.clear()
+
+    retry_settings = {} if client_rate_limits else {
+        operation: dict(settings, **UNLIMITED_RATE)
+        for operation, settings in retry.API_RETRY_SETTINGS.items()
+    }
+    variables = {'REQUIRED_RETENTION_DAYS': str(required_retention_days)}
+    variables.update(environment or {})
+
+    with open(os.devnull, 'w') as devnull, \
+         contextlib.redirect_stdout(devnull), \
+         patch.dict(os.environ, variables), \
+         patch.dict(retry.API_RETRY_SETTINGS, retry_settings), \
+         patch.dict(retry.DEFAULT_RETRY_SETTINGS, {} if client_rate_limits else UNLIMITED_RATE), \
+         patch.object(lambda_function.METRICS, 'backend', NullMetricsBackend()), \
+         patch('lambda_function.boto3.client', side_effect=create_client):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            response = lambda_function.lambda_handler(BENCHMARK_EVENT, {})
+            seconds = time.perf_counter() - start
+            peak_bytes = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+
+    lambda_function.CLIENT_CACHE.clear()
+    retry.RATE_LIMITERS.clear()
+    return {
+        'evaluations_count': json.loads(response['body'])['evaluations_count'],
+        'seconds': seconds,
+        'peak_bytes': peak_bytes,
+        'retries': sum(metrics['retries'] for metrics in retry.RETRY_METRICS.values())
+    }
+
+
+def run_benchmark(log_group_count, retention_distribution=None, trace_memory=True, seed=0, policy_rules=0,
+                  **kwargs):
+    """
+    Benchmark one scenario and return a report.
+
+    With policy_rules set, the sweep runs under a synthetic retention policy of that many
+    rules. Other keyword arguments are passed to run_handler (required_retention_days,
+    latency_seconds, throttle_rate, deleted_count, environment, client_rate_limits, http).
+    """
+    log_groups = SyntheticLogGroups(log_group_count, retention_distribution, seed=seed)
+    if policy_rules:
+        kwargs['environment'] = dict(kwargs.get('environment') or {}, RETENTION_POLICY=json.dumps(
+            synthetic_policy(log_groups, policy_rules, seed)
+        ))
+    timed = run_handler(log_groups, seed=seed, **kwargs)
+    report = {
+        'log_groups': log_group_count,
+        'evaluations_count': timed['evaluations_count'],
+        'seconds': round(timed['seconds'], 3),
+        'log_groups_per_second': round(log_group_count / timed['seconds']),
+        'peak_memory_mib': None,
+        'api_calls': timed['api_calls'],
+        'throttles': timed['throttles'],
+        'peak_in_flight': timed['peak_in_flight'],
+        'overlaps': timed['overlaps'],
+        'retries': timed['retries'],
+        'submitted': timed['submitted'],
+        'response_bytes': timed.get('response_bytes')
+    }
+    if trace_memory:
+        traced = run_handler(log_groups, seed=seed, trace_memory=True, **kwargs)
+        report['peak_memory_mib'] = round(traced['peak_bytes'] / 1048576, 2)
+    return report
+
+
+# Runs in a fresh interpreter: times importing the module plus the first invocation (cold)
+# and each later invocation in the same process (warm), and prints them as JSON with the
+# number of clients warm invocations created. The client-side rate limits are lifted so
+# warm invocations do not wait on tokens the first spent
+STARTUP_SCRIPT = """
+import contextlib, json, os, sys, time
+event = json.loads(sys.argv[1])
+reuse_clients = json.loads(sys.argv[4])
+timings = []
+created = []
+with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    start = time.perf_counter()
+    import lambda_function
+    import retry
+    rate = json.loads(sys.argv[3])
+    retry.DEFAULT_RETRY_SETTINGS.update(rate)
+    for settings in retry.API_RETRY_SETTINGS.values():
+        settings.update(rate)
+    create_client = lambda_function.boto3.client
+    def counting_client(service_name, **kwargs):
+        created.append(service_name)
+        return create_client(service_name, **kwargs)
+    lambda_function.boto3.client = counting_client
+    lambda_function.lambda_handler(dict(event), {})
+    timings.append(time.perf_counter() - start)
+    cold_clients = len(created)
+    for _ in range(int(sys.argv[2])):
+        if not reuse_clients:
+            lambda_function.CLIENT_CACHE.clear()
+        start = time.perf_counter()
+        lambda_function.lambda_handler(dict(event), {})
+        timings.append(time.perf_counter() - start)
+print(json.dumps({'timings': timings, 'warm_clients_created': len(created) - cold_clients}))
+"""
+
+
+def run_startup_benchmark(log_group_count, warm_invocations=5, environment=None, reuse_clients=True):
+    """
+    Time lambda_handler end to end on a cold container against warm invocations.
+
+    The handler runs in a fresh interpreter with real boto3 clients talking to an
+    HttpStandIn, so the cold invocation pays for importing the module and its
+    dependencies, creating clients and opening connections, as on a new Lambda container.
+    With reuse_clients False, CLIENT_CACHE is cleared before each warm invocation, so
+    the warm runs show what client reuse saves. Returns the cold invocation and the
+    median warm invocation in milliseconds, and the clients the warm invocations created.
+    """
+    log_groups = SyntheticLogGroups(log_group_count)
+    with HttpStandIn(FakeLogsClient(log_groups), FakeConfigClient(log_groups)) as stand_in:
+        variables = dict(
+            os.environ,
+            PYTHONPATH=SOURCE_DIRECTORY,
+            AWS_ENDPOINT_URL=stand_in.endpoint_url,
+            AWS_DEFAULT_REGION='us-east-1',
+            AWS_ACCESS_KEY_ID='stand-in',
+            AWS_SECRET_ACCESS_KEY='stand-in',
+            AWS_CONFIG_FILE=os.devnull,
+            AWS_SHARED_CREDENTIALS_FILE=os.devnull,
+            REQUIRED_RETENTION_DAYS='30'
+        )
+        variables.pop('AWS_PROFILE', None)
+        variables.update(environment or {})
+        result = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, json.dumps(BENCHMARK_EVENT), str(warm_invocations),
+             json.dumps(UNLIMITED_RATE), json.dumps(reuse_clients)],
+            env=variables, capture_output=True, text=True, check=True
+        )
+    measurements = json.loads(result.stdout)
+    timings = measurements['timings']
+    return {
+        'log_groups': log_group_count,
+        'cold_ms': round(timings[0] * 1000, 2),
+        'warm_ms': round(statistics.median(timings[1:]) * 1000, 2),
+        'warm_clients_created': measurements['warm_clients_created']
+    }
+
+def parse_distribution(value):
+    """Parse 'none=0.3,7=0.2,30=0.5' into a retention distribution"""
+    distribution = {}
+    for item in value.split(','):
+        retention, weight = item.split('=')
+        distribution[None if retention.lower() == 'none' else int(retention)] = float(weight)
+    return distribution
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark lambda_handler against synthetic Logs and Config services')
+    parser.add_argument('--log-groups', default='1000,10000,100000',
+                        help='comma-separated account sizes to benchmark')
+    parser.add_argument('--distribution', type=parse_distribution, default=None,
+                        help="retention distribution, e.g. 'none=0.3,7=0.2,30=0.5'")
+    parser.add_argument('--required-retention-days', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='latency added to every API call')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of API calls throttled')
+    parser.add_argument('--deleted', type=int, default=0, help='previously evaluated log groups that no longer exist')
+    parser.add_argument('--submit-concurrency', type=int, default=1)
+    parser.add_argument('--policy-rules', type=int, default=0, help='rules in a synthetic retention policy')
+    parser.add_argument('--engine', default='sync', help="comma-separated engines to compare: 'sync', 'async'")
+    parser.add_argument('--inventory', default='logs',
+                        help="comma-separated inventory sources to compare: 'logs', 'config'")
+    parser.add_argument('--http', action='store_true',
+                        help='serve the fakes over a local HTTP stand-in and use real boto3 clients')
+    parser.add_argument('--client-rate-limits', action='store_true',
+                        help='keep the client-side rate limits instead of disabling them')
+    parser.add_argument('--skip-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--startup', action='store_true',
+                        help='time cold against warm invocations in a fresh interpreter over the HTTP stand-in')
+    parser.add_argument('--json', action='store_true', help='print one JSON report per line')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        for count in (int(value) for value in args.log_groups.split(',')):
+            environment = {'SUBMIT_CONCURRENCY': str(args.submit_concurrency)}
+            report = run_startup_benchmark(count, environment=environment)
+            report['warm_new_clients_ms'] = run_startup_benchmark(
+                count, environment=environment, reuse_clients=False
+            )['warm_ms']
+            if args.json:
+                print(json.dumps(report))
+                continue
+            print(f"{report['log_groups']:>8} log groups: cold {report['cold_ms']:>9.2f}ms  "
+                  f"warm {report['warm_ms']:>9.2f}ms  warm with new clients {report['warm_new_clients_ms']:>9.2f}ms")
+        return
+
+    for count in (int(value) for value in args.log_groups.split(',')):
+        for engine, inventory in ((engine, inventory) for engine in args.engine.split(',')
+                                  for inventory in args.inventory.split(',')):
+            report = run_benchmark(
+                count,
+                retention_distribution=args.distribution,
+                trace_memory=not args.skip_memory,
+                required_retention_days=args.required_retention_days,
+                latency_seconds=args.latency_ms / 1000,
+                throttle_rate=args.throttle_rate,
+                deleted_count=args.deleted,
+                environment={'SUBMIT_CONCURRENCY': str(args.submit_concurrency), 'EVALUATION_ENGINE': engine,
+                             'INVENTORY_SOURCE': inventory},
+                client_rate_limits=args.client_rate_limits,
+                http=args.http,
+                policy_rules=args.policy_rules
+            )
+            report['engine'] = engine
+            report['inventory'] = inventory
+            if args.json:
+                print(json.dumps(report))
+                continue
+            print(f"{engine:>5} {inventory:>6} {report['log_groups']:>8} log groups: {report['seconds']:>8.2f}s "
+                  f"{report['log_groups_per_second']:>8}/s  peak {report['peak_memory_mib']} MiB  "
+                  f"calls {report['api_calls']}  throttles {report['throttles']}  retries {report['retries']}"
+                  + (f"  response bytes {report['response_bytes']}" if report['response_bytes'] else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""
+Shared fixtures for the test suite
+"""
+import sys
+import os
+import pytest
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import lambda_function
+import retry
+from metrics import NullMetricsBackend
+
+
+@pytest.fixture(autouse=True)
+def reset_module_state(monkeypatch):
+    """Reset module-level state shared across warm invocations"""
+    monkeypatch.setattr(lambda_function.METRICS, 'backend', NullMetricsBackend())
+    lambda_function.METRICS.clear()
+    retry.RATE_LIMITERS.clear()
+    retry.RETRY_METRICS.clear()
+    lambda_function.CLIENT_CACHE.clear()
+    lambda_function.CONFIGURATION_ITEM_CACHE.clear()
+    lambda_function.SUBMITTED_EVALUATIONS.clear()
+    yield
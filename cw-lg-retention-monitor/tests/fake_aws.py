@@ -0,0 +1,341 @@
+"""
+In-process stand-ins for CloudWatch Logs and AWS Config at realistic scale.
+
+Log groups are generated on demand from their index instead of being stored, so a
+500k log group account costs no memory beyond the page being served. The fakes
+enforce the request limits of the real APIs, count every call, and can inject
+latency and throttling errors.
+"""
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+
+from botocore.exceptions import ClientError
+
+# describe_log_groups, get_compliance_details_by_config_rule and get_resources page sizes
+LOGS_PAGE_SIZE = 50
+CONFIG_PAGE_SIZE = 100
+TAGGING_PAGE_SIZE = 100
+
+# Every TAGGED_EVERY-th log group carries a team tag, spread over TEAM_COUNT teams
+TAGGED_EVERY = 10
+TEAM_COUNT = 100
+
+# Name families the generated log groups are spread across, in sorted order
+DEFAULT_FAMILIES = ('/app/services', '/aws/apigateway', '/aws/ecs', '/aws/lambda', '/aws/rds')
+
+# Share of log groups per retention setting; None is never expire
+DEFAULT_RETENTION_DISTRIBUTION = {None: 0.3, 7: 0.15, 30: 0.25, 90: 0.1, 365: 0.2}
+
+
+class SyntheticLogGroups:
+    """
+    Sorted, read-only sequence of log group names generated from their index.
+
+    Retention is drawn from the distribution with a hash of the index, so the same
+    log group always has the same retention. Supports len() and indexing, so it can
+    be searched with bisect like the sorted listing the real API returns.
+    """
+
+    def __init__(self, count, retention_distribution=None, families=DEFAULT_FAMILIES, seed=0):
+        self.count = count
+        self.families = sorted(families)
+        self.seed = seed
+        distribution = retention_distribution or DEFAULT_RETENTION_DISTRIBUTION
+        total = float(sum(distribution.values()))
+        self.thresholds = []
+        cumulative = 0.0
+        for retention, weight in distribution.items():
+            cumulative += weight / total
+            self.thresholds.append((cumulative, retention))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self.name(index)
+
+    def name(self, index):
+        family = self.families[index * len(self.families) // self.count]
+        return f'{family}/group-{index:07d}'
+
+    def retention(self, index):
+        fraction = ((index + self.seed) * 2654435761 % 4294967296) / 4294967296
+        for threshold, retention in self.thresholds:
+            if fraction < threshold:
+                return retention
+        return self.thresholds[-1][1]
+
+    def log_group(self, index):
+        log_group = {
+            'logGroupName': self.name(index),
+            'creationTime': 1700000000000 + index,
+            'metricFilterCount': 0,
+            'arn': f'arn:aws:logs:us-east-1:123456789012:log-group:{self.name(index)}:*',
+            'storedBytes': (index % 1000) * 1048576,
+            'logGroupClass': 'STANDARD',
+            'logGroupArn': f'arn:aws:logs:us-east-1:123456789012:log-group:{self.name(index)}'
+        }
+        retention = self.retention(index)
+        if retention is not None:
+            log_group['retentionInDays'] = retention
+        return log_group
+
+    def tags(self, index):
+        """Tags of a log group; most log groups have none"""
+        if index % TAGGED_EVERY:
+            return {}
+        return {'team': f'team-{index // TAGGED_EVERY % TEAM_COUNT:03d}'}
+
+    def index_range(self, prefix=None):
+        """Indexes of the log groups whose names start with prefix"""
+        if not prefix:
+            return 0, self.count
+        return bisect_left(self, prefix), bisect_left(self, prefix + '\uffff')
+
+    def expected_compliance(self, required_retention_days):
+        """Count of COMPLIANT and NON_COMPLIANT log groups for a minimum retention"""
+        counts = {'COMPLIANT': 0, 'NON_COMPLIANT': 0}
+        for index in range(self.count):
+            retention = self.retention(index)
+            counts['COMPLIANT' if retention is not None and retention >= required_retention_days
+                   else 'NON_COMPLIANT'] += 1
+        return counts
+
+
+class FaultInjector:
+    """
+    Shared call counters plus injected latency and throttling for the fake services.
+
+    While a call waits out its latency it counts as in flight, so peak_in_flight records
+    the most concurrent calls per operation and overlaps the other operations each one
+    ran alongside.
+    """
+
+    def __init__(self, latency_seconds=0.0, throttle_rate=0.0, seed=0):
+        self.latency_seconds = latency_seconds
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.calls = {}
+        self.throttles = {}
+        self.in_flight = {}
+        self.peak_in_flight = {}
+        self.overlaps = {}
+        self.lock = threading.Lock()
+
+    def call(self, operation):
+        """Count a request and apply latency; raises a ThrottlingException for injected throttles"""
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            throttled = self.throttle_rate and self.random.random() < self.throttle_rate
+            if throttled:
+                self.throttles[operation] = self.throttles.get(operation, 0) + 1
+            self.in_flight[operation] = self.in_flight.get(operation, 0) + 1
+            self.peak_in_flight[operation] = max(self.peak_in_flight.get(operation, 0), self.in_flight[operation])
+            for other, count in self.in_flight.items():
+                if count and other != operation:
+                    self.overlaps.setdefault(operation, set()).add(other)
+                    self.overlaps.setdefault(other, set()).add(operation)
+        try:
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+        finally:
+            with self.lock:
+                self.in_flight[operation] -= 1
+        if throttled:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded'}},
+                              ''.join(part.capitalize() for part in operation.split('_')))
+
+
+class FakeLogsClient:
+    """CloudWatch Logs client serving a SyntheticLogGroups inventory"""
+
+    def __init__(self, log_groups, faults=None):
+        self.log_groups = log_groups
+        self.faults = faults or FaultInjector()
+
+    def describe_log_groups(self, logGroupNamePrefix=None, logGroupNamePattern=None, logGroupClass=None,
+                            limit=LOGS_PAGE_SIZE, nextToken=None):
+        if limit > LOGS_PAGE_SIZE or (logGroupNamePrefix and logGroupNamePattern):
+            raise ClientError({'Error': {'Code': 'InvalidParameterException', 'Message': 'Invalid parameter'}},
+                              'DescribeLogGroups')
+        self.faults.call('describe_log_groups')
+        start, end = self.log_groups.index_range(logGroupNamePrefix)
+        if nextToken:
+            start = int(nextToken)
+
+        # Scan at most limit matching log groups; a pattern scan may end on a partial page
+        log_groups = []
+        index = start
+        while index < end and len(log_groups) < limit:
+            log_group = self.log_groups.log_group(index)
+            index += 1
+            if logGroupNamePattern and logGroupNamePattern not in log_group['logGroupName']:
+                continue
+            if logGroupClass and log_group['logGroupClass'] != logGroupClass:
+                continue
+            log_groups.append(log_group)
+        response = {'logGroups': log_groups}
+        if index < end:
+            response['nextToken'] = str(index)
+        return response
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, PaginationConfig=None, **kwargs):
+                next_token = (PaginationConfig or {}).get('StartingToken')
+                while True:
+                    page = client.describe_log_groups(nextToken=next_token, **kwargs)
+                    yield page
+                    next_token = page.get('nextToken')
+                    if not next_token:
+                        return
+
+        return Paginator()
+
+
+class FakeTaggingClient:
+    """Resource Groups Tagging API client serving the tags of a SyntheticLogGroups inventory"""
+
+    def __init__(self, log_groups, faults=None):
+        self.log_groups = log_groups
+        self.faults = faults or FaultInjector()
+
+    def get_resources(self, ResourceTypeFilters=None, TagFilters=None, ResourcesPerPage=TAGGING_PAGE_SIZE,
+                      PaginationToken=None):
+        if ResourceTypeFilters != ['logs:log-group'] or ResourcesPerPage > TAGGING_PAGE_SIZE or len(TagFilters or []) > 50:
+            raise ClientError({'Error': {'Code': 'InvalidParameterException', 'Message': 'Invalid parameter'}},
+                              'GetResources')
+        self.faults.call('get_resources')
+        keys = {tag_filter['Key'] for tag_filter in TagFilters or []}
+        resources = []
+        index = int(PaginationToken) if PaginationToken else 0
+        while index < len(self.log_groups) and len(resources) < ResourcesPerPage:
+            tags = self.log_groups.tags(index)
+            # Tag filters are ANDed: a resource must carry every key
+            if tags and keys <= tags.keys():
+                resources.append({
+                    'ResourceARN': f'arn:aws:logs:us-east-1:123456789012:log-group:{self.log_groups.name(index)}',
+                    'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]
+                })
+            index += 1
+        return {'ResourceTagMappingList': resources,
+                'PaginationToken': str(index) if index < len(self.log_groups) else ''}
+
+
+def synthetic_policy(log_groups, rule_count, seed=0):
+    """
+    Retention policy of rule_count rules over a SyntheticLogGroups inventory.
+
+    Cycles through prefix rules, patterns anchored at the start, patterns anchored at the
+    end and team tag rules, so every matcher of the compiled policy is exercised.
+    """
+    generator = random.Random(seed)
+    rules = []
+    for index in range(rule_count):
+        family = generator.choice(log_groups.families)
+        number = generator.randrange(len(log_groups))
+        kind = index % 4
+        if kind == 0:
+            rules.append({'Prefix': f'{family}/group-{number:07d}'[:-2], 'MinimumRetentionDays': 90})
+        elif kind == 1:
+            rules.append({'Pattern': f'{family}/group-0{number % 10}*{number % 7}',
+                          'MinimumRetentionDays': 7, 'MaximumRetentionDays': 30})
+        elif kind == 2:
+            rules.append({'Pattern': f'*-{number:07d}', 'MinimumRetentionDays': 365})
+        else:
+            rules.append({'Tags': {'team': f'team-{number % TEAM_COUNT:03d}'}, 'MinimumRetentionDays': 14})
+    return rules
+
+
+class FakeConfigClient:
+    """
+    AWS Config client that validates and tallies put_evaluations requests.
+
+    Previous compliance results are the current log groups (when previously_evaluated
+    is set) followed by deleted_count log groups that no longer exist.
+    """
+
+    def __init__(self, log_groups, deleted_count=0, previously_evaluated=True, faults=None):
+        self.log_groups = log_groups
+        self.deleted_count = deleted_count
+        self.previous_count = (len(log_groups) if previously_evaluated else 0) + deleted_count
+        self.faults = faults or FaultInjector()
+        self.submitted = {}
+        self.lock = threading.Lock()
+
+    def previous_resource_id(self, index):
+        if index < self.previous_count - self.deleted_count:
+            return self.log_groups.name(index)
+        return f'/deleted/group-{index:07d}'
+
+    def put_evaluations(self, Evaluations, ResultToken, TestMode=False):
+        if not ResultToken or not 1 <= len(Evaluations) <= 100:
+            raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'batch'}},
+                              'PutEvaluations')
+        for evaluation in Evaluations:
+            if len(evaluation.get('Annotation', '')) > 256:
+                raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'annotation'}},
+                                  'PutEvaluations')
+        self.faults.call('put_evaluations')
+        with self.lock:
+            for evaluation in Evaluations:
+                compliance_type = evaluation['ComplianceType']
+                self.submitted[compliance_type] = self.submitted.get(compliance_type, 0) + 1
+        return {'FailedEvaluations': []}
+
+    def select_resource_config(self, Expression, Limit=CONFIG_PAGE_SIZE, NextToken=None):
+        """Advanced query over the recorded log groups; only the SELECT list of Expression is honoured"""
+        if Limit > CONFIG_PAGE_SIZE or "resourceType = 'AWS::Logs::LogGroup'" not in Expression:
+            raise ClientError({'Error': {'Code': 'InvalidExpressionException', 'Message': 'expression'}},
+                              'SelectResourceConfig')
+        self.faults.call('select_resource_config')
+        fields = Expression[len('SELECT '):Expression.index(' WHERE ')].split(', ')
+        start = int(NextToken) if NextToken else 0
+        end = min(len(self.log_groups), start + Limit)
+        response = {'Results': [json.dumps(self.select(index, fields)) for index in range(start, end)]}
+        if end < len(self.log_groups):
+            response['NextToken'] = str(end)
+        return response
+
+    def select_aggregate_resource_config(self, Expression, ConfigurationAggregatorName, Limit=CONFIG_PAGE_SIZE,
+                                         NextToken=None):
+        return self.select_resource_config(Expression, Limit, NextToken)
+
+    def select(self, index, fields):
+        """Advanced query result of a log group, with only the selected fields"""
+        log_group = self.log_groups.log_group(index)
+        result = {}
+        for field in fields:
+            if field == 'resourceId':
+                result['resourceId'] = log_group['logGroupName']
+            elif field == 'accountId':
+                result['accountId'] = '123456789012'
+            elif field == 'awsRegion':
+                result['awsRegion'] = 'us-east-1'
+            elif field == 'tags':
+                result['tags'] = [{'key': key, 'value': value} for key, value in self.log_groups.tags(index).items()]
+            elif field.startswith('configuration.') and field[len('configuration.'):] in log_group:
+                result.setdefault('configuration', {})[field[len('configuration.'):]] = log_group[field[len('configuration.'):]]
+        return result
+
+    def get_compliance_details_by_config_rule(self, ConfigRuleName, ComplianceTypes=None, NextToken=None,
+                                              Limit=CONFIG_PAGE_SIZE):
+        self.faults.call('get_compliance_details_by_config_rule')
+        start = int(NextToken) if NextToken else 0
+        end = min(self.previous_count, start + Limit)
+        response = {'EvaluationResults': [
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {
+                'ConfigRuleName': ConfigRuleName,
+                'ResourceType': 'AWS::Logs::LogGroup',
+                'ResourceId': self.previous_resource_id(index)
+            }}, 'ComplianceType': 'COMPLIANT'}
+            for index in range(start, end)
+        ]}
+        if end < self.previous_count:
+            response['NextToken'] = str(end)
+        return response
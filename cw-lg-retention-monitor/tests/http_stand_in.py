@@ -0,0 +1,106 @@
+"""
+Local HTTP stand-in for CloudWatch Logs and AWS Config.
+
+Serves the fakes in fake_aws over the AWS JSON 1.1 protocol, so real boto3 clients
+pointed at it with endpoint_url go through botocore's full request path: signing,
+serialization, the connection pool and retries. Use it to compare engines where the
+cost of an HTTP round trip matters; the in-process fakes skip that cost entirely.
+"""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3.session
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# X-Amz-Target prefixes of the JSON 1.1 services served
+TARGET_PREFIXES = {
+    'Logs_20140328': 'logs',
+    'StarlingDoveService': 'config',
+    'ResourceGroupsTaggingAPI_20170126': 'resourcegroupstaggingapi'
+}
+
+
+def snake_case(operation):
+    """Python method name of a service operation, e.g. DescribeLogGroups -> describe_log_groups"""
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', operation).lower()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; Nagle would hold the body for the peer's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        prefix, _, operation = self.headers.get('X-Amz-Target', '').partition('.')
+        service = self.server.services.get(TARGET_PREFIXES.get(prefix))
+        method = getattr(service, snake_case(operation), None)
+        if method is None:
+            self._respond(400, {'__type': 'UnknownOperationException', 'message': operation})
+            return
+        try:
+            self._respond(200, method(**json.loads(body or b'{}')), snake_case(operation))
+        except ClientError as e:
+            self._respond(400, {'__type': e.response['Error']['Code'], 'message': e.response['Error']['Message']})
+
+    def _respond(self, status, payload, operation=None):
+        body = json.dumps(payload).encode()
+        if operation:
+            with self.server.lock:
+                self.server.response_bytes[operation] = self.server.response_bytes.get(operation, 0) + len(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpStandIn:
+    """
+    Threaded HTTP server fronting a FakeLogsClient, a FakeConfigClient and optionally a
+    FakeTaggingClient.
+
+    Use as a context manager; client(service_name) returns a real boto3 client for
+    'logs', 'config' or 'resourcegroupstaggingapi' that talks to the server.
+    response_bytes counts the bytes of successful responses per operation.
+    """
+
+    def __init__(self, logs, config, tagging=None):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.services = {'logs': logs, 'config': config, 'resourcegroupstaggingapi': tagging}
+        # Response body bytes served per operation
+        self.server.response_bytes = {}
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        # A session of its own, so clients can still be created while boto3.client is patched
+        self.session = boto3.session.Session(
+            region_name='us-east-1', aws_access_key_id='stand-in', aws_secret_access_key='stand-in'
+        )
+
+    @property
+    def response_bytes(self):
+        return self.server.response_bytes
+
+    @property
+    def endpoint_url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def client(self, service_name, config=None, **kwargs):
+        config = Config(max_pool_connections=32).merge(config) if config else Config(max_pool_connections=32)
+        return self.session.client(service_name, endpoint_url=self.endpoint_url, config=config)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,319 @@
+"""
+End-to-end benchmarks of lambda_handler against synthetic Logs and Config services
+
+Accounts of 1k and 10k log groups run with the suite. Set BENCHMARK_LOG_GROUPS
+(e.g. 100000,500000) to benchmark larger accounts as well. Comparisons of wall-clock
+time depend on the machine, so they only run with BENCHMARK_TIMING set.
+"""
+import sys
+import os
+import json
+import time
+import pytest
+from fnmatch import fnmatchcase
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmark import run_benchmark, run_startup_benchmark
+from fake_aws import LOGS_PAGE_SIZE, TAGGED_EVERY, TAGGING_PAGE_SIZE, SyntheticLogGroups, synthetic_policy
+from retention_policy import RetentionPolicy
+
+LOG_GROUP_COUNTS = [1000, 10000] + [
+    int(count) for count in os.environ.get('BENCHMARK_LOG_GROUPS', '').split(',') if count
+]
+
+timing = pytest.mark.skipif(not os.environ.get('BENCHMARK_TIMING'), reason='set BENCHMARK_TIMING to compare timings')
+
+# Peak traced memory allowed per log group; the sweep keeps only names in memory, never evaluations
+MAX_BYTES_PER_LOG_GROUP = 400
+
+
+def pages(count, page_size):
+    return -(-count // page_size)
+
+
+class TestSyntheticLogGroups:
+    """Test the generated inventory"""
+
+    def test_names_sorted_and_prefix_ranges(self):
+        """Test that names sort like the real listing and prefixes select contiguous ranges"""
+        log_groups = SyntheticLogGroups(1000)
+        names = [log_groups.name(index) for index in range(len(log_groups))]
+
+        assert names == sorted(names)
+        start, end = log_groups.index_range('/aws/lambda')
+        assert names[start:end] == [name for name in names if name.startswith('/aws/lambda')]
+
+    def test_retention_distribution(self):
+        """Test that retention settings follow the requested distribution"""
+        log_groups = SyntheticLogGroups(10000, {None: 0.5, 30: 0.5})
+
+        assert abs(log_groups.expected_compliance(30)['NON_COMPLIANT'] - 5000) < 200
+
+
+class TestHandlerBenchmark:
+    """Benchmark scheduled sweeps end to end"""
+
+    @pytest.mark.parametrize('log_group_count', LOG_GROUP_COUNTS)
+    def test_scheduled_sweep(self, log_group_count):
+        """Report throughput, peak memory and API calls of a full sweep"""
+        report = run_benchmark(log_group_count, deleted_count=25)
+        print(f"\n{json.dumps(report)}")
+
+        expected = SyntheticLogGroups(log_group_count).expected_compliance(30)
+        assert report['submitted'] == dict(expected, NOT_APPLICABLE=25)
+        assert report['evaluations_count'] == log_group_count + 25
+        assert report['api_calls'] == {
+            'describe_log_groups': pages(log_group_count, LOGS_PAGE_SIZE),
+            'get_compliance_details_by_config_rule': pages(log_group_count + 25, 100),
+            'put_evaluations': pages(log_group_count + 25, 100)
+        }
+        assert report['peak_memory_mib'] * 1048576 < 1048576 + log_group_count * MAX_BYTES_PER_LOG_GROUP
+
+    def test_latency_and_throttling(self):
+        """Test that injected throttles are retried and every evaluation still arrives"""
+        report = run_benchmark(
+            2000, trace_memory=False, latency_seconds=0.001, throttle_rate=0.05,
+            environment={'SUBMIT_CONCURRENCY': '4'}
+        )
+        print(f"\n{json.dumps(report)}")
+
+        assert report['evaluations_count'] == 2000
+        assert sum(report['submitted'].values()) == 2000
+        assert report['retries'] == sum(report['throttles'].values())
+        assert report['api_calls']['put_evaluations'] == 20 + report['throttles'].get('put_evaluations', 0)
+
+    def test_snapshot_sweep(self, tmp_path):
+        """Test that a sweep with a state store reads previous results from its snapshot on the second run"""
+        environment = {'STATE_DIRECTORY': str(tmp_path)}
+        run_benchmark(5000, trace_memory=False, environment=environment)
+        report = run_benchmark(5000, environment=environment)
+        print(f"\n{json.dumps(report)}")
+
+        assert 'get_compliance_details_by_config_rule' not in report['api_calls']
+        assert report['evaluations_count'] == 5000
+
+    def test_include_prefixes_cut_listing(self):
+        """Benchmark listing only the included namespaces against listing everything"""
+        unfiltered = run_benchmark(20000, trace_memory=False)
+        filtered = run_benchmark(20000, trace_memory=False, environment={
+            'INCLUDE_LOG_GROUP_PREFIXES': '/aws/lambda/,/aws/ecs/', 'EXCLUDE_LOG_GROUP_PATTERNS': 'group-00120'
+        })
+        print(f"\nunfiltered {json.dumps(unfiltered)}\nfiltered {json.dumps(filtered)}")
+
+        assert filtered['api_calls']['describe_log_groups'] * 2 < unfiltered['api_calls']['describe_log_groups']
+        assert filtered['submitted']['COMPLIANT'] + filtered['submitted']['NON_COMPLIANT'] == 7900
+        # Previously evaluated log groups outside the new scope are reported as excluded
+        assert filtered['submitted']['NOT_APPLICABLE'] == 12100
+
+    def test_parallel_prefix_listing(self):
+        """Test that include prefixes are paged in parallel, bounded by LIST_CONCURRENCY"""
+        environment = {'INCLUDE_LOG_GROUP_PREFIXES': '/aws/lambda/,/aws/ecs/,/app/'}
+        sequential = run_benchmark(6000, trace_memory=False, latency_seconds=0.01,
+                                   environment=dict(environment, LIST_CONCURRENCY='1'))
+        parallel = run_benchmark(6000, trace_memory=False, latency_seconds=0.01,
+                                 environment=dict(environment, LIST_CONCURRENCY='4'))
+
+        assert parallel['submitted'] == sequential['submitted']
+        assert sequential['peak_in_flight']['describe_log_groups'] == 1
+        assert 1 < parallel['peak_in_flight']['describe_log_groups'] <= 3
+
+    @timing
+    def test_parallel_prefix_listing_time(self):
+        """Benchmark paging include prefixes in parallel against one at a time under API latency"""
+        environment = {'INCLUDE_LOG_GROUP_PREFIXES': '/aws/lambda/,/aws/ecs/,/app/'}
+        sequential = run_benchmark(6000, trace_memory=False, latency_seconds=0.01,
+                                   environment=dict(environment, LIST_CONCURRENCY='1'))
+        parallel = run_benchmark(6000, trace_memory=False, latency_seconds=0.01,
+                                 environment=dict(environment, LIST_CONCURRENCY='4'))
+        print(f"\nsequential {sequential['seconds']}s, parallel {parallel['seconds']}s")
+
+        assert parallel['seconds'] + 0.2 < sequential['seconds']
+
+    def test_async_engine_overlaps_config_scan(self):
+        """Test that the async engine scans previous results in Config while log groups are still listed"""
+        options = dict(trace_memory=False, latency_seconds=0.01, deleted_count=2000)
+        sync = run_benchmark(5000, environment={'EVALUATION_ENGINE': 'sync', 'SUBMIT_CONCURRENCY': '4'}, **options)
+        overlapped = run_benchmark(5000, environment={'EVALUATION_ENGINE': 'async', 'SUBMIT_CONCURRENCY': '4'},
+                                   **options)
+
+        assert overlapped['submitted'] == sync['submitted']
+        assert overlapped['evaluations_count'] == sync['evaluations_count'] == 7000
+        assert overlapped['api_calls'] == sync['api_calls']
+        assert 'get_compliance_details_by_config_rule' not in sync['overlaps'].get('describe_log_groups', [])
+        assert 'get_compliance_details_by_config_rule' in overlapped['overlaps']['describe_log_groups']
+
+    @timing
+    def test_async_engine_overlaps_config_scan_time(self):
+        """Benchmark the async engine against the sync one over HTTP when deletions need the Config scan"""
+        options = dict(trace_memory=False, latency_seconds=0.01, deleted_count=2000, http=True)
+        sync = run_benchmark(5000, environment={'EVALUATION_ENGINE': 'sync', 'SUBMIT_CONCURRENCY': '4'}, **options)
+        overlapped = run_benchmark(5000, environment={'EVALUATION_ENGINE': 'async', 'SUBMIT_CONCURRENCY': '4'},
+                                   **options)
+        print(f"\nsync {sync['seconds']}s, async {overlapped['seconds']}s")
+
+        assert overlapped['submitted'] == sync['submitted']
+        assert overlapped['seconds'] + 0.2 < sync['seconds']
+
+
+class TestHttpStandIn:
+    """Test sweeps through real boto3 clients against the local HTTP stand-in"""
+
+    @pytest.mark.parametrize('engine', ['sync', 'async'])
+    def test_matches_in_process_fakes(self, engine):
+        """Test that a sweep over HTTP submits what the in-process fakes see"""
+        environment = {'EVALUATION_ENGINE': engine, 'SUBMIT_CONCURRENCY': '4'}
+        in_process = run_benchmark(600, trace_memory=False, deleted_count=50, environment=environment)
+        over_http = run_benchmark(600, trace_memory=False, deleted_count=50, environment=environment, http=True)
+
+        assert over_http['submitted'] == in_process['submitted']
+        assert over_http['api_calls'] == in_process['api_calls']
+
+    def test_throttling_errors_retried(self):
+        """Test that injected throttles reach botocore as error responses and the sweep still completes"""
+        report = run_benchmark(600, trace_memory=False, throttle_rate=0.2, seed=3, http=True,
+                               environment={'EVALUATION_ENGINE': 'async'})
+
+        assert sum(report['throttles'].values()) > 0
+        assert report['evaluations_count'] == 600
+        assert sum(report['submitted'].values()) == 600
+
+
+
+class TestStartupBenchmark:
+    """Benchmark the handler on a cold container against warm invocations"""
+
+    def test_warm_invocations_reuse_clients(self):
+        """Test that warm invocations create no clients unless the client cache is cleared"""
+        reused = run_startup_benchmark(200, warm_invocations=2)
+        fresh = run_startup_benchmark(200, warm_invocations=2, reuse_clients=False)
+
+        assert reused['warm_clients_created'] == 0
+        assert fresh['warm_clients_created'] >= 2 * 2
+
+    @timing
+    def test_client_reuse_latency(self):
+        """Benchmark warm invocations reusing clients against warm invocations creating them again"""
+        reused = run_startup_benchmark(200)
+        fresh = run_startup_benchmark(200, reuse_clients=False)
+        print(f"\nreused {json.dumps(reused)}\nnew clients {json.dumps(fresh)}")
+
+        # Both pay for the handler alone; only the second creates clients and opens connections
+        assert reused['warm_ms'] < fresh['warm_ms']
+
+class TestConfigInventoryBenchmark:
+    """Benchmark sweeps listing log groups from Config advanced queries"""
+
+    def test_same_verdicts_smaller_pages(self):
+        """Test that the advanced query submits the same verdicts with a fraction of the listing payload"""
+        logs = run_benchmark(2000, trace_memory=False, http=True, environment={'INVENTORY_SOURCE': 'logs'})
+        config = run_benchmark(2000, trace_memory=False, http=True, environment={'INVENTORY_SOURCE': 'config'})
+
+        assert config['submitted'] == logs['submitted']
+        assert 'describe_log_groups' not in config['api_calls']
+        assert config['api_calls']['select_resource_config'] == pages(2000, 100)
+        listing_bytes = logs['response_bytes']['describe_log_groups']
+        query_bytes = config['response_bytes']['select_resource_config']
+        print(f"\nListing payload for 2000 log groups: describe_log_groups {listing_bytes} bytes, "
+              f"select_resource_config {query_bytes} bytes")
+        assert query_bytes * 3 < listing_bytes
+
+
+def scan_rules(rules, name, tags):
+    """Index of the first rule matching a log group, testing every rule in order, and the rules tested"""
+    for index, rule in enumerate(rules):
+        if ('Prefix' in rule and name.startswith(rule['Prefix'])
+                or 'Pattern' in rule and fnmatchcase(name, rule['Pattern'])
+                or 'Tags' in rule and all(tags.get(key) == value for key, value in rule['Tags'].items())):
+            return index, index + 1
+    return None, len(rules)
+
+
+def count_rule_tests(policy):
+    """Wrap the compiled matchers of policy so every pattern or tag rule tested is counted"""
+    counter = {'tests': 0}
+
+    class CountingPattern:
+        def __init__(self, pattern, rules=1):
+            self.pattern = pattern
+            self.rules = rules
+
+        def match(self, name):
+            counter['tests'] += self.rules
+            return self.pattern.match(name)
+
+    class CountingTags(dict):
+        def items(self):
+            counter['tests'] += 1
+            return super().items()
+
+    nodes = [policy.trie, policy.suffix_trie]
+    while nodes:
+        node = nodes.pop()
+        node.pattern_rules = [(index, CountingPattern(pattern)) for index, pattern in node.pattern_rules]
+        nodes.extend(node.children.values())
+    for anchor, candidates in policy.tag_rules.items():
+        policy.tag_rules[anchor] = [(index, CountingTags(required)) for index, required in candidates]
+    if policy.wildcard_pattern is not None:
+        # One combined regex tests every unanchored pattern
+        policy.wildcard_pattern = CountingPattern(policy.wildcard_pattern, policy.wildcard_pattern.groups)
+    return counter
+
+
+class TestPolicyBenchmark:
+    """Benchmark the compiled retention policy at 100k log groups and 1k rules"""
+
+    def test_compiled_lookup_tests_few_rules(self):
+        """Test that a compiled lookup tests a small fraction of the rules a scan in order tests"""
+        log_groups = SyntheticLogGroups(100000)
+        rules = synthetic_policy(log_groups, 1000)
+        policy = RetentionPolicy(rules)
+        counter = count_rule_tests(policy)
+
+        scanned = 0
+        sample = range(0, len(log_groups), 10)
+        for index in sample:
+            name, tags = log_groups.name(index), log_groups.tags(index)
+            expected, tested = scan_rules(rules, name, tags)
+            assert policy.match(name, tags) == expected
+            scanned += tested
+        print(f"\nrules tested per lookup: compiled {counter['tests'] / len(sample):.2f}, "
+              f"scan {scanned / len(sample):.1f}")
+
+        assert counter['tests'] * 10 < scanned
+
+    @timing
+    def test_compiled_lookup_beats_rule_scan(self):
+        """Benchmark policy lookups against testing every rule in order"""
+        log_groups = SyntheticLogGroups(100000)
+        rules = synthetic_policy(log_groups, 1000)
+        start = time.perf_counter()
+        policy = RetentionPolicy(rules)
+        compile_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matched = sum(
+            policy.match(log_groups.name(index), log_groups.tags(index)) is not None
+            for index in range(len(log_groups))
+        )
+        lookup_seconds = time.perf_counter() - start
+
+        sample = range(0, len(log_groups), 100)
+        start = time.perf_counter()
+        for index in sample:
+            scan_rules(rules, log_groups.name(index), log_groups.tags(index))
+        scan_seconds = (time.perf_counter() - start) * len(log_groups) / len(sample)
+        print(f"\ncompile {compile_seconds:.3f}s, 100k lookups {lookup_seconds:.2f}s, "
+              f"rule scan (extrapolated) {scan_seconds:.1f}s, {matched} matched")
+
+        assert matched > 0
+        assert lookup_seconds * 10 < scan_seconds
+
+    def test_handler_under_policy(self):
+        """Benchmark a sweep under a 1k rule policy, tag lookups included"""
+        report = run_benchmark(10000, trace_memory=False, policy_rules=1000)
+
+        assert sum(report['submitted'].values()) == 10000
+        # Only tagged log groups are returned; the last page may come back empty
+        assert report['api_calls']['get_resources'] <= pages(10000 // TAGGED_EVERY, TAGGING_PAGE_SIZE) + 1
@@ -0,0 +1,109 @@
+"""
+Unit tests for bulk columnar compliance evaluation
+"""
+import sys
+import os
+import random
+import pytest
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import bulk_evaluation
+from bulk_evaluation import evaluate_columns, evaluate_log_groups
+from fake_aws import SyntheticLogGroups
+from lambda_function import create_log_group_record
+from retention_policy import RetentionRequirement
+
+NOW_MS = 1700000000000.0
+DAY_MS = 86400000
+RETENTION_VALUES = [1, 3, 5, 7, 14, 30, 60, 90, 120, 180, 365, 400, 545, 731, 1827, 3653]
+
+
+@pytest.fixture(params=['python', 'numpy'])
+def backend(request, monkeypatch):
+    """Run a test with the NumPy pass when NumPy is installed, and always with the fallback"""
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(bulk_evaluation, 'numpy', None)
+    return request.param
+
+
+def random_snapshot(generator, count):
+    """Random log groups with per-row requirements, covering nulls and the edges between bounds"""
+    log_groups, requirements = [], []
+    for index in range(count):
+        minimum = generator.choice(RETENTION_VALUES)
+        maximum = generator.choice([None, minimum, generator.choice(RETENTION_VALUES) + minimum])
+        log_group = {'logGroupName': f'/app/group-{index}'}
+        retention = generator.choice([None, minimum, maximum or minimum, generator.choice(RETENTION_VALUES)])
+        if retention is not None:
+            log_group['retentionInDays'] = retention
+        if generator.random() < 0.9:
+            log_group['storedBytes'] = generator.choice([0, 1, generator.randrange(1 << 50)])
+        if generator.random() < 0.8:
+            age_days = generator.choice([0, generator.randrange(1, 5000), maximum or 1, generator.random() * 100])
+            log_group['creationTime'] = int(NOW_MS - age_days * DAY_MS)
+        log_groups.append(log_group)
+        requirements.append(RetentionRequirement(minimum, maximum))
+    return log_groups, requirements
+
+
+class TestBulkEvaluation:
+    """Test that columnar results match the scalar functions"""
+
+    @pytest.mark.parametrize('seed', range(20))
+    def test_matches_scalar_functions(self, backend, seed):
+        """Property: every verdict, excess estimate and annotation equals the scalar evaluation's"""
+        generator = random.Random(seed)
+        log_groups, requirements = random_snapshot(generator, 500)
+
+        result = evaluate_columns(
+            [log_group['logGroupName'] for log_group in log_groups],
+            [log_group.get('retentionInDays') for log_group in log_groups],
+            [requirement.minimum for requirement in requirements],
+            [requirement.maximum for requirement in requirements],
+            stored_bytes=[log_group.get('storedBytes') for log_group in log_groups],
+            creation_time=[log_group.get('creationTime') for log_group in log_groups],
+            now_ms=NOW_MS
+        )
+
+        records = [
+            create_log_group_record(log_group, requirement, None, NOW_MS)
+            for log_group, requirement in zip(log_groups, requirements)
+        ]
+        for row, record in enumerate(records):
+            assert result.compliance_type(row) == record.compliance_type, log_groups[row]
+            assert result.excess_bytes_at(row) == record.excess_bytes, log_groups[row]
+            assert result.annotation(row) == record.to_evaluation()['Annotation']
+        assert result.counts['NON_COMPLIANT'] == sum(record.compliance_type == 'NON_COMPLIANT' for record in records)
+        assert result.non_compliant_rows() == [
+            row for row, record in enumerate(records) if record.compliance_type == 'NON_COMPLIANT'
+        ]
+
+    def test_explicit_null_masks(self, backend):
+        """Test that null masks override the values they cover"""
+        result = evaluate_columns(
+            ['/a', '/b', '/c'], [30, 0, 400], 7, 365,
+            retention_null=[False, True, False], stored_bytes=[100, 100, 1000], stored_bytes_null=[False, False, True],
+            now_ms=NOW_MS
+        )
+
+        assert [result.compliance_type(row) for row in range(3)] == ['COMPLIANT', 'NON_COMPLIANT', 'NON_COMPLIANT']
+        assert result.current_retention(1) is None
+        assert result.excess_bytes_at(2) is None
+        assert result.counts == {'COMPLIANT': 1, 'NON_COMPLIANT': 2}
+
+    def test_annotations_only_for_requested_rows(self, backend, monkeypatch):
+        """Test that annotations are formatted only for the rows asked for"""
+        formatted = []
+        monkeypatch.setattr(bulk_evaluation, 'create_annotation', lambda *args: formatted.append(args[0]) or '')
+        log_groups = SyntheticLogGroups(1000)
+
+        result = evaluate_log_groups((log_groups.log_group(index) for index in range(1000)), 30, now_ms=NOW_MS)
+        result.annotations(result.non_compliant_rows()[:5])
+
+        assert result.counts == log_groups.expected_compliance(30)
+        assert len(formatted) == 5
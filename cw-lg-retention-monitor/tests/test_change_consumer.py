@@ -0,0 +1,333 @@
+"""
+Unit tests for the buffered change event batch consumer
+"""
+import sys
+import os
+import json
+import pytest
+from unittest.mock import Mock, patch
+from botocore.exceptions import ClientError
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import lambda_function
+from lambda_function import lambda_handler
+from state_store import FileStateStore
+from change_consumer import (
+    change_batch_handler,
+    configuration_item_from_api_call,
+)
+
+
+def config_change_event(name, retention, capture_time='2024-03-01T10:00:00.000Z', status='OK'):
+    """EventBridge event for a Config configuration item change of a log group"""
+    configuration = {'logGroupName': name}
+    if retention is not None:
+        configuration['retentionInDays'] = retention
+    return {
+        'version': '0',
+        'detail-type': 'Config Configuration Item Change',
+        'source': 'aws.config',
+        'detail': {
+            'messageType': 'ConfigurationItemChangeNotification',
+            'notificationCreationTime': capture_time,
+            'configurationItem': {
+                'resourceType': 'AWS::Logs::LogGroup',
+                'resourceId': name,
+                'configurationItemStatus': status,
+                'configurationItemCaptureTime': capture_time,
+                'configuration': configuration
+            }
+        }
+    }
+
+
+def api_call_event(event_name, name, retention=None, event_time='2024-03-01T10:00:00Z', error_code=None):
+    """EventBridge event for a CloudTrail-recorded CloudWatch Logs API call"""
+    parameters = {'logGroupName': name}
+    if retention is not None:
+        parameters['retentionInDays'] = retention
+    detail = {
+        'eventSource': 'logs.amazonaws.com',
+        'eventName': event_name,
+        'eventTime': event_time,
+        'requestParameters': parameters
+    }
+    if error_code:
+        detail['errorCode'] = error_code
+    return {'version': '0', 'detail-type': 'AWS API Call via CloudTrail', 'source': 'aws.logs', 'detail': detail}
+
+
+class LocalQueue:
+    """
+    SQS and event source mapping stand-in.
+
+    Messages are delivered to the consumer in batches of up to batch_size, the way the
+    Lambda SQS integration does, and batch item failures go back on the queue.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.messages = []
+        self.sent = 0
+        self.invocations = 0
+
+    def send(self, body):
+        self.sent += 1
+        self.messages.append({'messageId': f'msg-{self.sent}', 'body': json.dumps(body)})
+
+    def drain(self, handler, max_receives=3):
+        receives = {}
+        while self.messages:
+            batch, self.messages = self.messages[:self.batch_size], self.messages[self.batch_size:]
+            self.invocations += 1
+            response = handler({'Records': batch}, {})
+            failed = {failure['itemIdentifier'] for failure in response['batchItemFailures']}
+            for message in batch:
+                if message['messageId'] in failed:
+                    receives[message['messageId']] = receives.get(message['messageId'], 0) + 1
+                    if receives[message['messageId']] < max_receives:
+                        self.messages.append(message)
+
+
+class TestApiCallEvents:
+    """Test turning CloudTrail log group API calls into configuration items"""
+
+    def test_put_retention_policy(self):
+        """Test that a retention change carries the new retention"""
+        item = configuration_item_from_api_call(api_call_event('PutRetentionPolicy', '/app', 30)['detail'])
+
+        assert item['resourceId'] == '/app'
+        assert item['configuration']['retentionInDays'] == 30
+        assert item['configurationItemCaptureTime'] == '2024-03-01T10:00:00Z'
+
+    @pytest.mark.parametrize('event_name,expected', [
+        ('CreateLogGroup', 'NON_COMPLIANT'),
+        ('DeleteRetentionPolicy', 'NON_COMPLIANT'),
+        ('DeleteLogGroup', 'NOT_APPLICABLE'),
+    ])
+    def test_calls_without_retention(self, event_name, expected):
+        """Test that created and policy-less log groups have infinite retention and deleted ones are not applicable"""
+        item = configuration_item_from_api_call(api_call_event(event_name, '/app')['detail'])
+
+        assert lambda_function.evaluate_single_log_group(item, 7)['ComplianceType'] == expected
+
+    def test_failed_and_unrelated_calls_ignored(self):
+        """Test that rejected calls and calls that do not change retention produce nothing"""
+        assert configuration_item_from_api_call(
+            api_call_event('PutRetentionPolicy', '/app', 30, error_code='AccessDenied')['detail']
+        ) is None
+        assert configuration_item_from_api_call(api_call_event('TagLogGroup', '/app')['detail']) is None
+
+
+class TestChangeBatchConsumer:
+    """Test batched evaluation of buffered change events"""
+
+    def _consume(self, messages, config_client, tmp_path, token='saved-token', required_retention_days='30'):
+        if token:
+            FileStateStore(str(tmp_path)).save('test-rule/result_token.json', {'result_token': token})
+        records = [{'messageId': f'msg-{i}', 'body': json.dumps(message)} for i, message in enumerate(messages)]
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path), 'CONFIG_RULE_NAME': 'test-rule',
+                                     'REQUIRED_RETENTION_DAYS': required_retention_days}), \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            return change_batch_handler({'Records': records}, {})
+
+    def test_mixed_sources_submitted_together(self, tmp_path):
+        """Test Config changes and CloudTrail calls are evaluated and submitted in one request"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        messages = [
+            config_change_event('/a', 30),
+            config_change_event('/b', None),
+            api_call_event('PutRetentionPolicy', '/c', 7),
+            api_call_event('CreateLogGroup', '/d'),
+            api_call_event('TagLogGroup', '/e'),
+        ]
+
+        response = self._consume(messages, config_client, tmp_path)
+
+        assert response == {'batchItemFailures': []}
+        config_client.put_evaluations.assert_called_once()
+        call = config_client.put_evaluations.call_args[1]
+        assert call['ResultToken'] == 'saved-token'
+        assert {e['ComplianceResourceId']: e['ComplianceType'] for e in call['Evaluations']} == {
+            '/a': 'COMPLIANT', '/b': 'NON_COMPLIANT', '/c': 'NON_COMPLIANT', '/d': 'NON_COMPLIANT'
+        }
+
+    def test_forwarded_rule_event_token_preferred(self, tmp_path):
+        """Test a Config rule event in the batch supplies a newer token than the saved one"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        rule_event = {
+            'invokingEvent': json.dumps(config_change_event('/a', 30)['detail']),
+            'resultToken': 'fresh-token'
+        }
+
+        self._consume([config_change_event('/b', 30), rule_event], config_client, tmp_path)
+
+        assert config_client.put_evaluations.call_args[1]['ResultToken'] == 'fresh-token'
+        assert len(config_client.put_evaluations.call_args[1]['Evaluations']) == 2
+
+    def test_no_token_leaves_changes_to_sweep(self, tmp_path):
+        """Test nothing is submitted or redelivered before the rule has saved a token"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+
+        response = self._consume([config_change_event('/a', 30)], config_client, tmp_path, token=None)
+
+        assert response == {'batchItemFailures': []}
+        config_client.put_evaluations.assert_not_called()
+
+    def test_malformed_message_reported_alone(self, tmp_path):
+        """Test an unparseable message is returned as a batch item failure without blocking the rest"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        records = [config_change_event('/a', 30), {'detail-type': 'AWS API Call via CloudTrail', 'detail': {
+            'eventName': 'PutRetentionPolicy', 'requestParameters': {}
+        }}]
+
+        response = self._consume(records, config_client, tmp_path)
+
+        assert response == {'batchItemFailures': [{'itemIdentifier': 'msg-1'}]}
+        assert len(config_client.put_evaluations.call_args[1]['Evaluations']) == 1
+
+    def test_failed_batch_messages_redelivered(self, tmp_path):
+        """Test only the messages of a failed put_evaluations batch are reported as failures"""
+        config_client = Mock()
+        config_client.put_evaluations.side_effect = [
+            {'FailedEvaluations': []},
+            ClientError({'Error': {'Code': 'InternalFailure', 'Message': 'unavailable'}}, 'PutEvaluations'),
+            {'FailedEvaluations': []}
+        ]
+        messages = [config_change_event(f'/log{i}', 30) for i in range(250)]
+
+        response = self._consume(messages, config_client, tmp_path)
+
+        failed = [failure['itemIdentifier'] for failure in response['batchItemFailures']]
+        assert failed == [f'msg-{i}' for i in range(100, 200)]
+
+    def test_repeated_changes_submitted_once(self, tmp_path):
+        """Test a log group changed twice and reported by both sources is submitted once in its latest state"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        messages = [
+            api_call_event('CreateLogGroup', '/a', event_time='2024-03-01T10:00:00Z'),
+            config_change_event('/b', 7),
+            api_call_event('PutRetentionPolicy', '/a', 30, event_time='2024-03-01T10:00:05Z'),
+            config_change_event('/a', None, capture_time='2024-03-01T10:00:01.000Z'),
+        ]
+
+        response = self._consume(messages, config_client, tmp_path)
+
+        assert response == {'batchItemFailures': []}
+        evaluations = config_client.put_evaluations.call_args[1]['Evaluations']
+        assert [(e['ComplianceResourceId'], e['ComplianceType']) for e in evaluations] == [
+            ('/a', 'COMPLIANT'), ('/b', 'NON_COMPLIANT')
+        ]
+
+    def test_replaced_change_in_later_batch_dropped(self, tmp_path):
+        """Test a change older than one a previous batch submitted is not submitted again"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+
+        self._consume([config_change_event('/a', 30, capture_time='2024-03-01T10:05:00.000Z')], config_client, tmp_path)
+        self._consume([config_change_event('/a', 7, capture_time='2024-03-01T10:00:00.000Z'),
+                       config_change_event('/b', 7)], config_client, tmp_path)
+
+        assert config_client.put_evaluations.call_count == 2
+        assert [e['ComplianceResourceId'] for e in config_client.put_evaluations.call_args[1]['Evaluations']] == ['/b']
+
+    def test_redelivered_change_resubmitted_after_parameter_change(self, tmp_path):
+        """Test a change evaluated again under a new required retention is submitted with its new verdict"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        message = config_change_event('/a', 7)
+
+        self._consume([message], config_client, tmp_path, required_retention_days='1')
+        self._consume([message], config_client, tmp_path)
+        self._consume([message], config_client, tmp_path)
+
+        assert config_client.put_evaluations.call_count == 2
+        evaluations = config_client.put_evaluations.call_args[1]['Evaluations']
+        assert [e['ComplianceType'] for e in evaluations] == ['NON_COMPLIANT']
+
+    def test_failed_log_group_redelivers_all_its_messages(self, tmp_path):
+        """Test every message about a log group in a failed batch is reported, including superseded ones"""
+        config_client = Mock()
+        config_client.put_evaluations.side_effect = ClientError(
+            {'Error': {'Code': 'InternalFailure', 'Message': 'unavailable'}}, 'PutEvaluations'
+        )
+        messages = [
+            config_change_event('/a', 7, capture_time='2024-03-01T10:00:00.000Z'),
+            config_change_event('/a', 30, capture_time='2024-03-01T10:01:00.000Z'),
+        ]
+
+        response = self._consume(messages, config_client, tmp_path)
+
+        assert [failure['itemIdentifier'] for failure in response['batchItemFailures']] == ['msg-0', 'msg-1']
+        assert len(lambda_function.SUBMITTED_EVALUATIONS.entries) == 0
+
+    def test_rejected_change_not_recorded_as_submitted(self, tmp_path):
+        """Test a change Config rejected is submitted again when it is delivered again"""
+        def put_evaluations(Evaluations, ResultToken):
+            if any(evaluation['ComplianceResourceId'] == '/bad' for evaluation in Evaluations):
+                raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'bad'}},
+                                  'PutEvaluations')
+            return {'FailedEvaluations': []}
+
+        config_client = Mock()
+        config_client.put_evaluations.side_effect = put_evaluations
+        messages = [config_change_event('/bad', 30), config_change_event('/good', 30)]
+
+        self._consume(messages, config_client, tmp_path)
+
+        assert lambda_function.SUBMITTED_EVALUATIONS.get('/bad') is None
+        assert lambda_function.SUBMITTED_EVALUATIONS.get('/good') is not None
+
+    def test_rule_function_saves_token_for_consumer(self, tmp_path):
+        """Test that the rule function saves its result token when the change buffer is enabled"""
+        event = {
+            'invokingEvent': json.dumps({
+                'messageType': 'ScheduledNotification',
+                'notificationCreationTime': '2024-03-01T00:00:00Z'
+            }),
+            'resultToken': 'scheduled-token',
+            'configRuleName': 'test-rule'
+        }
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path), 'CHANGE_BUFFER': 'true',
+                                     'RECONCILIATION_INTERVAL_DAYS': '7'}), \
+             patch('lambda_function.boto3.client'):
+            FileStateStore(str(tmp_path)).save('test-rule/reconciliation.json',
+                                               {'completed_at': '2024-02-29T00:00:00Z'})
+            lambda_handler(event, {})
+
+        assert FileStateStore(str(tmp_path)).load('test-rule/result_token.json') == {
+            'result_token': 'scheduled-token', 'received_at': '2024-03-01T00:00:00Z'
+        }
+
+    @pytest.mark.parametrize('batch_size', [1, 10, 100, 1000])
+    def test_invocations_and_api_calls_per_1000_changes(self, tmp_path, batch_size):
+        """Benchmark invocations and API calls needed for 1,000 changes at different buffer batch sizes"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        queue = LocalQueue(batch_size)
+        for i in range(1000):
+            if i % 2:
+                queue.send(config_change_event(f'/aws/lambda/fn{i}', 30))
+            else:
+                queue.send(api_call_event('CreateLogGroup', f'/aws/lambda/fn{i}'))
+
+        FileStateStore(str(tmp_path)).save('test-rule/result_token.json', {'result_token': 'saved-token'})
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path), 'CONFIG_RULE_NAME': 'test-rule'}), \
+             patch('lambda_function.boto3.client', return_value=config_client), \
+             patch('lambda_function.time.sleep'):
+            queue.drain(change_batch_handler)
+
+        put_calls = config_client.put_evaluations.call_count
+        submitted = sum(len(call[1]['Evaluations']) for call in config_client.put_evaluations.call_args_list)
+        print(f"\nbatch size {batch_size}: {queue.invocations} invocations, "
+              f"{put_calls} put_evaluations calls per 1,000 changes (unbuffered: 1,000 and 1,000)")
+        assert submitted == 1000
+        assert queue.invocations == -(-1000 // batch_size)
+        assert put_calls == queue.invocations * -(-min(batch_size, 1000) // 100)
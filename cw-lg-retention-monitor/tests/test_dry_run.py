@@ -0,0 +1,200 @@
+"""
+Unit tests for the dry-run evaluation CLI
+"""
+import sys
+import os
+import csv
+import gzip
+import io
+import json
+import pytest
+from unittest.mock import patch
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import lambda_function
+import dry_run
+from fake_aws import FakeConfigClient, FakeLogsClient, SyntheticLogGroups
+from dry_run import (
+    build_event,
+    iter_dump_log_groups,
+    iter_json_array,
+    main,
+    run_dry_run,
+)
+from lambda_function import EvaluationContext
+
+LOG_GROUPS = [
+    {'logGroupName': '/aws/lambda/api', 'retentionInDays': 30, 'storedBytes': 1024},
+    {'logGroupName': '/aws/lambda/dev-worker', 'retentionInDays': 7},
+    {'logGroupName': '/aws/ecs/cluster', 'storedBytes': 4096},
+    {'logGroupName': '/app/audit', 'retentionInDays': 90, 'tags': {'retention-class': 'audit'}},
+]
+
+
+def context(**rule_parameters):
+    return EvaluationContext(build_event(rule_parameters))
+
+
+def read_jsonl(path):
+    with open(path) as output:
+        return [json.loads(line) for line in output]
+
+
+class TestDumpInput:
+    """Test reading saved describe_log_groups output"""
+
+    def test_cli_output_document(self, tmp_path):
+        """Test that the AWS CLI's {"logGroups": [...]} document is read"""
+        dump = tmp_path / 'log-groups.json'
+        dump.write_text(json.dumps({'logGroups': LOG_GROUPS}, indent=4))
+
+        assert list(iter_dump_log_groups(str(dump))) == LOG_GROUPS
+
+    def test_bare_list_and_gzip(self, tmp_path):
+        """Test that a top-level list is read, also when gzipped"""
+        dump = tmp_path / 'log-groups.json.gz'
+        with gzip.open(dump, 'wt') as output:
+            json.dump(LOG_GROUPS, output)
+
+        assert list(iter_dump_log_groups(str(dump))) == LOG_GROUPS
+
+    def test_json_lines_of_log_groups_and_pages(self, tmp_path):
+        """Test that JSON Lines may hold single log groups or whole pages"""
+        dump = tmp_path / 'log-groups.jsonl'
+        dump.write_text('\n'.join([
+            json.dumps({'logGroups': LOG_GROUPS[:2], 'nextToken': 'x'}),
+            '',
+            json.dumps(LOG_GROUPS[2]),
+            json.dumps(LOG_GROUPS[3]),
+        ]))
+
+        assert list(iter_dump_log_groups(str(dump))) == LOG_GROUPS
+
+    def test_elements_spanning_chunks(self):
+        """Test that log groups split across read chunks are decoded whole"""
+        log_groups = [{'logGroupName': f'/app/group-{index}', 'nested': {'key': '[x]'}} for index in range(500)]
+        document = json.dumps({'nextToken': None, 'logGroups': log_groups})
+
+        assert list(iter_json_array(io.StringIO(document), 'logGroups', chunk_size=7)) == log_groups
+
+    def test_invalid_dump_rejected(self):
+        """Test that a truncated or arrayless dump raises ValueError"""
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('{"logGroups": [{"logGroupName": "/a"}'), 'logGroups'))
+        with pytest.raises(ValueError, match='No "logGroups" array'):
+            list(iter_json_array(io.StringIO('{"other": []}'), 'logGroups'))
+
+
+class TestDryRun:
+    """Test evaluating and writing verdicts"""
+
+    @pytest.fixture
+    def dump(self, tmp_path):
+        path = tmp_path / 'log-groups.json'
+        path.write_text(json.dumps({'logGroups': LOG_GROUPS}))
+        return str(path)
+
+    def test_jsonl_output_matches_rule(self, tmp_path, dump):
+        """Test that verdicts and annotations are the ones the rule would submit"""
+        output = tmp_path / 'verdicts.jsonl'
+
+        counts = run_dry_run(context(MinimumRetentionDays=30), str(output), input_path=dump)
+
+        rows = read_jsonl(output)
+        assert [row['resource_id'] for row in rows] == [log_group['logGroupName'] for log_group in LOG_GROUPS]
+        assert [row['compliance_type'] for row in rows] == ['COMPLIANT', 'NON_COMPLIANT', 'NON_COMPLIANT', 'COMPLIANT']
+        for row, log_group in zip(rows, LOG_GROUPS):
+            retention = log_group.get('retentionInDays')
+            assert row['retention_in_days'] == retention
+            assert row['compliance_type'] == lambda_function.determine_compliance(retention, 30)
+            assert row['annotation'] == lambda_function.create_annotation(log_group['logGroupName'], retention, 30)
+        assert counts['COMPLIANT'] == 2 and counts['NON_COMPLIANT'] == 2
+        with open(output) as result:
+            assert result.read() == ''.join(json.dumps(row) + '\n' for row in rows)
+
+    def test_csv_output(self, tmp_path, dump):
+        """Test that CSV output has a header and empty cells for missing values"""
+        output = tmp_path / 'verdicts.csv'
+
+        run_dry_run(context(MinimumRetentionDays=30), str(output), input_path=dump)
+
+        with open(output, newline='') as result:
+            rows = list(csv.DictReader(result))
+        assert list(rows[0]) == list(dry_run.COLUMNS)
+        assert rows[2]['resource_id'] == '/aws/ecs/cluster'
+        assert rows[2]['retention_in_days'] == ''
+        assert rows[2]['maximum_retention_days'] == ''
+
+    def test_filters_policy_and_maximum(self, tmp_path, dump):
+        """Test that the rule's filters, retention policy with dump tags, and maximum apply"""
+        output = tmp_path / 'verdicts.jsonl'
+        policy = [
+            {'Pattern': '/aws/lambda/dev-*', 'MaximumRetentionDays': 3},
+            {'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 365},
+        ]
+
+        run_dry_run(context(MinimumRetentionDays=7, MaximumRetentionDays=60, ExcludeLogGroupPrefixes='/aws/ecs',
+                            RetentionPolicy=json.dumps(policy)), str(output), input_path=dump)
+
+        rows = {row['resource_id']: row for row in read_jsonl(output)}
+        assert '/aws/ecs/cluster' not in rows
+        assert rows['/aws/lambda/api']['compliance_type'] == 'COMPLIANT'
+        assert rows['/aws/lambda/dev-worker']['maximum_retention_days'] == 3
+        assert rows['/aws/lambda/dev-worker']['compliance_type'] == 'NON_COMPLIANT'
+        assert rows['/app/audit']['minimum_retention_days'] == 365
+        assert rows['/app/audit']['compliance_type'] == 'NON_COMPLIANT'
+
+    def test_account_listing_submits_nothing(self, tmp_path):
+        """Test that a live dry run lists log groups but never calls Config"""
+        log_groups = SyntheticLogGroups(1000)
+        config = FakeConfigClient(log_groups)
+        output = tmp_path / 'verdicts.jsonl'
+
+        with patch('lambda_function.boto3.client', return_value=config):
+            counts = run_dry_run(context(MinimumRetentionDays=30), str(output),
+                                 logs_client=FakeLogsClient(log_groups))
+
+        assert {key: counts[key] for key in ('COMPLIANT', 'NON_COMPLIANT')} == log_groups.expected_compliance(30)
+        assert len(read_jsonl(output)) == 1000
+        assert config.faults.calls == {}
+
+    def test_stdout_holds_only_rows(self, dump, capsys):
+        """Test that the rule's own messages go to stderr when writing to stdout"""
+        run_dry_run(context(MinimumRetentionDays=30), '-', input_path=dump)
+
+        lines = capsys.readouterr().out.splitlines()
+        assert len(lines) == len(LOG_GROUPS)
+        assert all(json.loads(line)['resource_id'] for line in lines)
+
+    def test_parquet_requires_pyarrow(self, tmp_path, dump, monkeypatch):
+        """Test that Parquet output without pyarrow fails with a clear message"""
+        monkeypatch.setattr(dry_run, 'pyarrow', None)
+
+        with pytest.raises(RuntimeError, match='pyarrow'):
+            run_dry_run(context(), str(tmp_path / 'verdicts.parquet'), input_path=dump)
+
+    def test_parquet_output(self, tmp_path, dump):
+        """Test that Parquet output holds every row in the output columns"""
+        pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+        output = tmp_path / 'verdicts.parquet'
+
+        run_dry_run(context(MinimumRetentionDays=30), str(output), input_path=dump)
+
+        table = pyarrow_parquet.read_table(output)
+        assert table.column_names == list(dry_run.COLUMNS)
+        assert table.column('resource_id').to_pylist() == [log_group['logGroupName'] for log_group in LOG_GROUPS]
+
+    def test_cli_arguments(self, tmp_path, dump, capsys):
+        """Test that flags override the rule parameters and a summary goes to stderr"""
+        output = tmp_path / 'verdicts.csv'
+
+        main(['--input', dump, '--output', str(output), '--rule-parameters', '{"MinimumRetentionDays": "365"}',
+              '--minimum-retention-days', '7'])
+
+        with open(output, newline='') as result:
+            rows = list(csv.DictReader(result))
+        assert {row['minimum_retention_days'] for row in rows} == {'7'}
+        assert 'Evaluated 4 log groups' in capsys.readouterr().err
@@ -3,24 +3,45 @@ Unit tests for CloudWatch Log Group Retention Monitor Lambda function
 """
 import sys
 import os
+import subprocess
 import json
+import threading
+import time
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
+from botocore.exceptions import ClientError
 
 # Add src directory to Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+import lambda_function
+import retry
 from lambda_function import (
     determine_compliance,
     create_annotation,
     create_evaluation,
     evaluate_single_log_group,
     evaluate_all_log_groups,
+    iter_log_group_evaluations,
+    iter_batches,
+    iter_prepared_batches,
+    truncate_annotation,
+    evaluation_payload_bytes,
+    EvaluationBatchBuilder,
+    EvaluationBuffer,
     get_configuration_item,
     submit_evaluations,
+    EvaluationSubmissionError,
+    EvaluationRecord,
+    EvaluationContext,
+    run_scheduled_sweep,
+    build_shard_units,
+    build_shards,
+    in_shard,
     lambda_handler
 )
+from state_store import FileStateStore, S3StateStore
 
 
 class TestComplianceLogic:
@@ -56,6 +77,13 @@ class TestComplianceLogic:
         
         # Large values
         assert determine_compliance(3653, 1) == 'COMPLIANT'
+    
+    def test_determine_compliance_maximum(self):
+        """Test that retention above an optional maximum is NON_COMPLIANT"""
+        assert determine_compliance(30, 7, 30) == 'COMPLIANT'
+        assert determine_compliance(31, 7, 30) == 'NON_COMPLIANT'
+        assert determine_compliance(None, 7, 30) == 'NON_COMPLIANT'
+        assert determine_compliance(3, 7, 30) == 'NON_COMPLIANT'
 
 
 class TestAnnotations:
@@ -91,6 +119,105 @@ class TestAnnotations:
         # Special characters in log group name
         annotation = create_annotation('/aws/lambda/my-test_function.v1', None, 1)
         assert '/aws/lambda/my-test_function.v1' in annotation
+    
+    def test_create_annotation_maximum(self):
+        """Test annotations when a maximum retention applies"""
+        annotation = create_annotation('/aws/lambda/dev-api', 90, 7, 30)
+        assert '90 days retention' in annotation
+        assert 'Maximum allowed: 30 days' in annotation
+        
+        annotation = create_annotation('/aws/lambda/dev-api', 14, 7, 30)
+        assert 'within the required 7 to 30 days' in annotation
+    
+    def test_create_annotation_excess_storage(self):
+        """Test that over-retained log groups report the estimated excess storage"""
+        annotation = create_annotation('/app/old', 365, 7, 30, 3 * 1024 ** 3)
+        assert 'Maximum allowed: 30 days. Estimated excess storage: 3.0 GiB.' in annotation
+        
+        annotation = create_annotation('/app/forever', None, 7, 30, 1536)
+        assert 'infinite retention (null). Maximum allowed: 30 days. Estimated excess storage: 1.5 KiB.' in annotation
+        
+        # Unknown or zero excess is left out
+        assert 'excess' not in create_annotation('/app/old', 365, 7, 30, None)
+        assert 'excess' not in create_annotation('/app/new', None, 7, 30, 0)
+
+
+class TestExcessStorage:
+    """Test estimating storage kept beyond the maximum retention"""
+    
+    DAY_MS = 86400000
+    
+    def test_share_beyond_maximum(self):
+        """Test that the excess is the share of stored data older than the maximum"""
+        assert lambda_function.estimate_excess_bytes(120, 30, 4000) == 3000
+        assert lambda_function.estimate_excess_bytes(30, 30, 4000) == 0
+        assert lambda_function.estimate_excess_bytes(120, 30, None) is None
+    
+    def test_age_limits_data_held(self):
+        """Test that a log group younger than its retention only holds data for its age"""
+        now_ms = 400 * self.DAY_MS
+        # Created 60 days ago with 365 days retention: 60 days held, 30 beyond the maximum
+        assert lambda_function.estimate_excess_bytes(365, 30, 6000, 340 * self.DAY_MS, now_ms) == 3000
+        # Never expires: the age is the data held
+        assert lambda_function.estimate_excess_bytes(None, 100, 4000, 0, now_ms) == 3000
+        assert lambda_function.estimate_excess_bytes(None, 100, 4000, 350 * self.DAY_MS, now_ms) == 0
+        assert lambda_function.estimate_excess_bytes(None, 100, 4000) is None
+    
+    @pytest.mark.parametrize('size, expected', [
+        (0, '0 B'), (1023, '1023 B'), (1536, '1.5 KiB'), (5 * 1024 ** 2, '5.0 MiB'), (2 * 1024 ** 5, '2048.0 TiB'),
+    ])
+    def test_format_bytes(self, size, expected):
+        assert lambda_function.format_bytes(size) == expected
+    
+    def test_sweep_reports_excess_from_page(self):
+        """Test that a sweep folds storedBytes into the evaluation and metrics without extra calls"""
+        logs_client = FakeLogsClient([
+            {'logGroupName': '/app/old', 'retentionInDays': 120, 'storedBytes': 4 * 1024 ** 3},
+            {'logGroupName': '/app/ok', 'retentionInDays': 60, 'storedBytes': 1024},
+            {'logGroupName': '/app/short', 'retentionInDays': 1, 'storedBytes': 1024},
+        ])
+        event = dict(TestIncrementalEvaluation.EVENT,
+                     ruleParameters=json.dumps({'MinimumRetentionDays': '7', 'MaximumRetentionDays': '60'}))
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        with patch('lambda_function.boto3.client', return_value=mock_config_client):
+            evaluations = evaluate_all_log_groups(logs_client, 7, event)
+        
+        by_id = {e['ComplianceResourceId']: e for e in evaluations}
+        assert by_id['/app/old']['ComplianceType'] == 'NON_COMPLIANT'
+        assert by_id['/app/old']['Annotation'].endswith('Maximum allowed: 60 days. Estimated excess storage: 2.0 GiB.')
+        assert by_id['/app/ok']['ComplianceType'] == 'COMPLIANT'
+        assert 'Minimum required: 7 days' in by_id['/app/short']['Annotation']
+        assert lambda_function.METRICS.counters['ExcessStoredBytes'] == 2 * 1024 ** 3
+    
+    def test_change_notification_uses_configuration(self):
+        """Test that a change notification estimates the excess from the configuration item"""
+        configuration_item = {
+            'resourceType': 'AWS::Logs::LogGroup',
+            'resourceId': '/app/old',
+            'configurationItemCaptureTime': '2024-01-01T00:00:00Z',
+            'configuration': {'retentionInDays': 120, 'storedBytes': 1000}
+        }
+        
+        evaluation = evaluate_single_log_group(configuration_item, 7, maximum_retention_days=60)
+        
+        assert evaluation['ComplianceType'] == 'NON_COMPLIANT'
+        assert 'Estimated excess storage: 500 B.' in evaluation['Annotation']
+    
+    def test_maximum_change_resubmits_snapshot(self, tmp_path):
+        """Test that an incremental sweep re-submits every log group after the maximum changes"""
+        log_groups = {'/app/a': 400, '/app/b': 30}
+        TestIncrementalEvaluation._sweep(log_groups, tmp_path)
+        assert TestIncrementalEvaluation._sweep(log_groups, tmp_path) == []
+        
+        with patch.dict(os.environ, {'MAXIMUM_RETENTION_DAYS': '90'}):
+            submitted = TestIncrementalEvaluation._sweep(log_groups, tmp_path)
+        
+        assert {e['ComplianceResourceId']: e['ComplianceType'] for e in submitted} == {
+            '/app/a': 'NON_COMPLIANT', '/app/b': 'COMPLIANT'
+        }
 
 
 class TestEvaluationCreation:
@@ -138,6 +265,217 @@ class TestEvaluationCreation:
         assert 'infinite retention' in evaluation['Annotation']
 
 
+class TestEvaluationRecords:
+    """Test compact evaluation records materialized at submit time"""
+    
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00Z'
+        }),
+        'resultToken': 'test-token'
+    }
+    
+    @pytest.mark.parametrize('retention', [None, 7, 30, 365])
+    def test_record_matches_create_evaluation(self, retention):
+        """Test that a materialized record is identical to the evaluation built directly"""
+        record = EvaluationRecord(
+            '/app/logs', retention, determine_compliance(retention, 30), 30, '2024-01-01T00:00:00Z'
+        )
+        
+        assert record.to_evaluation() == create_evaluation(
+            '/app/logs', 'AWS::Logs::LogGroup', retention, 30, self.EVENT
+        )
+    
+    def test_records_materialized_one_batch_at_a_time(self):
+        """Test that submission builds evaluation dicts per batch, not for the whole sweep up front"""
+        materialized = []
+        batch_sizes = []
+        records = [EvaluationRecord(f'/log{i}', 30, 'COMPLIANT', 30, '2024-01-01T00:00:00Z') for i in range(250)]
+        mock_config_client = Mock()
+        
+        def put_evaluations(**kwargs):
+            batch_sizes.append((len(kwargs['Evaluations']), len(materialized)))
+            return {'FailedEvaluations': []}
+        
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        
+        original = EvaluationRecord.to_evaluation
+        
+        def tracking_to_evaluation(record):
+            materialized.append(record.resource_id)
+            return original(record)
+        
+        with patch.object(EvaluationRecord, 'to_evaluation', tracking_to_evaluation):
+            submit_evaluations(mock_config_client, iter(records), self.EVENT, concurrency=1)
+        
+        # When each batch is sent only that batch and the earlier ones have been built
+        assert batch_sizes == [(100, 100), (100, 200), (50, 250)]
+        evaluation = mock_config_client.put_evaluations.call_args_list[0][1]['Evaluations'][0]
+        assert evaluation['Annotation'] == create_annotation('/log0', 30, 30)
+    
+    def test_records_do_not_allow_new_attributes(self):
+        """Test that records use __slots__ and carry no per-instance dict"""
+        record = EvaluationRecord('/log', None, 'NON_COMPLIANT', 30, '2024-01-01T00:00:00Z')
+        
+        assert not hasattr(record, '__dict__')
+        with pytest.raises(AttributeError):
+            record.annotation = 'text'
+    
+    @pytest.mark.parametrize('log_group_count', [100_000])
+    def test_record_memory_benchmark(self, log_group_count):
+        """Benchmark peak memory of holding a sweep as evaluation dicts versus compact records"""
+        import tracemalloc
+        
+        names = [f'/aws/lambda/function-{i}' for i in range(log_group_count)]
+        retentions = [None if i % 3 == 0 else 30 for i in range(log_group_count)]
+        timestamp = '2024-01-01T00:00:00Z'
+        
+        def peak(build):
+            tracemalloc.start()
+            held = build()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del held
+            return peak_bytes
+        
+        dict_peak = peak(lambda: [
+            create_evaluation(name, 'AWS::Logs::LogGroup', retention, 30, self.EVENT)
+            for name, retention in zip(names, retentions)
+        ])
+        record_peak = peak(lambda: [
+            EvaluationRecord(name, retention, determine_compliance(retention, 30), 30, timestamp)
+            for name, retention in zip(names, retentions)
+        ])
+        
+        print(f"\n{log_group_count} log groups: dicts {dict_peak / 2**20:.1f}MiB, "
+              f"records {record_peak / 2**20:.1f}MiB ({dict_peak / record_peak:.1f}x)")
+        assert record_peak * 3 < dict_peak
+
+
+class TestEvaluationContext:
+    """Test parsing the Config event once per invocation"""
+    
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00Z'
+        }),
+        'ruleParameters': json.dumps({'MinimumRetentionDays': '90'}),
+        'resultToken': 'test-token',
+        'configRuleName': 'test-rule',
+        'accountId': '123456789012'
+    }
+    
+    def test_fields_parsed_from_event(self):
+        """Test that the context exposes the parsed event, rule parameters and shared timestamp"""
+        evaluation_context = EvaluationContext.from_event(self.EVENT)
+        
+        assert evaluation_context.event is self.EVENT
+        assert evaluation_context.message_type == 'ScheduledNotification'
+        assert evaluation_context.ordering_timestamp == '2024-01-01T00:00:00Z'
+        assert evaluation_context.rule_parameters == {'MinimumRetentionDays': '90'}
+        assert evaluation_context.required_retention_days == 90
+        assert evaluation_context.result_token == 'test-token'
+        assert evaluation_context.config_rule_name == 'test-rule'
+        assert evaluation_context.account_id == '123456789012'
+        assert evaluation_context.shard is None
+    
+    def test_from_event_is_idempotent(self):
+        """Test that passing a context where an event is expected does not parse again"""
+        evaluation_context = EvaluationContext.from_event(self.EVENT)
+        
+        with patch('lambda_function.json.loads') as mock_loads:
+            assert EvaluationContext.from_event(evaluation_context) is evaluation_context
+            create_evaluation('/log', 'AWS::Logs::LogGroup', 30, 30, evaluation_context)
+        
+        mock_loads.assert_not_called()
+    
+    def test_maximum_retention(self):
+        """Test that the maximum comes from the rule parameter or environment and is optional"""
+        assert EvaluationContext(self.EVENT).maximum_retention_days is None
+        
+        event = dict(self.EVENT, ruleParameters=json.dumps({'MinimumRetentionDays': '7', 'MaximumRetentionDays': '90'}))
+        assert EvaluationContext(event).maximum_retention_days == 90
+        
+        with patch.dict(os.environ, {'MAXIMUM_RETENTION_DAYS': '365'}):
+            assert EvaluationContext(self.EVENT).maximum_retention_days == 365
+        
+        event = dict(self.EVENT, ruleParameters=json.dumps({'MinimumRetentionDays': '90', 'MaximumRetentionDays': ''}))
+        assert EvaluationContext(event).maximum_retention_days is None
+    
+    def test_maximum_below_minimum_rejected(self):
+        """Test that a maximum below the minimum is a configuration error"""
+        event = dict(self.EVENT, ruleParameters=json.dumps({'MinimumRetentionDays': '90', 'MaximumRetentionDays': '30'}))
+        with pytest.raises(ValueError, match='below MinimumRetentionDays'):
+            EvaluationContext(event).maximum_retention_days
+    
+    @patch('lambda_function.boto3.client')
+    def test_maximum_below_minimum_reported(self, mock_boto_client):
+        """Test that the handler reports a maximum below the minimum as an account-level NOT_APPLICABLE evaluation"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_boto_client.return_value = mock_config_client
+        event = dict(self.EVENT, ruleParameters=json.dumps({'MinimumRetentionDays': '30', 'MaximumRetentionDays': '7'}))
+        
+        lambda_handler(event, {})
+        
+        evaluation = mock_config_client.put_evaluations.call_args[1]['Evaluations'][0]
+        assert evaluation['ComplianceResourceType'] == 'AWS::::Account'
+        assert evaluation['ComplianceType'] == 'NOT_APPLICABLE'
+        assert 'below MinimumRetentionDays' in evaluation['Annotation']
+    
+    def test_required_retention_falls_back_to_environment(self):
+        """Test that the environment supplies the minimum when the rule has no parameter"""
+        event = {key: value for key, value in self.EVENT.items() if key != 'ruleParameters'}
+        
+        with patch.dict(os.environ, {'REQUIRED_RETENTION_DAYS': '14'}):
+            assert EvaluationContext.from_event(event).required_retention_days == 14
+    
+    @patch('lambda_function.boto3.client')
+    def test_handler_parses_invoking_event_once(self, mock_boto_client):
+        """Test that a scheduled sweep decodes the event a constant number of times, not per log group"""
+        logs_client = FakeLogsClient(
+            [{'logGroupName': f'/app/log{i}', 'retentionInDays': 30} for i in range(1000)]
+        )
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {
+            'EvaluationResults': [
+                {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': f'/gone{i}'}}}
+                for i in range(100)
+            ]
+        }
+        mock_boto_client.side_effect = lambda service_name, **kwargs: (
+            logs_client if service_name == 'logs' else config_client
+        )
+        
+        with patch('lambda_function.json.loads', wraps=json.loads) as mock_loads:
+            result = lambda_handler(dict(self.EVENT), {})
+        
+        assert json.loads(result['body'])['evaluations_count'] == 1100
+        # invokingEvent and ruleParameters
+        assert mock_loads.call_count == 2
+    
+    @pytest.mark.parametrize('log_group_count', [100_000])
+    def test_per_log_group_cost_benchmark(self, log_group_count):
+        """Benchmark building evaluations from the raw event versus a context parsed once"""
+        evaluation_context = EvaluationContext.from_event(self.EVENT)
+        
+        def per_log_group(event):
+            start = time.perf_counter()
+            for i in range(log_group_count):
+                create_evaluation('/aws/lambda/function', 'AWS::Logs::LogGroup', i % 60, 30, event)
+            return (time.perf_counter() - start) / log_group_count
+        
+        raw_seconds = per_log_group(self.EVENT)
+        context_seconds = per_log_group(evaluation_context)
+        
+        print(f"\n{log_group_count} log groups: raw event {raw_seconds * 1e6:.2f}us/group, "
+              f"parsed context {context_seconds * 1e6:.2f}us/group")
+        assert context_seconds < raw_seconds
+
+
 class TestSingleLogGroupEvaluation:
     """Test single log group evaluation"""
     
@@ -224,6 +562,7 @@ class TestStaleEvaluationCleanup:
         # Mock logs client and config client
         mock_logs_client = Mock()
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         
         # boto3.client is called to create config client inside evaluate_all_log_groups
         mock_boto_client.return_value = mock_config_client
@@ -284,6 +623,7 @@ class TestStaleEvaluationCleanup:
         """Test handling of paginated Config API responses"""
         mock_logs_client = Mock()
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         
         # boto3.client is called to create config client inside evaluate_all_log_groups
         mock_boto_client.return_value = mock_config_client
@@ -334,6 +674,7 @@ class TestStaleEvaluationCleanup:
         """Test graceful handling when Config API fails"""
         mock_logs_client = Mock()
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         
         # boto3.client is called to create config client inside evaluate_all_log_groups
         mock_boto_client.return_value = mock_config_client
@@ -374,6 +715,7 @@ class TestConfigurationItem:
     def test_get_configuration_item_oversized(self, mock_boto_client):
         """Test handling of oversized configuration items"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         mock_boto_client.return_value = mock_config_client
         
         # Mock API response for oversized item
@@ -424,6 +766,7 @@ class TestConfigurationItem:
     def test_get_configuration_item_no_history(self, mock_boto_client):
         """Test handling when no configuration history is available"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         mock_boto_client.return_value = mock_config_client
         
         # Mock empty API response
@@ -443,6 +786,179 @@ class TestConfigurationItem:
         result = get_configuration_item(invoking_event, mock_config_client)
         assert result is None
 
+class TestConfigurationItemCache:
+    """Test caching of oversized configuration item lookups across warm invocations"""
+    
+    SUMMARY = {
+        'resourceType': 'AWS::Logs::LogGroup',
+        'resourceId': '/noisy/log',
+        'configurationItemCaptureTime': '2024-01-01T00:00:00Z'
+    }
+    
+    def _invoking_event(self, capture_time='2024-01-01T00:00:00Z'):
+        return {
+            'messageType': 'OversizedConfigurationItemChangeNotification',
+            'configurationItemSummary': dict(self.SUMMARY, configurationItemCaptureTime=capture_time)
+        }
+    
+    @staticmethod
+    def _config_client(configuration):
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_resource_config_history.side_effect = lambda **kwargs: {
+            'configurationItems': [{
+                'resourceId': kwargs['resourceId'],
+                'resourceType': kwargs['resourceType'],
+                'configurationItemStatus': 'OK',
+                'configurationItemCaptureTime': kwargs['laterTime'],
+                'configuration': configuration
+            }]
+        }
+        return config_client
+    
+    def test_repeated_notification_served_from_cache(self):
+        """Test that the same resource and capture time is fetched once"""
+        config_client = self._config_client('{"retentionInDays": 14}')
+        
+        first = get_configuration_item(self._invoking_event(), config_client)
+        second = get_configuration_item(self._invoking_event(), config_client)
+        
+        assert first is second
+        assert config_client.get_resource_config_history.call_count == 1
+        assert lambda_function.CONFIGURATION_ITEM_CACHE.stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    
+    def test_new_capture_time_fetched(self):
+        """Test that a newer configuration item of the same resource is not served stale"""
+        config_client = self._config_client('{"retentionInDays": 14}')
+        
+        get_configuration_item(self._invoking_event('2024-01-01T00:00:00Z'), config_client)
+        get_configuration_item(self._invoking_event('2024-01-01T00:05:00Z'), config_client)
+        
+        assert config_client.get_resource_config_history.call_count == 2
+    
+    def test_entries_expire_after_ttl(self):
+        """Test that entries older than the TTL are fetched again"""
+        config_client = self._config_client('{"retentionInDays": 14}')
+        
+        with patch('lambda_function.time.monotonic', return_value=1000.0):
+            get_configuration_item(self._invoking_event(), config_client)
+        with patch('lambda_function.time.monotonic', return_value=1000.0 + lambda_function.CONFIGURATION_ITEM_CACHE.ttl_seconds):
+            get_configuration_item(self._invoking_event(), config_client)
+        
+        assert config_client.get_resource_config_history.call_count == 2
+    
+    def test_least_recently_used_evicted(self):
+        """Test that the cache stays within its size by evicting the least recently used entry"""
+        cache = lambda_function.TTLCache(max_size=2, ttl_seconds=60)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+    
+    def test_missing_history_not_cached(self):
+        """Test that an empty history response is retried on the next notification"""
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_resource_config_history.return_value = {'configurationItems': []}
+        
+        assert get_configuration_item(self._invoking_event(), config_client) is None
+        assert get_configuration_item(self._invoking_event(), config_client) is None
+        assert config_client.get_resource_config_history.call_count == 2
+    
+    @pytest.mark.parametrize('configuration,expected', [
+        ('{"logGroupName": "/a", "retentionInDays": 30, "tags": {"team": "x"}}', 30),
+        ('{"logGroupName": "/a", "tags": {"retentionInDays": "7"}}', None),
+        ('{"logGroupName": "/a", "retentionInDays": null}', None),
+        ('{"logGroupName": "/a", "retentionInDays" : 3653}', 3653),
+        ('null', None),
+        (None, None),
+        ({'retentionInDays': 90}, 90),
+    ])
+    def test_extract_retention_in_days(self, configuration, expected):
+        """Test that only retentionInDays is read from the configuration document"""
+        assert lambda_function.extract_retention_in_days(configuration) == expected
+    
+    @pytest.mark.parametrize('configuration,expected', [
+        ('{"retentionInDays": 30, "logGroupClass": "DELIVERY"}', {'retentionInDays': 30, 'logGroupClass': 'DELIVERY'}),
+        ('{"storedBytes": 1024, "creationTime": 1700000000000, "tags": {"storedBytes": "1"}}',
+         {'retentionInDays': None, 'storedBytes': 1024, 'creationTime': 1700000000000}),
+        ('{"logGroupClass": null}', {'retentionInDays': None}),
+        ('{"logGroupClass": "STANDARD", "tags": {"logGroupClass": "DELIVERY"}}',
+         {'retentionInDays': None, 'logGroupClass': 'STANDARD'}),
+        ({'retentionInDays': 7, 'logGroupClass': 'INFREQUENT_ACCESS'},
+         {'retentionInDays': 7, 'logGroupClass': 'INFREQUENT_ACCESS'}),
+    ])
+    def test_extract_configuration(self, configuration, expected):
+        """Test that the evaluated fields are read, falling back to a full parse for repeated names"""
+        assert lambda_function.extract_configuration(configuration) == expected
+    
+    def test_oversized_item_keeps_log_group_class(self):
+        """Test that the class filter excludes an oversized log group as it does a normal one"""
+        configuration = {'logGroupName': '/noisy/log', 'retentionInDays': 7, 'logGroupClass': 'DELIVERY'}
+        config_client = self._config_client(json.dumps(configuration))
+        filters = lambda_function.LogGroupFilters(log_group_class='STANDARD')
+        normal_item = dict(self.SUMMARY, configurationItemStatus='OK', configuration=configuration)
+        
+        oversized = evaluate_single_log_group(get_configuration_item(self._invoking_event(), config_client), 30, filters)
+        normal = evaluate_single_log_group(normal_item, 30, filters)
+        
+        assert oversized == normal
+        assert oversized['ComplianceType'] == 'NOT_APPLICABLE'
+    
+    def test_oversized_item_keeps_excess_storage(self):
+        """Test that an over-retained oversized log group gets the same excess estimate as a normal one"""
+        configuration = {
+            'logGroupName': '/noisy/log', 'retentionInDays': 365, 'storedBytes': 12 * 1024 ** 3,
+            'creationTime': int(time.time() * 1000) - 400 * 86400000,
+            'tags': {f'tag-{i}': 'v' for i in range(100)}
+        }
+        config_client = self._config_client(json.dumps(configuration))
+        normal_item = dict(self.SUMMARY, configurationItemStatus='OK', configuration=configuration)
+        
+        oversized = evaluate_single_log_group(get_configuration_item(self._invoking_event(), config_client), 30,
+                                              maximum_retention_days=90)
+        normal = evaluate_single_log_group(normal_item, 30, maximum_retention_days=90)
+        
+        assert oversized == normal
+        assert 'Estimated excess storage: 9.0 GiB.' in oversized['Annotation']
+    
+    @pytest.mark.parametrize('tag_count', [2000])
+    def test_oversized_lookup_benchmark(self, tag_count):
+        """Benchmark full deserialization against retention extraction and cache hits for a large document"""
+        document = json.dumps({
+            'logGroupName': '/noisy/log',
+            'retentionInDays': 30,
+            'tags': {f'tag-{i}': 'v' * 64 for i in range(tag_count)},
+            'subscriptionFilters': [{'filterName': f'f{i}', 'destinationArn': 'arn:aws:lambda:x'} for i in range(100)]
+        })
+        config_client = self._config_client(document)
+        rounds = 200
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            json.loads(document)['retentionInDays']
+        parse_seconds = (time.perf_counter() - start) / rounds
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            lambda_function.extract_retention_in_days(document)
+        extract_seconds = (time.perf_counter() - start) / rounds
+        
+        start = time.perf_counter()
+        for _ in range(rounds):
+            get_configuration_item(self._invoking_event(), config_client)
+        lookup_seconds = (time.perf_counter() - start) / rounds
+        
+        print(f"\n{len(document) // 1024}KiB document: full parse {parse_seconds * 1e6:.1f}us, "
+              f"extract {extract_seconds * 1e6:.1f}us, cached lookup {lookup_seconds * 1e6:.1f}us "
+              f"({json.dumps(lambda_function.CONFIGURATION_ITEM_CACHE.stats())})")
+        assert config_client.get_resource_config_history.call_count == 1
+        assert extract_seconds < parse_seconds
+
 
 class TestSubmitEvaluations:
     """Test evaluation submission"""
@@ -451,6 +967,7 @@ class TestSubmitEvaluations:
     def test_submit_evaluations_batching(self, mock_boto_client):
         """Test that evaluations are submitted in batches of 100"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         
         # Create 250 evaluations to test batching
         evaluations = []
@@ -480,6 +997,7 @@ class TestSubmitEvaluations:
     def test_submit_evaluations_datetime_conversion(self, mock_boto_client):
         """Test that datetime objects are converted to strings"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         
         evaluations = [{
             'ComplianceResourceType': 'AWS::Logs::LogGroup',
@@ -498,6 +1016,1846 @@ class TestSubmitEvaluations:
         submitted_eval = args[1]['Evaluations'][0]
         assert isinstance(submitted_eval['OrderingTimestamp'], str)
         assert submitted_eval['OrderingTimestamp'] == '2024-01-01T12:00:00'
+    
+    def test_submit_evaluations_accepts_generator(self):
+        """Test that a generator is consumed batch by batch and the submitted count returned"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        
+        evaluations = ({
+            'ComplianceResourceType': 'AWS::Logs::LogGroup',
+            'ComplianceResourceId': f'/test/log{i}',
+            'ComplianceType': 'COMPLIANT',
+            'Annotation': 'Test',
+            'OrderingTimestamp': '2024-01-01T00:00:00Z'
+        } for i in range(150))
+        
+        submitted = submit_evaluations(mock_config_client, evaluations, {'resultToken': 'test-token'})
+        
+        assert submitted == 150
+        assert mock_config_client.put_evaluations.call_count == 2
+    
+    def test_iter_batches(self):
+        """Test batching of arbitrary iterables"""
+        assert list(iter_batches(iter(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+        assert list(iter_batches([], 100)) == []
+
+
+class TestPayloadBatching:
+    """Test packing evaluations into put_evaluations requests"""
+    
+    @staticmethod
+    def _evaluation(resource_id, annotation='Test'):
+        return {
+            'ComplianceResourceType': 'AWS::Logs::LogGroup',
+            'ComplianceResourceId': resource_id,
+            'ComplianceType': 'NON_COMPLIANT',
+            'Annotation': annotation,
+            'OrderingTimestamp': datetime(2024, 1, 1, 12, 0, 0)
+        }
+    
+    def test_evaluations_not_mutated(self):
+        """Test that preparing a batch leaves the caller's evaluations unchanged"""
+        evaluation = self._evaluation('/test/log', 'x' * 300)
+        original = dict(evaluation)
+        
+        [[prepared]] = iter_prepared_batches([evaluation])
+        
+        assert evaluation == original
+        assert prepared['OrderingTimestamp'] == '2024-01-01T12:00:00'
+        assert len(prepared['Annotation']) == lambda_function.MAX_ANNOTATION_LENGTH
+    
+    def test_long_name_annotation_keeps_verdict(self):
+        """Test that an overlong annotation is cut in the middle, keeping the name's start and the verdict"""
+        name = '/aws/lambda/' + 'a' * 480
+        annotation = create_annotation(name, 7, 30)
+        
+        truncated = truncate_annotation(annotation)
+        
+        assert len(annotation) > 256 and len(truncated) == 256
+        assert truncated.startswith("Log group '/aws/lambda/aaa")
+        assert truncated.endswith("' has 7 days retention. Minimum required: 30 days.")
+        assert '...' in truncated
+        assert truncate_annotation('short') == 'short'
+    
+    def test_long_names_accepted_by_config(self):
+        """Test that evaluations of log groups with 512-character names fit Config's annotation limit"""
+        def put_evaluations(Evaluations, ResultToken):
+            if any(len(evaluation['Annotation']) > 256 for evaluation in Evaluations):
+                raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'annotation'}},
+                                  'PutEvaluations')
+            return {'FailedEvaluations': []}
+        
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        evaluations = [
+            evaluate_single_log_group({
+                'resourceType': 'AWS::Logs::LogGroup',
+                'resourceId': f'/aws/lambda/{i:03}-' + 'n' * 496,
+                'configuration': {'retentionInDays': 7},
+                'configurationItemCaptureTime': '2024-01-01T00:00:00Z'
+            }, 30) for i in range(150)
+        ]
+        
+        assert submit_evaluations(mock_config_client, evaluations, {'resultToken': 'test-token'}) == 150
+        assert mock_config_client.put_evaluations.call_count == 2
+    
+    @pytest.mark.parametrize('resource_id, annotation', [
+        ('/aws/lambda/api', 'Test'),
+        ('/app/"quoted"\\path', 'Tab\tand newline\n'),
+        ('/app/caf\u00e9', 'Log group \u2603 \U0001F600'),
+    ])
+    def test_payload_estimate_covers_json(self, resource_id, annotation):
+        """Test that the payload estimate is never below the evaluation's JSON size"""
+        [[prepared]] = iter_prepared_batches([self._evaluation(resource_id, annotation)])
+        
+        assert evaluation_payload_bytes(prepared) >= len(json.dumps(prepared).encode())
+    
+    def test_batches_packed_to_byte_budget(self):
+        """Test that a batch closes only when the next evaluation would not fit, and never above 100"""
+        evaluations = [self._evaluation(f'/test/{i}-' + 'n' * (i % 400)) for i in range(1000)]
+        size = evaluation_payload_bytes(next(iter_prepared_batches(evaluations[:1]))[0])
+        builder = EvaluationBatchBuilder('test-token', max_bytes=40 * 1024)
+        
+        batches = builder.extend(evaluations) + [builder.flush()]
+        
+        assert [evaluation['ComplianceResourceId'] for batch in batches for evaluation in batch] == \
+            [evaluation['ComplianceResourceId'] for evaluation in evaluations]
+        for batch, following in zip(batches, batches[1:]):
+            batch_bytes = builder.request_bytes + sum(map(evaluation_payload_bytes, batch))
+            assert batch_bytes <= 40 * 1024
+            assert len(batch) == 100 or batch_bytes + evaluation_payload_bytes(following[0]) > 40 * 1024
+        assert max(map(len, batches)) == 100 and min(map(len, batches[:-1])) < 100
+        assert size > lambda_function.EVALUATION_PAYLOAD_OVERHEAD_BYTES
+        assert builder.flush() == []
+    
+    def test_rejected_evaluation_isolated(self):
+        """Test that a rejected batch is bisected so only the invalid evaluation is left out"""
+        submitted = []
+        
+        def put_evaluations(Evaluations, ResultToken):
+            if any(evaluation['ComplianceResourceId'] == '/test/log137' for evaluation in Evaluations):
+                raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'bad'}},
+                                  'PutEvaluations')
+            submitted.extend(evaluation['ComplianceResourceId'] for evaluation in Evaluations)
+            return {'FailedEvaluations': []}
+        
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        evaluations = [self._evaluation(f'/test/log{i}') for i in range(250)]
+        
+        count = submit_evaluations(mock_config_client, evaluations, {'resultToken': 'test-token'})
+        
+        assert count == 249
+        assert sorted(submitted) == sorted(f'/test/log{i}' for i in range(250) if i != 137)
+        assert lambda_function.METRICS.counters['RejectedEvaluations'] == 1
+        # 3 batches, plus two halves for each of at most 7 levels of bisection
+        assert mock_config_client.put_evaluations.call_count <= 3 + 2 * 7
+    
+    def test_failed_evaluations_not_counted(self):
+        """Test that evaluations Config lists as FailedEvaluations are left out of the count and rejected"""
+        def put_evaluations(Evaluations, ResultToken):
+            return {'FailedEvaluations': [
+                evaluation for evaluation in Evaluations if evaluation['ComplianceResourceId'] == '/test/log7'
+            ]}
+        
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        rejected = set()
+        
+        count = submit_evaluations(mock_config_client, [self._evaluation(f'/test/log{i}') for i in range(150)],
+                                   {'resultToken': 'test-token'}, rejected=rejected)
+        
+        assert count == 149
+        assert rejected == {'/test/log7'}
+        assert lambda_function.METRICS.counters['RejectedEvaluations'] == 1
+    
+    def test_failed_batch_resource_ids_reported(self):
+        """Test that a batch failing for other reasons is raised with the resource IDs it held"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = [
+            {'FailedEvaluations': []},
+            ClientError({'Error': {'Code': 'InternalFailure', 'Message': 'unavailable'}}, 'PutEvaluations')
+        ]
+        
+        with pytest.raises(EvaluationSubmissionError) as exc_info:
+            submit_evaluations(mock_config_client, [self._evaluation(f'/test/log{i}') for i in range(150)],
+                               {'resultToken': 'test-token'})
+        
+        assert exc_info.value.failed_resource_ids == {f'/test/log{i}' for i in range(100, 150)}
+        assert mock_config_client.put_evaluations.call_count == 2
+
+
+class TestEvaluationBuffer:
+    """Test keeping the newest evaluation per resource before submission"""
+    
+    @staticmethod
+    def _evaluation(resource_id, timestamp, compliance_type='COMPLIANT'):
+        return {
+            'ComplianceResourceType': 'AWS::Logs::LogGroup',
+            'ComplianceResourceId': resource_id,
+            'ComplianceType': compliance_type,
+            'Annotation': 'Test',
+            'OrderingTimestamp': timestamp
+        }
+    
+    @staticmethod
+    def _change_event(retention, capture_time):
+        return {
+            'invokingEvent': json.dumps({
+                'messageType': 'ConfigurationItemChangeNotification',
+                'configurationItem': {
+                    'resourceId': '/test/log',
+                    'resourceType': 'AWS::Logs::LogGroup',
+                    'configurationItemCaptureTime': capture_time,
+                    'configuration': {'retentionInDays': retention}
+                }
+            }),
+            'ruleParameters': json.dumps({'MinimumRetentionDays': '30'}),
+            'resultToken': 'test-token'
+        }
+    
+    def test_newest_timestamp_wins(self):
+        """Test that the newest OrderingTimestamp is kept whatever order or format evaluations arrive in"""
+        buffer = EvaluationBuffer()
+        
+        buffer.extend([
+            self._evaluation('/a', '2024-03-01T10:00:05.000Z', 'NON_COMPLIANT'),
+            self._evaluation('/b', datetime(2024, 3, 1, 9, 0, 0)),
+            self._evaluation('/a', '2024-03-01T10:00:00Z', 'COMPLIANT'),
+            EvaluationRecord('/b', 7, 'NON_COMPLIANT', 30, '2024-03-01T09:30:00Z'),
+        ])
+        
+        assert [evaluation['ComplianceResourceId'] if isinstance(evaluation, dict) else evaluation.resource_id
+                for evaluation in buffer] == ['/a', '/b']
+        evaluations = [lambda_function.materialize_evaluation(evaluation) for evaluation in buffer]
+        assert [evaluation['ComplianceType'] for evaluation in evaluations] == ['NON_COMPLIANT', 'NON_COMPLIANT']
+        assert lambda_function.METRICS.counters['SupersededEvaluations'] == 2
+    
+    def test_tie_keeps_last_added(self):
+        """Test that of two evaluations with the same timestamp the later one wins"""
+        buffer = EvaluationBuffer()
+        
+        assert buffer.add(self._evaluation('/a', '2024-03-01T10:00:00Z', 'NON_COMPLIANT'))
+        assert buffer.add(self._evaluation('/a', '2024-03-01T10:00:00.000Z', 'NOT_APPLICABLE'))
+        
+        assert [evaluation['ComplianceType'] for evaluation in buffer] == ['NOT_APPLICABLE']
+    
+    def test_submitted_cache_drops_replaced_changes(self):
+        """Test that a change no newer than one already submitted is dropped, unless its submission failed"""
+        submitted = lambda_function.TTLCache(10, 60)
+        first = EvaluationBuffer(submitted)
+        first.extend([self._evaluation('/a', '2024-03-01T10:00:00Z'), self._evaluation('/b', '2024-03-01T10:00:00Z')])
+        first.record_submitted(failed_resource_ids={'/b'})
+        
+        second = EvaluationBuffer(submitted)
+        
+        assert not second.add(self._evaluation('/a', '2024-03-01T09:00:00Z'))
+        assert not second.add(self._evaluation('/a', '2024-03-01T10:00:00Z'))
+        assert second.add(self._evaluation('/b', '2024-03-01T10:00:00Z'))
+        assert second.add(self._evaluation('/a', '2024-03-01T11:00:00Z'))
+        assert len(second) == 2
+    
+    def test_submitted_cache_keeps_new_verdict_for_same_change(self):
+        """Test that a change re-evaluated to a different verdict is submitted again"""
+        submitted = lambda_function.TTLCache(10, 60)
+        first = EvaluationBuffer(submitted)
+        first.add(self._evaluation('/a', '2024-03-01T10:00:00Z', 'COMPLIANT'))
+        first.record_submitted()
+        
+        second = EvaluationBuffer(submitted)
+        
+        assert second.add(self._evaluation('/a', '2024-03-01T10:00:00Z', 'NON_COMPLIANT'))
+    
+    @patch('lambda_function.boto3.client')
+    def test_reevaluation_after_parameter_change_submitted(self, mock_boto_client):
+        """Test that Config re-evaluating an unchanged log group under new rule parameters is submitted"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_boto_client.return_value = mock_config_client
+        event = self._change_event(7, '2024-03-01T10:00:00.000Z')
+        
+        lambda_handler(dict(event, ruleParameters=json.dumps({'MinimumRetentionDays': '1'})), {})
+        result = lambda_handler(dict(event, resultToken='new-token'), {})
+        repeated = lambda_handler(dict(event, resultToken='newer-token'), {})
+        
+        assert json.loads(result['body'])['evaluations_count'] == 1
+        assert json.loads(repeated['body'])['evaluations_count'] == 0
+        evaluations = [call[1]['Evaluations'][0] for call in mock_config_client.put_evaluations.call_args_list]
+        assert [evaluation['ComplianceType'] for evaluation in evaluations] == ['COMPLIANT', 'NON_COMPLIANT']
+    
+    @patch('lambda_function.boto3.client')
+    def test_out_of_order_change_notification_skipped(self, mock_boto_client):
+        """Test that a change notification delivered after a newer one for the same log group is not submitted"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_boto_client.return_value = mock_config_client
+        
+        lambda_handler(self._change_event(90, '2024-03-01T10:05:00.000Z'), {})
+        result = lambda_handler(self._change_event(7, '2024-03-01T10:00:00.000Z'), {})
+        
+        assert json.loads(result['body'])['evaluations_count'] == 0
+        mock_config_client.put_evaluations.assert_called_once()
+        assert mock_config_client.put_evaluations.call_args[1]['Evaluations'][0]['ComplianceType'] == 'COMPLIANT'
+
+
+class TestConcurrentSubmission:
+    """Test concurrent put_evaluations submission"""
+    
+    @staticmethod
+    def _evaluations(count):
+        return [{
+            'ComplianceResourceType': 'AWS::Logs::LogGroup',
+            'ComplianceResourceId': f'/test/log{i}',
+            'ComplianceType': 'COMPLIANT',
+            'Annotation': 'Test',
+            'OrderingTimestamp': '2024-01-01T00:00:00Z'
+        } for i in range(count)]
+    
+    def test_batches_overlap_up_to_concurrency(self):
+        """Test that a slow stubbed Config endpoint sees concurrent requests, bounded by the pool width"""
+        lock = threading.Lock()
+        in_flight = 0
+        max_in_flight = 0
+        
+        def slow_put_evaluations(**kwargs):
+            nonlocal in_flight, max_in_flight
+            with lock:
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+            return {'FailedEvaluations': []}
+        
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = slow_put_evaluations
+        
+        submitted = submit_evaluations(
+            mock_config_client, iter(self._evaluations(1000)), {'resultToken': 'test-token'}, concurrency=4
+        )
+        
+        assert submitted == 1000
+        assert mock_config_client.put_evaluations.call_count == 10
+        assert 1 < max_in_flight <= 4
+    
+    def test_concurrency_from_environment(self):
+        """Test that SUBMIT_CONCURRENCY sets the pool width"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        
+        with patch.dict(os.environ, {'SUBMIT_CONCURRENCY': '3'}), \
+             patch('lambda_function.ThreadPoolExecutor', wraps=__import__('lambda_function').ThreadPoolExecutor) as mock_pool:
+            submit_evaluations(mock_config_client, self._evaluations(10), {'resultToken': 'test-token'})
+        
+        mock_pool.assert_called_once_with(max_workers=3)
+    
+    @pytest.mark.parametrize('concurrency', [1, 4])
+    def test_batch_errors_are_collected(self, concurrency):
+        """Test that failed batches do not stop the rest and are reported together"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        failing = {'/test/log100', '/test/log300'}
+        
+        def put_evaluations(Evaluations, ResultToken):
+            if Evaluations[0]['ComplianceResourceId'] in failing:
+                raise Exception("Throttled")
+            return {'FailedEvaluations': []}
+        
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        
+        with pytest.raises(EvaluationSubmissionError) as exc_info:
+            submit_evaluations(
+                mock_config_client, self._evaluations(500), {'resultToken': 'test-token'}, concurrency=concurrency
+            )
+        
+        # Every batch was attempted even though two failed
+        assert mock_config_client.put_evaluations.call_count == 5
+        assert [batch_number for batch_number, _ in exc_info.value.errors] == [2, 4]
+        assert '2 of 5 evaluation batches failed' in str(exc_info.value)
+
+
+class TestIncrementalEvaluation:
+    """Test incremental scheduled sweeps against a stored snapshot"""
+    
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00Z'
+        }),
+        'resultToken': 'test-token',
+        'configRuleName': 'test-rule'
+    }
+    
+    @staticmethod
+    def _sweep(log_groups, tmp_path, required_retention_days=30, rejected_ids=()):
+        """Run one incremental sweep over the given {name: retention} log groups"""
+        def put_evaluations(Evaluations, ResultToken):
+            if any(evaluation['ComplianceResourceId'] in rejected_ids for evaluation in Evaluations):
+                raise ClientError({'Error': {'Code': 'InvalidParameterValueException', 'Message': 'bad'}},
+                                  'PutEvaluations')
+            return {'FailedEvaluations': []}
+        
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = put_evaluations
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        mock_logs_client = Mock()
+        mock_logs_client.get_paginator.return_value.paginate.return_value = [{
+            'logGroups': [
+                {'logGroupName': name, 'retentionInDays': retention} if retention else {'logGroupName': name}
+                for name, retention in log_groups.items()
+            ]
+        }]
+        
+        with patch.dict(os.environ, {'INCREMENTAL_EVALUATION': 'true', 'STATE_DIRECTORY': str(tmp_path)}), \
+             patch('lambda_function.boto3.client', return_value=mock_config_client):
+            run_scheduled_sweep(mock_config_client, mock_logs_client, required_retention_days, TestIncrementalEvaluation.EVENT)
+        
+        return [
+            evaluation
+            for call in mock_config_client.put_evaluations.call_args_list
+            for evaluation in call[1]['Evaluations']
+        ]
+    
+    def test_first_sweep_submits_everything(self, tmp_path):
+        """Test that a sweep without a snapshot submits every log group and saves one"""
+        submitted = self._sweep({'/a': 30, '/b': 7, '/c': None}, tmp_path)
+        
+        assert {e['ComplianceResourceId'] for e in submitted} == {'/a', '/b', '/c'}
+        snapshot = FileStateStore(str(tmp_path)).load('test-rule/snapshot.json')
+        assert snapshot['required_retention_days'] == 30
+        assert snapshot['log_groups'] == {
+            '/a': [30, 'COMPLIANT'], '/b': [7, 'NON_COMPLIANT'], '/c': [None, 'NON_COMPLIANT']
+        }
+    
+    def test_unchanged_sweep_submits_nothing(self, tmp_path):
+        """Test that a steady-state sweep makes no put_evaluations calls"""
+        self._sweep({'/a': 30, '/b': 7}, tmp_path)
+        
+        assert self._sweep({'/a': 30, '/b': 7}, tmp_path) == []
+    
+    def test_only_changed_new_and_removed_are_submitted(self, tmp_path):
+        """Test that the diff covers changed, new and removed log groups"""
+        self._sweep({'/a': 30, '/b': 7, '/gone': 30}, tmp_path)
+        
+        submitted = {e['ComplianceResourceId']: e for e in self._sweep({'/a': 30, '/b': 60, '/new': None}, tmp_path)}
+        
+        assert set(submitted) == {'/b', '/new', '/gone'}
+        assert submitted['/b']['ComplianceType'] == 'COMPLIANT'
+        assert submitted['/new']['ComplianceType'] == 'NON_COMPLIANT'
+        assert submitted['/gone']['ComplianceType'] == 'NOT_APPLICABLE'
+        assert '/gone' not in FileStateStore(str(tmp_path)).load('test-rule/snapshot.json')['log_groups']
+    
+    def test_rejected_evaluation_resubmitted_next_sweep(self, tmp_path):
+        """Test that an evaluation Config rejected is left out of the snapshot and sent again"""
+        self._sweep({'/a': 30, '/b': 7}, tmp_path, rejected_ids={'/b'})
+        
+        assert set(FileStateStore(str(tmp_path)).load('test-rule/snapshot.json')['log_groups']) == {'/a'}
+        submitted = self._sweep({'/a': 30, '/b': 7}, tmp_path)
+        assert [e['ComplianceResourceId'] for e in submitted] == ['/b']
+    
+    def test_changed_minimum_resubmits_everything(self, tmp_path):
+        """Test that changing MinimumRetentionDays invalidates the snapshot"""
+        self._sweep({'/a': 30, '/b': 7}, tmp_path, required_retention_days=30)
+        
+        submitted = self._sweep({'/a': 30, '/b': 7}, tmp_path, required_retention_days=7)
+        
+        assert {e['ComplianceResourceId'] for e in submitted} == {'/a', '/b'}
+        assert all(e['ComplianceType'] == 'COMPLIANT' for e in submitted)
+    
+    def test_snapshot_not_saved_when_submission_fails(self, tmp_path):
+        """Test that a failed submission leaves the previous snapshot in place"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.side_effect = Exception("Config unavailable")
+        mock_logs_client = Mock()
+        mock_logs_client.get_paginator.return_value.paginate.return_value = [
+            {'logGroups': [{'logGroupName': '/a', 'retentionInDays': 30}]}
+        ]
+        
+        with patch.dict(os.environ, {'INCREMENTAL_EVALUATION': 'true', 'STATE_DIRECTORY': str(tmp_path)}), \
+             patch('lambda_function.boto3.client', return_value=mock_config_client), \
+             pytest.raises(EvaluationSubmissionError):
+            run_scheduled_sweep(mock_config_client, mock_logs_client, 30, self.EVENT)
+        
+        assert FileStateStore(str(tmp_path)).load('test-rule/snapshot.json') is None
+    
+    def test_s3_state_store(self):
+        """Test S3 store round trip and missing-object handling"""
+        mock_s3 = Mock()
+        store = S3StateStore('state-bucket', 'prefix/', s3_client=mock_s3)
+        
+        store.save('rule/snapshot.json', {'log_groups': {'/a': [30, 'COMPLIANT']}})
+        put_kwargs = mock_s3.put_object.call_args[1]
+        assert put_kwargs['Bucket'] == 'state-bucket'
+        assert put_kwargs['Key'] == 'prefix/rule/snapshot.json'
+        
+        mock_s3.get_object.return_value = {'Body': Mock(read=Mock(return_value=put_kwargs['Body']))}
+        assert store.load('rule/snapshot.json') == {'log_groups': {'/a': [30, 'COMPLIANT']}}
+        
+        mock_s3.get_object.side_effect = ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        assert store.load('rule/snapshot.json') is None
+
+
+class TestReconciliationIndex:
+    """Test deletion reconciliation against the persisted evaluated resource index"""
+    
+    EVENT = TestIncrementalEvaluation.EVENT
+    
+    class FakeConfigClient:
+        """Config stand-in holding previous compliance results for a set of resources"""
+        
+        def __init__(self, previously_evaluated):
+            self.previously_evaluated = list(previously_evaluated)
+            self.calls = {'get_compliance_details_by_config_rule': 0, 'put_evaluations': 0}
+        
+        def get_compliance_details_by_config_rule(self, ConfigRuleName, ComplianceTypes, NextToken='0'):
+            self.calls['get_compliance_details_by_config_rule'] += 1
+            start = int(NextToken)
+            response = {'EvaluationResults': [
+                {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': resource_id}}}
+                for resource_id in self.previously_evaluated[start:start + 100]
+            ]}
+            if start + 100 < len(self.previously_evaluated):
+                response['NextToken'] = str(start + 100)
+            return response
+        
+        def put_evaluations(self, Evaluations, ResultToken):
+            self.calls['put_evaluations'] += 1
+            return {'FailedEvaluations': []}
+    
+    @staticmethod
+    def _logs_client(names):
+        mock_logs_client = Mock()
+        mock_logs_client.get_paginator.return_value.paginate.return_value = [
+            {'logGroups': [{'logGroupName': name, 'retentionInDays': 30} for name in names[i:i + 50]]}
+            for i in range(0, len(names), 50)
+        ]
+        return mock_logs_client
+    
+    def _sweep(self, config_client, names, tmp_path):
+        """Run one non-incremental sweep and return every evaluation it produced"""
+        captured = []
+        
+        def capture(client, evaluations, event, rejected=None):
+            captured.extend(lambda_function.materialize_evaluation(evaluation) for evaluation in evaluations)
+            return len(captured)
+        
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path)}), \
+             patch('lambda_function.boto3.client', return_value=config_client), \
+             patch('lambda_function.submit_evaluations', side_effect=capture):
+            run_scheduled_sweep(config_client, self._logs_client(names), 30, self.EVENT)
+        return captured
+    
+    def test_index_replaces_config_scan(self, tmp_path):
+        """Test that a persisted index avoids paging through previous compliance results"""
+        config_client = self.FakeConfigClient(['/a', '/b', '/c'])
+        
+        # First sweep has no index and rebuilds it from Config
+        self._sweep(config_client, ['/a', '/b', '/c'], tmp_path)
+        assert config_client.calls['get_compliance_details_by_config_rule'] == 1
+        
+        evaluations = self._sweep(config_client, ['/a', '/c'], tmp_path)
+        
+        assert config_client.calls['get_compliance_details_by_config_rule'] == 1
+        by_id = {e['ComplianceResourceId']: e['ComplianceType'] for e in evaluations}
+        # Not incremental, so unchanged log groups are still submitted
+        assert by_id == {'/a': 'COMPLIANT', '/c': 'COMPLIANT', '/b': 'NOT_APPLICABLE'}
+    
+    @pytest.mark.parametrize('contents', ['{not json', '{"log_groups": ["/a"]}', '[]'])
+    def test_corrupt_index_is_rebuilt_from_config(self, tmp_path, contents):
+        """Test that an unreadable index falls back to the Config scan"""
+        (tmp_path / 'test-rule').mkdir()
+        (tmp_path / 'test-rule' / 'snapshot.json').write_text(contents)
+        config_client = self.FakeConfigClient(['/a', '/gone'])
+        
+        evaluations = self._sweep(config_client, ['/a'], tmp_path)
+        
+        assert config_client.calls['get_compliance_details_by_config_rule'] == 1
+        assert {e['ComplianceResourceId']: e['ComplianceType'] for e in evaluations} == {
+            '/a': 'COMPLIANT', '/gone': 'NOT_APPLICABLE'
+        }
+        assert FileStateStore(str(tmp_path)).load('test-rule/snapshot.json')['log_groups'] == {'/a': [30, 'COMPLIANT']}
+    
+    def test_deleted_timestamp_parsed_once(self, tmp_path):
+        """Test that stale resources do not re-parse invokingEvent per resource"""
+        config_client = self.FakeConfigClient([f'/gone{i}' for i in range(500)])
+        
+        with patch('lambda_function.json.loads', wraps=json.loads) as mock_loads, \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            evaluations = list(lambda_function.iter_deleted_log_group_evaluations(set(), self.EVENT))
+        
+        assert len(evaluations) == 500
+        assert mock_loads.call_count == 1
+    
+    @pytest.mark.parametrize('log_group_count', [10_000, 50_000, 100_000])
+    def test_reconciliation_api_calls_saved(self, tmp_path, log_group_count):
+        """Compare Config API calls and reconciliation time with and without the index"""
+        names = [f'/bench/log{i}' for i in range(log_group_count)]
+        ordering_timestamp = '2024-01-01T00:00:00Z'
+        
+        config_client = self.FakeConfigClient(names)
+        with patch('lambda_function.time.sleep'), patch('lambda_function.boto3.client', return_value=config_client):
+            started = time.perf_counter()
+            scanned = list(lambda_function.iter_deleted_log_group_evaluations(set(names[1:]), self.EVENT))
+            scan_seconds = time.perf_counter() - started
+        
+        index = dict.fromkeys(names)
+        started = time.perf_counter()
+        indexed = [
+            lambda_function.create_deleted_evaluation(resource_id, ordering_timestamp)
+            for resource_id in index.keys() - set(names[1:])
+        ]
+        index_seconds = time.perf_counter() - started
+        
+        scan_calls = config_client.calls['get_compliance_details_by_config_rule']
+        # Wall time of the scan is bounded below by the API's sustained request rate
+        scan_rate = retry.API_RETRY_SETTINGS['get_compliance_details_by_config_rule']['rate']
+        print(f"{log_group_count} log groups: Config scan {scan_calls} calls "
+              f"(>= {scan_calls / scan_rate:.0f}s at {scan_rate:g} req/s, {scan_seconds:.3f}s in-process), "
+              f"index 0 calls in {index_seconds:.3f}s")
+        assert scanned == indexed
+        assert scan_calls == log_group_count // 100
+
+
+class FakeLogsClient:
+    """CloudWatch Logs stand-in that honours logGroupNamePrefix, logGroupNamePattern and limit like the real API"""
+    
+    def __init__(self, log_groups, page_size=50):
+        self.log_groups = sorted(log_groups, key=lambda log_group: log_group['logGroupName'])
+        self.page_size = page_size
+        self.requests = []
+    
+    def _matching(self, logGroupNamePrefix='', logGroupNamePattern='', logGroupClass=None):
+        return [
+            lg for lg in self.log_groups
+            if lg['logGroupName'].startswith(logGroupNamePrefix) and logGroupNamePattern in lg['logGroupName']
+            and logGroupClass in (None, lg.get('logGroupClass', 'STANDARD'))
+        ]
+    
+    def describe_log_groups(self, logGroupNamePrefix='', limit=50, **filters):
+        self.requests.append((logGroupNamePrefix, 0))
+        return {'logGroups': self._matching(logGroupNamePrefix, **filters)[:limit]}
+    
+    def get_paginator(self, operation):
+        client = self
+        
+        class Paginator:
+            def paginate(self, logGroupNamePrefix='', PaginationConfig=None, **filters):
+                matching = client._matching(logGroupNamePrefix, **filters)
+                start = int((PaginationConfig or {}).get('StartingToken', 0))
+                while True:
+                    client.requests.append((logGroupNamePrefix or filters.get('logGroupNamePattern', ''), start))
+                    page = {'logGroups': matching[start:start + client.page_size]}
+                    start += client.page_size
+                    if start < len(matching):
+                        page['nextToken'] = str(start)
+                    yield page
+                    if 'nextToken' not in page:
+                        return
+        
+        return Paginator()
+
+
+class TestShardedSweep:
+    """Test fan-out of scheduled sweeps across worker invocations"""
+    
+    NAMES = [
+        '/', '/a', '/aws', '/aws/', '/aws/lambda/fn1', '/aws/lambda/fn2', '/aws/ecs/cluster',
+        '/awsx', '/custom/app', 'API-Gateway-Execution-Logs_abc/prod', 'app.log', '#hash', '9lives'
+    ]
+    
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00Z'
+        }),
+        'resultToken': 'shared-token',
+        'configRuleName': 'test-rule'
+    }
+    
+    def test_shard_units_are_disjoint_and_complete(self):
+        """Test that every possible name falls in exactly one listing unit"""
+        prefixes, names = build_shard_units()
+        
+        for name in self.NAMES:
+            matches = [prefix for prefix in prefixes if name.startswith(prefix)] + [n for n in names if n == name]
+            assert len(matches) == 1, (name, matches)
+    
+    def test_shards_partition_the_units(self):
+        """Test that shards split the units without overlap"""
+        prefixes, names = build_shard_units()
+        shards = build_shards(4)
+        
+        assert sorted(p for shard in shards for p in shard['prefixes']) == prefixes
+        assert sorted(n for shard in shards for n in shard['names']) == sorted(names)
+        for name in self.NAMES:
+            assert sum(in_shard(name, shard) for shard in shards) == 1
+    
+    def test_coordinator_fans_out_and_workers_cover_keyspace(self):
+        """Test a full fan-out using an in-process stand-in for asynchronous Lambda invocation"""
+        logs_client = FakeLogsClient([{'logGroupName': name, 'retentionInDays': 30} for name in self.NAMES])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        invocations = []
+        
+        class InProcessInvoker:
+            def invoke(self, payload):
+                invocations.append(payload)
+                lambda_handler(json.loads(json.dumps(payload)), {})
+        
+        def client_factory(service_name, **kwargs):
+            return logs_client if service_name == 'logs' else config_client
+        
+        with patch.dict(os.environ, {'SWEEP_SHARDS': '3'}), \
+             patch('lambda_function.boto3.client', side_effect=client_factory), \
+             patch('lambda_function.get_self_invoker', return_value=InProcessInvoker()), \
+             patch('lambda_function.time.sleep'):
+            result = lambda_handler(dict(self.EVENT), {})
+        
+        assert json.loads(result['body'])['evaluations_count'] == 0
+        assert [payload['shard']['index'] for payload in invocations] == [0, 1, 2]
+        
+        calls = config_client.put_evaluations.call_args_list
+        assert all(call[1]['ResultToken'] == 'shared-token' for call in calls)
+        submitted = [e['ComplianceResourceId'] for call in calls for e in call[1]['Evaluations']]
+        assert sorted(submitted) == sorted(self.NAMES)
+    
+    def test_worker_reconciles_only_its_shard(self):
+        """Test that stale results outside a worker's shard are left to the owning worker"""
+        shard = build_shards(2)[0]
+        owned = next(name for name in ['/aws/gone-a', '/aws/gone-b', '/aws/gone-c'] if in_shard(name, shard))
+        foreign = next(name for name in ['/zzz/gone', '/yyy/gone', '/xxx/gone'] if not in_shard(name, shard))
+        
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': [
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': resource_id}}}
+            for resource_id in (owned, foreign)
+        ]}
+        
+        with patch('lambda_function.boto3.client', return_value=config_client), \
+             patch('lambda_function.time.sleep'):
+            evaluations = evaluate_all_log_groups(FakeLogsClient([]), 30, dict(self.EVENT, shard=shard))
+        
+        assert [e['ComplianceResourceId'] for e in evaluations] == [owned]
+
+
+class TestLogGroupFilters:
+    """Test include/exclude scoping of the log groups a sweep lists and evaluates"""
+    
+    NAMES = [
+        '/aws/lambda/api', '/aws/lambda/api-test', '/aws/lambda/worker', '/aws/ecs/web', '/aws/ecs/web-test',
+        '/aws/rds/db', '/app/orders', '/app/orders-test', '/custom/audit'
+    ]
+    
+    EVENT = TestShardedSweep.EVENT
+    
+    def _event(self, **parameters):
+        return dict(self.EVENT, ruleParameters=json.dumps(parameters))
+    
+    def _sweep(self, event, log_groups=None, concurrency='4'):
+        logs_client = FakeLogsClient(log_groups or [
+            {'logGroupName': name, 'retentionInDays': 30} for name in self.NAMES
+        ], page_size=2)
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        with patch.dict(os.environ, {'LIST_CONCURRENCY': concurrency}), \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            evaluations = evaluate_all_log_groups(logs_client, 30, event)
+        return [e['ComplianceResourceId'] for e in evaluations], logs_client.requests
+    
+    def test_parameters_parsed_and_overlapping_prefixes_collapsed(self):
+        """Test comma-separated rule parameters, with nested include prefixes listed once"""
+        filters = EvaluationContext(self._event(
+            IncludeLogGroupPrefixes='/aws/lambda/, /aws/, /app/', ExcludeLogGroupPatterns='-test',
+            LogGroupClass='STANDARD'
+        )).log_group_filters
+        
+        assert filters.include_prefixes == ['/app/', '/aws/']
+        assert filters.exclude_patterns == ('-test',)
+        assert filters.list_kwargs() == {'logGroupClass': 'STANDARD'}
+    
+    def test_environment_fallback(self):
+        """Test that filters fall back to environment variables without rule parameters"""
+        with patch.dict(os.environ, {'EXCLUDE_LOG_GROUP_PREFIXES': '/aws/rds/'}):
+            filters = EvaluationContext(self.EVENT).log_group_filters
+        
+        assert not filters.matches('/aws/rds/db')
+        assert filters.matches('/aws/lambda/api')
+    
+    @pytest.mark.parametrize('parameters', [
+        {'IncludeLogGroupPatterns': 'api*'},
+        {'ExcludeLogGroupPatterns': 'a b'},
+        {'LogGroupClass': 'ARCHIVE'},
+    ])
+    def test_invalid_parameters_rejected(self, parameters):
+        """Test that patterns logGroupNamePattern cannot express and unknown classes are rejected"""
+        with pytest.raises(ValueError):
+            EvaluationContext(self._event(**parameters)).log_group_filters
+    
+    def test_matches(self):
+        """Test that a log group is in scope if it matches any include and no exclude"""
+        filters = lambda_function.LogGroupFilters(
+            include_prefixes=['/aws/'], include_patterns=['orders'], exclude_patterns=['-test'],
+            exclude_prefixes=['/aws/rds/'], log_group_class='STANDARD'
+        )
+        
+        assert [name for name in self.NAMES if filters.matches(name)] == [
+            '/aws/lambda/api', '/aws/lambda/worker', '/aws/ecs/web', '/app/orders'
+        ]
+        assert not filters.matches('/aws/lambda/api', 'INFREQUENT_ACCESS')
+    
+    def test_only_included_prefixes_listed(self):
+        """Test that include prefixes are listed server-side and exclusions are never evaluated"""
+        evaluated, requests = self._sweep(self._event(
+            IncludeLogGroupPrefixes='/aws/lambda/,/app/', ExcludeLogGroupPatterns='-test'
+        ))
+        
+        assert sorted(evaluated) == ['/app/orders', '/aws/lambda/api', '/aws/lambda/worker']
+        assert {prefix for prefix, _ in requests} == {'/aws/lambda/', '/app/'}
+    
+    def test_patterns_and_prefixes_evaluated_once(self):
+        """Test that a log group matching both a prefix and a pattern is evaluated once"""
+        evaluated, requests = self._sweep(self._event(
+            IncludeLogGroupPrefixes='/aws/lambda/', IncludeLogGroupPatterns='api,orders'
+        ))
+        
+        assert sorted(evaluated) == ['/app/orders', '/app/orders-test', '/aws/lambda/api',
+                                     '/aws/lambda/api-test', '/aws/lambda/worker']
+        assert {prefix for prefix, _ in requests} == {'/aws/lambda/', 'api', 'orders'}
+    
+    def test_log_group_class_filtered_server_side(self):
+        """Test that logGroupClass limits the listing"""
+        log_groups = [
+            {'logGroupName': '/a', 'retentionInDays': 30, 'logGroupClass': 'STANDARD'},
+            {'logGroupName': '/b', 'retentionInDays': 30, 'logGroupClass': 'INFREQUENT_ACCESS'},
+        ]
+        evaluated, _ = self._sweep(self._event(LogGroupClass='INFREQUENT_ACCESS'), log_groups)
+        
+        assert evaluated == ['/b']
+    
+    def test_parallel_listing_matches_sequential_order(self):
+        """Test that prefixes paged in parallel are yielded in the same order as sequential listing"""
+        event = self._event(IncludeLogGroupPrefixes='/aws/lambda/,/aws/ecs/,/app/,/custom/')
+        
+        sequential, _ = self._sweep(event, concurrency='1')
+        parallel, _ = self._sweep(event, concurrency='4')
+        
+        assert parallel == sequential
+        assert len(parallel) == 8
+    
+    def test_sharded_units_intersect_include_prefixes(self):
+        """Test that every include prefix is listed by exactly one shard and patterns by every shard"""
+        filters = lambda_function.LogGroupFilters(include_prefixes=['/aws/lambda/', '/app'], include_patterns=['api'])
+        shards = build_shards(4)
+        
+        units = [unit for shard in shards for unit in lambda_function.get_listing_units(shard, filters)]
+        prefix_units = sorted(value for kind, value in units if kind == 'prefix')
+        
+        assert prefix_units == ['/app', '/aws/lambda/']
+        assert [value for kind, value in units if kind == 'pattern'] == ['api'] * 4
+    
+    def test_sharded_pattern_results_stay_in_shard(self):
+        """Test that workers listing the same pattern together evaluate each log group once"""
+        event = self._event(IncludeLogGroupPatterns='api')
+        evaluated = []
+        for shard in build_shards(3):
+            names, _ = self._sweep(dict(event, shard=shard))
+            evaluated.extend(names)
+        
+        assert sorted(evaluated) == ['/aws/lambda/api', '/aws/lambda/api-test']
+    
+    def test_previously_evaluated_excluded_groups_annotated(self, tmp_path):
+        """Test that log groups dropped by a new exclusion are reported as excluded, not deleted"""
+        event = self._event(ExcludeLogGroupPrefixes='/aws/rds/')
+        previous_snapshot = {'/aws/rds/db': [30, 'COMPLIANT'], '/gone': [30, 'COMPLIANT']}
+        logs_client = FakeLogsClient([{'logGroupName': '/aws/rds/db', 'retentionInDays': 30}])
+        
+        evaluations = [
+            lambda_function.materialize_evaluation(evaluation)
+            for evaluation in iter_log_group_evaluations(logs_client, 30, event, previous_snapshot=previous_snapshot)
+        ]
+        
+        annotations = {e['ComplianceResourceId']: e['Annotation'] for e in evaluations}
+        assert annotations == {
+            '/aws/rds/db': "Log group '/aws/rds/db' is excluded by the rule's log group filters",
+            '/gone': "Log group '/gone' no longer exists"
+        }
+    
+    def test_excluded_change_not_applicable(self):
+        """Test that a change to an excluded log group is NOT_APPLICABLE"""
+        filters = lambda_function.LogGroupFilters(exclude_patterns=['-test'])
+        configuration_item = {
+            'resourceType': 'AWS::Logs::LogGroup',
+            'resourceId': '/app/orders-test',
+            'configurationItemStatus': 'OK',
+            'configurationItemCaptureTime': '2024-01-01T00:00:00Z',
+            'configuration': {'logGroupName': '/app/orders-test'}
+        }
+        
+        assert evaluate_single_log_group(configuration_item, 30, filters)['ComplianceType'] == 'NOT_APPLICABLE'
+        assert evaluate_single_log_group(configuration_item, 30)['ComplianceType'] == 'NON_COMPLIANT'
+
+
+class TestRetentionPolicy:
+    """Test per-log-group requirements from the retention policy"""
+    
+    EVENT = TestIncrementalEvaluation.EVENT
+    
+    POLICY = [
+        {'Prefix': '/aws/cloudtrail', 'MinimumRetentionDays': 365},
+        {'Pattern': '/aws/lambda/dev-*', 'MinimumRetentionDays': 7, 'MaximumRetentionDays': 30},
+        {'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 2557},
+    ]
+    
+    @staticmethod
+    def _tagging_client(tags_by_name):
+        mock_tagging_client = Mock()
+        mock_tagging_client.get_resources.return_value = {'ResourceTagMappingList': [
+            {'ResourceARN': f'arn:aws:logs:us-east-1:123456789012:log-group:{name}',
+             'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+            for name, tags in tags_by_name.items()
+        ], 'PaginationToken': ''}
+        return mock_tagging_client
+    
+    def test_sweep_applies_policy(self):
+        """Test that a sweep holds each log group to its rule, tags included"""
+        logs_client = FakeLogsClient([
+            {'logGroupName': '/aws/cloudtrail/org', 'retentionInDays': 90},
+            {'logGroupName': '/aws/lambda/dev-api', 'retentionInDays': 90},
+            {'logGroupName': '/aws/lambda/dev-worker', 'retentionInDays': 14},
+            {'logGroupName': '/aws/lambda/prod-api', 'retentionInDays': 400},
+            {'logGroupName': '/app/ledger', 'retentionInDays': 400},
+        ])
+        tagging_client = self._tagging_client({
+            '/app/ledger': {'retention-class': 'audit', 'owner': 'finance'},
+            '/aws/lambda/prod-api': {'owner': 'platform'},
+        })
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        clients = {'config': mock_config_client, 'resourcegroupstaggingapi': tagging_client}
+        
+        with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(self.POLICY)}), \
+             patch('lambda_function.boto3.client', side_effect=lambda service_name, **kwargs: clients[service_name]):
+            evaluations = evaluate_all_log_groups(logs_client, 30, self.EVENT)
+        
+        by_id = {e['ComplianceResourceId']: (e['ComplianceType'], e['Annotation']) for e in evaluations}
+        assert by_id['/aws/cloudtrail/org'][0] == 'NON_COMPLIANT'
+        assert 'Minimum required: 365 days' in by_id['/aws/cloudtrail/org'][1]
+        assert by_id['/aws/lambda/dev-api'][0] == 'NON_COMPLIANT'
+        assert 'Maximum allowed: 30 days' in by_id['/aws/lambda/dev-api'][1]
+        assert by_id['/aws/lambda/dev-worker'][0] == 'COMPLIANT'
+        assert 'meets minimum requirement of 30 days' in by_id['/aws/lambda/prod-api'][1]
+        assert by_id['/app/ledger'][0] == 'NON_COMPLIANT'
+        assert 'Minimum required: 2557 days' in by_id['/app/ledger'][1]
+        tagging_client.get_resources.assert_called_once_with(
+            ResourceTypeFilters=['logs:log-group'], TagFilters=[{'Key': 'retention-class'}], ResourcesPerPage=100
+        )
+    
+    def test_no_tag_lookup_without_tag_rules(self):
+        """Test that the Tagging API is not called when no rule matches on tags"""
+        logs_client = FakeLogsClient([{'logGroupName': '/aws/cloudtrail/org', 'retentionInDays': 400}])
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(self.POLICY[:2])}), \
+             patch('lambda_function.boto3.client', return_value=mock_config_client) as mock_boto_client:
+            evaluations = evaluate_all_log_groups(logs_client, 30, self.EVENT)
+        
+        assert evaluations[0]['ComplianceType'] == 'COMPLIANT'
+        assert [call[0][0] for call in mock_boto_client.call_args_list] == ['config']
+    
+    def test_tag_lookup_pages(self):
+        """Test that tag pages are followed and only policy tag keys are kept"""
+        tagging_client = Mock()
+        tagging_client.get_resources.side_effect = [
+            {'ResourceTagMappingList': [{
+                'ResourceARN': 'arn:aws:logs:us-east-1:123456789012:log-group:/a',
+                'Tags': [{'Key': 'team', 'Value': 'x'}, {'Key': 'cost-center', 'Value': '42'}]
+            }], 'PaginationToken': 'next'},
+            {'ResourceTagMappingList': [{
+                'ResourceARN': 'arn:aws:logs:us-east-1:123456789012:log-group:/b:*',
+                'Tags': [{'Key': 'team', 'Value': 'y'}]
+            }], 'PaginationToken': ''},
+        ]
+        
+        with patch('lambda_function.boto3.client', return_value=tagging_client):
+            tags = lambda_function.load_log_group_tags(frozenset(['team']))
+        
+        assert tags == {'/a': {'team': 'x'}, '/b': {'team': 'y'}}
+        assert tagging_client.get_resources.call_args_list[1][1]['PaginationToken'] == 'next'
+    
+    def test_tag_rules_on_different_keys(self):
+        """Test that log groups carrying only some policy tag keys get their tags, and multi-tag rules match"""
+        tags_by_name = {
+            '/app/ledger': {'retention-class': 'audit'},
+            '/app/payments': {'team': 'payments', 'env': 'prod'},
+            '/app/payments-dev': {'team': 'payments', 'env': 'dev'},
+        }
+        
+        def get_resources(ResourceTypeFilters, TagFilters, ResourcesPerPage, PaginationToken=None):
+            # GetResources returns only resources carrying every filtered key
+            keys = {tag_filter['Key'] for tag_filter in TagFilters}
+            return {'ResourceTagMappingList': [
+                {'ResourceARN': f'arn:aws:logs:us-east-1:123456789012:log-group:{name}',
+                 'Tags': [{'Key': key, 'Value': value} for key, value in tags.items()]}
+                for name, tags in tags_by_name.items() if keys <= tags.keys()
+            ], 'PaginationToken': ''}
+        
+        tagging_client = Mock()
+        tagging_client.get_resources.side_effect = get_resources
+        logs_client = FakeLogsClient([{'logGroupName': name, 'retentionInDays': 400} for name in tags_by_name])
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        clients = {'config': mock_config_client, 'resourcegroupstaggingapi': tagging_client}
+        policy = [
+            {'Tags': {'team': 'payments', 'env': 'prod'}, 'MinimumRetentionDays': 2557},
+            {'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 3650},
+        ]
+        
+        with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(policy)}), \
+             patch('lambda_function.boto3.client', side_effect=lambda service_name, **kwargs: clients[service_name]):
+            evaluations = evaluate_all_log_groups(logs_client, 30, self.EVENT)
+        
+        by_id = {e['ComplianceResourceId']: e['Annotation'] for e in evaluations}
+        assert 'Minimum required: 3650 days' in by_id['/app/ledger']
+        assert 'Minimum required: 2557 days' in by_id['/app/payments']
+        assert 'meets minimum requirement of 30 days' in by_id['/app/payments-dev']
+        assert tagging_client.get_resources.call_count == 3
+    
+    def test_change_notification_uses_item_tags(self):
+        """Test that a changed log group is matched on the tags of its configuration item"""
+        policy = lambda_function.RetentionPolicy(self.POLICY)
+        configuration_item = {
+            'resourceType': 'AWS::Logs::LogGroup',
+            'resourceId': '/app/ledger',
+            'configurationItemCaptureTime': '2024-01-01T00:00:00Z',
+            'configuration': {'retentionInDays': 400},
+            'tags': {'retention-class': 'audit'}
+        }
+        
+        evaluation = evaluate_single_log_group(configuration_item, 30, policy=policy)
+        
+        assert evaluation['ComplianceType'] == 'NON_COMPLIANT'
+        assert 'Minimum required: 2557 days' in evaluation['Annotation']
+        assert evaluate_single_log_group(dict(configuration_item, tags={}), 30, policy=policy)['ComplianceType'] == 'COMPLIANT'
+    
+    def test_oversized_item_keeps_tags(self):
+        """Test that configuration items fetched from history keep their tags for tag rules"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_config_client.get_resource_config_history.return_value = {'configurationItems': [{
+            'resourceType': 'AWS::Logs::LogGroup',
+            'resourceId': '/app/ledger',
+            'configurationItemCaptureTime': '2024-01-01T00:00:00Z',
+            'configuration': '{"retentionInDays": 400}',
+            'tags': {'retention-class': 'audit'}
+        }]}
+        invoking_event = {
+            'messageType': 'OversizedConfigurationItemChangeNotification',
+            'configurationItemSummary': {
+                'resourceType': 'AWS::Logs::LogGroup',
+                'resourceId': '/app/ledger',
+                'configurationItemCaptureTime': '2024-01-01T00:00:00Z'
+            }
+        }
+        
+        configuration_item = get_configuration_item(invoking_event, mock_config_client)
+        
+        assert configuration_item['tags'] == {'retention-class': 'audit'}
+    
+    def test_policy_change_resubmits_snapshot(self, tmp_path):
+        """Test that an incremental sweep re-submits every log group after the policy changes"""
+        log_groups = {'/aws/cloudtrail/org': 400, '/app/api': 30}
+        TestIncrementalEvaluation._sweep(log_groups, tmp_path)
+        assert TestIncrementalEvaluation._sweep(log_groups, tmp_path) == []
+        
+        with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(self.POLICY[:1])}):
+            submitted = TestIncrementalEvaluation._sweep(log_groups, tmp_path)
+            assert {e['ComplianceResourceId'] for e in submitted} == set(log_groups)
+            assert TestIncrementalEvaluation._sweep(log_groups, tmp_path) == []
+    
+    def test_policy_sources(self, tmp_path):
+        """Test that the rule parameter wins over the environment, which wins over the policy file"""
+        policy_file = tmp_path / 'policy.json'
+        policy_file.write_text(json.dumps(self.POLICY))
+        
+        with patch.dict(os.environ, {'RETENTION_POLICY_FILE': str(policy_file)}):
+            assert len(lambda_function.load_retention_policy({}).rules) == 3
+            with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(self.POLICY[:2])}):
+                assert len(lambda_function.load_retention_policy({}).rules) == 2
+                parameters = {'RetentionPolicy': json.dumps(self.POLICY[:1])}
+                assert len(lambda_function.load_retention_policy(parameters).rules) == 1
+    
+    @patch('lambda_function.boto3.client')
+    def test_invalid_policy_reported(self, mock_boto_client):
+        """Test that an invalid policy fails the sweep with an account-level NOT_APPLICABLE evaluation"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_boto_client.return_value = mock_config_client
+        event = dict(self.EVENT, ruleParameters=json.dumps({'RetentionPolicy': '[{"Prefix": "/a"}]'}))
+        
+        lambda_handler(event, {})
+        
+        evaluation = mock_config_client.put_evaluations.call_args[1]['Evaluations'][0]
+        assert evaluation['ComplianceResourceType'] == 'AWS::::Account'
+        assert 'sets neither' in evaluation['Annotation']
+
+
+class TestConfigInventory:
+    """Test sweeps that read the log group inventory from Config advanced queries"""
+    
+    EVENT = TestIncrementalEvaluation.EVENT
+    
+    class QueryConfigClient(TestReconciliationIndex.FakeConfigClient):
+        """Config stand-in answering advanced queries from recorded log groups"""
+        
+        def __init__(self, log_groups, previously_evaluated=()):
+            super().__init__(previously_evaluated)
+            self.log_groups = log_groups
+            self.expressions = []
+            self.calls['select_resource_config'] = 0
+        
+        def select_resource_config(self, Expression, Limit, NextToken='0'):
+            self.calls['select_resource_config'] += 1
+            self.expressions.append(Expression)
+            start = int(NextToken)
+            results = []
+            for log_group in self.log_groups[start:start + Limit]:
+                result = {'resourceId': log_group['logGroupName'], 'configuration': {}}
+                if 'retentionInDays' in log_group:
+                    result['configuration']['retentionInDays'] = log_group['retentionInDays']
+                if 'tags' in Expression:
+                    result['tags'] = [{'key': key, 'value': value} for key, value in log_group.get('tags', {}).items()]
+                results.append(json.dumps(result))
+            response = {'Results': results}
+            if start + Limit < len(self.log_groups):
+                response['NextToken'] = str(start + Limit)
+            return response
+    
+    LOG_GROUPS = [
+        {'logGroupName': f'/aws/lambda/fn-{index:03d}', 'retentionInDays': 7 if index % 3 else 30}
+        for index in range(230)
+    ] + [{'logGroupName': '/app/ledger', 'tags': {'retention-class': 'audit'}}]
+    
+    def _evaluate(self, environment, log_groups=LOG_GROUPS, progress=None):
+        config_client = self.QueryConfigClient(log_groups)
+        logs_client = Mock()
+        with patch.dict(os.environ, environment), \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            evaluations = [
+                lambda_function.materialize_evaluation(evaluation)
+                for evaluation in iter_log_group_evaluations(logs_client, 30, self.EVENT, progress=progress,
+                                                             reconcile=False)
+            ]
+        logs_client.get_paginator.assert_not_called()
+        return evaluations, config_client
+    
+    def test_matches_logs_listing(self):
+        """Test that the advanced query yields the same evaluations as describe_log_groups"""
+        evaluations, config_client = self._evaluate({'INVENTORY_SOURCE': 'config'})
+        
+        with patch('lambda_function.boto3.client', return_value=Mock()):
+            expected = [
+                lambda_function.materialize_evaluation(evaluation)
+                for evaluation in iter_log_group_evaluations(FakeLogsClient(self.LOG_GROUPS), 30, self.EVENT,
+                                                             reconcile=False)
+            ]
+        assert sorted(evaluations, key=lambda e: e['ComplianceResourceId']) == \
+            sorted(expected, key=lambda e: e['ComplianceResourceId'])
+        assert config_client.calls['select_resource_config'] == 3
+        assert config_client.expressions[0] == (
+            "SELECT resourceId, configuration.retentionInDays WHERE resourceType = 'AWS::Logs::LogGroup'"
+        )
+    
+    def test_fields_selected_only_when_used(self):
+        """Test that storage, class and tags are selected only for a maximum, class filter and tag rules"""
+        policy = [{'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 2557}]
+        environment = {'INVENTORY_SOURCE': 'config', 'MAXIMUM_RETENTION_DAYS': '365', 'LOG_GROUP_CLASS': 'STANDARD',
+                       'RETENTION_POLICY': json.dumps(policy)}
+        
+        evaluations, config_client = self._evaluate(environment)
+        
+        assert config_client.expressions[0] == (
+            "SELECT resourceId, configuration.retentionInDays, configuration.storedBytes, configuration.creationTime, "
+            "configuration.logGroupClass, tags WHERE resourceType = 'AWS::Logs::LogGroup'"
+        )
+        assert len(evaluations) == len(self.LOG_GROUPS)
+    
+    def test_tag_rules_use_query_tags(self):
+        """Test that tags come from the advanced query, without calling the Tagging API"""
+        policy = [{'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 2557}]
+        
+        with patch('lambda_function.load_log_group_tags') as mock_load_tags:
+            evaluations, _ = self._evaluate({'INVENTORY_SOURCE': 'config', 'RETENTION_POLICY': json.dumps(policy)})
+        
+        mock_load_tags.assert_not_called()
+        assert evaluations[-1]['ComplianceResourceId'] == '/app/ledger'
+        assert 'Minimum required: 2557 days' in evaluations[-1]['Annotation']
+    
+    def test_resumes_from_query_position(self):
+        """Test that a checkpointed query position resumes at its NextToken and a finished one lists nothing"""
+        progress = lambda_function.SweepProgress(['config', '200'])
+        evaluations, _ = self._evaluate({'INVENTORY_SOURCE': 'config'}, progress=progress)
+        assert [e['ComplianceResourceId'] for e in evaluations][0] == '/aws/lambda/fn-200'
+        assert progress.position == ['config', None] and progress.complete
+        
+        evaluations, config_client = self._evaluate({'INVENTORY_SOURCE': 'config'}, progress=progress)
+        assert evaluations == []
+        assert config_client.calls['select_resource_config'] == 0
+    
+    def test_logs_position_restarts_query(self):
+        """Test that a checkpoint from describe_log_groups listing restarts the query, skipping evaluated log groups"""
+        progress = lambda_function.SweepProgress([0, 'token'], ['/aws/lambda/fn-000'])
+        
+        evaluations, _ = self._evaluate({'INVENTORY_SOURCE': 'config'}, progress=progress)
+        
+        assert len(evaluations) == len(self.LOG_GROUPS) - 1
+    
+    def test_rule_parameter_selects_source(self):
+        """Test that the InventorySource rule parameter overrides the environment and is validated"""
+        event = dict(self.EVENT, ruleParameters=json.dumps({'InventorySource': 'Config'}))
+        with patch.dict(os.environ, {'INVENTORY_SOURCE': 'logs'}):
+            assert EvaluationContext(event).inventory_source == 'config'
+        with patch.dict(os.environ, {}, clear=True):
+            assert EvaluationContext(self.EVENT).inventory_source == 'logs'
+        with pytest.raises(ValueError, match='Invalid inventory source'):
+            EvaluationContext(dict(self.EVENT, ruleParameters=json.dumps({'InventorySource': 'ec2'}))).inventory_source
+    
+    @patch('lambda_function.boto3.client')
+    def test_invalid_source_reported(self, mock_boto_client):
+        """Test that the handler reports an invalid InventorySource as an account-level NOT_APPLICABLE evaluation"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_boto_client.return_value = mock_config_client
+        event = dict(self.EVENT, ruleParameters=json.dumps({'InventorySource': 'aggregator'}))
+        
+        lambda_handler(event, {})
+        
+        evaluations = mock_config_client.put_evaluations.call_args[1]['Evaluations']
+        assert [evaluation['ComplianceType'] for evaluation in evaluations] == ['NOT_APPLICABLE']
+        assert evaluations[0]['ComplianceResourceType'] == 'AWS::::Account'
+        assert 'Invalid inventory source' in evaluations[0]['Annotation']
+    
+    def test_scheduled_sweep_reconciles_deletions(self, tmp_path):
+        """Test that a scheduled sweep from Config still marks log groups Config no longer records"""
+        config_client = self.QueryConfigClient(self.LOG_GROUPS[:3], previously_evaluated=[
+            '/aws/lambda/fn-000', '/aws/lambda/gone'
+        ])
+        submitted = []
+        config_client.put_evaluations = lambda Evaluations, ResultToken: submitted.extend(Evaluations) or {
+            'FailedEvaluations': []
+        }
+        
+        with patch.dict(os.environ, {'INVENTORY_SOURCE': 'config', 'STATE_DIRECTORY': str(tmp_path)}), \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            run_scheduled_sweep(config_client, Mock(), 30, self.EVENT)
+        
+        by_id = {e['ComplianceResourceId']: e['ComplianceType'] for e in submitted}
+        assert by_id == {'/aws/lambda/fn-000': 'COMPLIANT', '/aws/lambda/fn-001': 'NON_COMPLIANT',
+                         '/aws/lambda/fn-002': 'NON_COMPLIANT', '/aws/lambda/gone': 'NOT_APPLICABLE'}
+
+
+class TestPrefetchedListing:
+    """Test paging listing units in parallel while yielding them in order"""
+    
+    def test_items_in_producer_order(self):
+        """Test that items come out in producer order however the producers interleave"""
+        def producer(index):
+            for item in range(3):
+                time.sleep(0.001 * (5 - index))
+                yield (index, item)
+        
+        producers = [lambda index=index: producer(index) for index in range(5)]
+        
+        assert list(lambda_function.iter_prefetched(producers, 3, 2)) == [
+            (index, item) for index in range(5) for item in range(3)
+        ]
+    
+    def test_producer_error_raised_at_its_turn(self):
+        """Test that a failing producer raises after the items of earlier producers"""
+        def failing():
+            yield 'partial'
+            raise ClientError({'Error': {'Code': 'AccessDeniedException', 'Message': 'no'}}, 'DescribeLogGroups')
+        
+        items = lambda_function.iter_prefetched([lambda: iter(['first']), failing], 2, 2)
+        
+        assert next(items) == 'first'
+        assert next(items) == 'partial'
+        with pytest.raises(ClientError):
+            next(items)
+    
+    def test_closing_stops_producers(self):
+        """Test that abandoning the listing stops producers instead of fetching every page"""
+        produced = []
+        
+        def endless():
+            for item in range(10_000):
+                produced.append(item)
+                yield item
+        
+        items = lambda_function.iter_prefetched([endless, endless], 2, 2)
+        assert next(items) == 0
+        items.close()
+        
+        assert len(produced) < 10
+    
+    def test_rate_limit_scope_inherited(self):
+        """Test that producers share the caller's rate limiters"""
+        scopes = []
+        
+        def producer():
+            scopes.append(retry.get_rate_limit_scope())
+            yield None
+        
+        with retry.rate_limit_scope(('111111111111', 'eu-west-1')):
+            list(lambda_function.iter_prefetched([producer, producer], 2, 1))
+        
+        assert scopes == [('111111111111', 'eu-west-1')] * 2
+
+
+class TestResumableSweep:
+    """Test checkpointed sweeps that continue in a follow-up invocation"""
+    
+    EVENT = TestShardedSweep.EVENT
+    
+    class FakeContext:
+        """Lambda context whose remaining time drops by a fixed step on every check"""
+        
+        invoked_function_arn = 'arn:aws:lambda:ca-central-1:123456789012:function:test-rule-function'
+        
+        def __init__(self, remaining_ms, step_ms):
+            self.remaining_ms = remaining_ms
+            self.step_ms = step_ms
+        
+        def get_remaining_time_in_millis(self):
+            self.remaining_ms -= self.step_ms
+            return self.remaining_ms
+    
+    def _invoke(self, logs_client, config_client, context, tmp_path, event=None):
+        continuations = []
+        invoker = Mock(invoke=continuations.append)
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path)}), \
+             patch('lambda_function.boto3.client', return_value=config_client), \
+             patch('lambda_function.get_self_invoker', return_value=invoker):
+            run_scheduled_sweep(config_client, logs_client, 30, event or dict(self.EVENT), context)
+        return continuations
+    
+    def test_sweep_checkpoints_and_resumes(self, tmp_path):
+        """Test that a sweep stops before timeout and the follow-up skips finished pages"""
+        names = [f'/app/log{i:03d}' for i in range(250)]
+        logs_client = FakeLogsClient([{'logGroupName': name, 'retentionInDays': 30} for name in names])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': [
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': '/app/deleted'}}}
+        ]}
+        
+        # 60s margin: the third page check drops below it
+        continuations = self._invoke(logs_client, config_client, self.FakeContext(80_000, 10_000), tmp_path)
+        
+        assert continuations == [self.EVENT]
+        checkpoint = FileStateStore(str(tmp_path)).load('test-rule/checkpoint.json')
+        assert checkpoint['position'] == [0, '150']
+        assert len(checkpoint['evaluated_resources']) == 150
+        first_run = [e['ComplianceResourceId'] for c in config_client.put_evaluations.call_args_list for e in c[1]['Evaluations']]
+        # Everything listed before stopping was flushed, including the partial batch
+        assert first_run == names[:150]
+        
+        logs_client.requests.clear()
+        config_client.put_evaluations.reset_mock()
+        continuations = self._invoke(logs_client, config_client, self.FakeContext(300_000, 1), tmp_path, continuations[0])
+        
+        assert continuations == []
+        assert logs_client.requests[0] == ('', 150)
+        second_run = [e['ComplianceResourceId'] for c in config_client.put_evaluations.call_args_list for e in c[1]['Evaluations']]
+        assert second_run == names[150:] + ['/app/deleted']
+        assert FileStateStore(str(tmp_path)).load('test-rule/checkpoint.json') is None
+        assert set(FileStateStore(str(tmp_path)).load('test-rule/snapshot.json')['log_groups']) == set(names)
+    
+    def test_checkpoint_from_another_sweep_is_ignored(self, tmp_path):
+        """Test that a leftover checkpoint for a different result token starts over"""
+        FileStateStore(str(tmp_path)).save('test-rule/checkpoint.json', {
+            'result_token': 'yesterday', 'position': [1, None], 'evaluated_resources': [], 'current_snapshot': {}
+        })
+        logs_client = FakeLogsClient([{'logGroupName': '/a', 'retentionInDays': 30}])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        self._invoke(logs_client, config_client, None, tmp_path)
+        
+        assert config_client.put_evaluations.call_args[1]['Evaluations'][0]['ComplianceResourceId'] == '/a'
+        assert FileStateStore(str(tmp_path)).load('test-rule/checkpoint.json') is None
+    
+    def test_no_checkpointing_without_state_store(self):
+        """Test that without a store the sweep runs to completion regardless of remaining time"""
+        logs_client = FakeLogsClient([{'logGroupName': f'/log{i}', 'retentionInDays': 30} for i in range(120)])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        with patch('lambda_function.boto3.client', return_value=config_client):
+            count = run_scheduled_sweep(config_client, logs_client, 30, dict(self.EVENT), self.FakeContext(1, 1))
+        
+        assert count == 120
+
+
+class TestStreamingSweep:
+    """Test streaming evaluate-and-submit pipeline for scheduled sweeps"""
+    
+    @staticmethod
+    def _pages(page_count, page_size):
+        return [
+            {'logGroups': [
+                {'logGroupName': f'/page{p}/log{i}', 'retentionInDays': 30} for i in range(page_size)
+            ]}
+            for p in range(page_count)
+        ]
+    
+    @patch('lambda_function.boto3.client')
+    def test_batches_flushed_before_pagination_finishes(self, mock_boto_client):
+        """Test that full batches are submitted while later pages are still unread"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_logs_client = Mock()
+        mock_boto_client.side_effect = [mock_config_client, mock_logs_client, mock_config_client]
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        submitted_before_page = []
+        
+        def paginate():
+            for page in self._pages(3, 100):
+                submitted_before_page.append(mock_config_client.put_evaluations.call_count)
+                yield page
+        
+        mock_logs_client.get_paginator.return_value.paginate.side_effect = paginate
+        
+        event = {
+            'invokingEvent': json.dumps({
+                'messageType': 'ScheduledNotification',
+                'notificationCreationTime': '2024-01-01T00:00:00Z'
+            }),
+            'resultToken': 'test-token',
+            'configRuleName': 'test-rule'
+        }
+        
+        result = lambda_handler(event, {})
+        
+        # Each page's batch is flushed before the next page is requested
+        assert submitted_before_page == [0, 1, 2]
+        assert mock_config_client.put_evaluations.call_count == 3
+        assert json.loads(result['body'])['evaluations_count'] == 300
+    
+    @patch('lambda_function.boto3.client')
+    def test_failure_mid_sweep_keeps_flushed_batches(self, mock_boto_client):
+        """Test that a late failure only loses the unsubmitted partial batch"""
+        mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_logs_client = Mock()
+        mock_boto_client.side_effect = [mock_config_client, mock_logs_client]
+        
+        def paginate():
+            yield from self._pages(2, 100)
+            yield {'logGroups': [{'logGroupName': '/partial/log', 'retentionInDays': 30}]}
+            raise Exception("Task timed out")
+        
+        mock_logs_client.get_paginator.return_value.paginate.side_effect = paginate
+        
+        event = {
+            'invokingEvent': json.dumps({
+                'messageType': 'ScheduledNotification',
+                'notificationCreationTime': '2024-01-01T00:00:00Z'
+            }),
+            'accountId': '123456789012',
+            'resultToken': 'test-token'
+        }
+        
+        lambda_handler(event, {})
+        
+        calls = mock_config_client.put_evaluations.call_args_list
+        # Two full batches, then the account-level error evaluation
+        assert len(calls) == 3
+        assert len(calls[0][1]['Evaluations']) == 100
+        assert len(calls[1][1]['Evaluations']) == 100
+        assert calls[2][1]['Evaluations'][0]['ComplianceType'] == 'NOT_APPLICABLE'
+    
+    def test_iter_log_group_evaluations_is_lazy(self):
+        """Test that no pages are read until evaluations are consumed"""
+        mock_logs_client = Mock()
+        
+        generator = iter_log_group_evaluations(mock_logs_client, 30, {'invokingEvent': '{}'})
+        
+        mock_logs_client.get_paginator.assert_not_called()
+        generator.close()
+
+
+class TestAsyncEngine:
+    """Test the asyncio sweep engine against the synchronous one"""
+    
+    EVENT = TestIncrementalEvaluation.EVENT
+    NAMES = [f'/aws/lambda/fn-{index:03d}' for index in range(230)]
+    
+    class RecordingConfigClient(TestReconciliationIndex.FakeConfigClient):
+        """Config stand-in that keeps every submitted batch"""
+        
+        def __init__(self, previously_evaluated, fail_batches=()):
+            super().__init__(previously_evaluated)
+            self.batches = []
+            self.fail_batches = set(fail_batches)
+            self.lock = threading.Lock()
+        
+        def put_evaluations(self, Evaluations, ResultToken):
+            with self.lock:
+                self.calls['put_evaluations'] += 1
+                if self.calls['put_evaluations'] in self.fail_batches:
+                    raise ClientError({'Error': {'Code': 'InternalFailure', 'Message': 'boom'}}, 'PutEvaluations')
+                self.batches.append(Evaluations)
+            return {'FailedEvaluations': []}
+    
+    def _sweep(self, engine, previously_evaluated, names=NAMES, **sweep_options):
+        """Run one sweep with an engine and return its count and evaluations by resource ID"""
+        lambda_function.CLIENT_CACHE.clear()
+        config_client = self.RecordingConfigClient(previously_evaluated)
+        logs_client = FakeLogsClient([
+            {'logGroupName': name, 'retentionInDays': 7 if index % 3 else 30} for index, name in enumerate(names)
+        ])
+        with patch.dict(os.environ, {'EVALUATION_ENGINE': engine, 'SUBMIT_CONCURRENCY': '3'}), \
+             patch('lambda_function.boto3.client', return_value=config_client):
+            count = lambda_function.sweep_and_submit(config_client, logs_client, 30, self.EVENT, **sweep_options)
+        evaluations = {
+            evaluation['ComplianceResourceId']: (evaluation['ComplianceType'], evaluation.get('Annotation'))
+            for batch in config_client.batches for evaluation in batch
+        }
+        return count, evaluations, config_client
+    
+    def test_engine_selection(self):
+        """Test that the engine defaults to sync and is read case-insensitively"""
+        with patch.dict(os.environ, {}, clear=True):
+            assert lambda_function.get_evaluation_engine() == 'sync'
+        with patch.dict(os.environ, {'EVALUATION_ENGINE': 'Async'}):
+            assert lambda_function.get_evaluation_engine() == 'async'
+    
+    def test_matches_sync_with_config_reconciliation(self):
+        """Test that both engines submit the same evaluations, deletions found through Config included"""
+        previously_evaluated = self.NAMES[:200] + ['/aws/lambda/gone-1', '/aws/lambda/gone-2']
+        
+        sync_count, sync_evaluations, sync_client = self._sweep('sync', previously_evaluated)
+        async_count, async_evaluations, async_client = self._sweep('async', previously_evaluated)
+        
+        assert async_count == sync_count == 232
+        assert async_evaluations == sync_evaluations
+        assert async_evaluations['/aws/lambda/gone-1'][0] == 'NOT_APPLICABLE'
+        # The trailing partial batch is shared with the deletions, as in the sync engine
+        assert async_client.calls['put_evaluations'] == sync_client.calls['put_evaluations'] == 3
+        assert async_client.calls['get_compliance_details_by_config_rule'] == 3
+    
+    def test_deletions_added_a_request_at_a_time(self):
+        """Test that deletions reach the batch builder in chunks instead of all at once"""
+        previously_evaluated = [f'/aws/lambda/gone-{index:03d}' for index in range(250)]
+        extend = lambda_function.EvaluationBatchBuilder.extend
+        chunk_sizes = []
+        
+        def recording_extend(builder, evaluations):
+            evaluations = list(evaluations)
+            chunk_sizes.append(len(evaluations))
+            return extend(builder, evaluations)
+        
+        sync_count, sync_evaluations, _ = self._sweep('sync', previously_evaluated)
+        with patch.object(lambda_function.EvaluationBatchBuilder, 'extend', recording_extend):
+            async_count, async_evaluations, _ = self._sweep('async', previously_evaluated)
+        
+        assert async_count == sync_count == 480
+        assert async_evaluations == sync_evaluations
+        assert max(chunk_sizes) <= lambda_function.MAX_EVALUATIONS_PER_REQUEST
+        
+    def test_asyncio_imported_only_by_async_engine(self):
+        """Test that importing the module does not import asyncio for the default engine"""
+        code = 'import sys, lambda_function; print("asyncio" in sys.modules)'
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=os.path.dirname(lambda_function.__file__),
+            capture_output=True, text=True, check=True
+        )
+        
+        assert result.stdout.strip() == 'False'
+    
+    def test_matches_sync_with_snapshot(self):
+        """Test that deletions come from the snapshot without paging through Config"""
+        snapshot = {name: 30 for name in self.NAMES[:10] + ['/aws/lambda/gone']}
+        
+        sync_count, sync_evaluations, _ = self._sweep('sync', [], previous_snapshot=snapshot, current_snapshot={})
+        async_count, async_evaluations, async_client = self._sweep(
+            'async', ['/aws/lambda/ignored'], previous_snapshot=snapshot, current_snapshot={}
+        )
+        
+        assert async_count == sync_count == 231
+        assert async_evaluations == sync_evaluations
+        assert '/aws/lambda/ignored' not in async_evaluations
+        assert async_client.calls['get_compliance_details_by_config_rule'] == 0
+    
+    def test_incomplete_sweep_skips_reconciliation(self):
+        """Test that a sweep stopped at its deadline leaves deletions for the sweep that completes"""
+        progress = lambda_function.SweepProgress()
+        stops = iter([False, True])
+        
+        count, evaluations, config_client = self._sweep(
+            'async', ['/aws/lambda/gone'], progress=progress, should_stop=lambda: next(stops, True)
+        )
+        
+        assert not progress.complete
+        assert '/aws/lambda/gone' not in evaluations
+        assert count == len(evaluations) < len(self.NAMES)
+        assert config_client.calls['get_compliance_details_by_config_rule'] == 0
+    
+    def test_failed_batches_raised_after_the_rest_are_submitted(self):
+        """Test that a failed batch does not stop the others and is raised with its number"""
+        config_client = self.RecordingConfigClient([], fail_batches={2})
+        logs_client = FakeLogsClient([{'logGroupName': name, 'retentionInDays': 30} for name in self.NAMES])
+        
+        with patch.dict(os.environ, {'EVALUATION_ENGINE': 'async', 'SUBMIT_CONCURRENCY': '1'}), \
+             patch('lambda_function.boto3.client', return_value=config_client), \
+             pytest.raises(EvaluationSubmissionError) as exc_info:
+            lambda_function.sweep_and_submit(config_client, logs_client, 30, self.EVENT)
+        
+        assert [batch_number for batch_number, _ in exc_info.value.errors] == [2]
+        assert exc_info.value.batch_count == 3
+        assert sum(len(batch) for batch in config_client.batches) == 130
+    
+    def test_rate_limit_scope_inherited(self):
+        """Test that worker threads use the caller's rate limiters"""
+        scopes = set()
+        config_client = self.RecordingConfigClient([])
+        put_evaluations = config_client.put_evaluations
+        
+        def put_in_scope(**kwargs):
+            scopes.add(retry.get_rate_limit_scope())
+            return put_evaluations(**kwargs)
+        
+        config_client.put_evaluations = put_in_scope
+        logs_client = FakeLogsClient([{'logGroupName': name} for name in self.NAMES])
+        
+        with patch.dict(os.environ, {'EVALUATION_ENGINE': 'async'}), \
+             patch('lambda_function.boto3.client', return_value=config_client), \
+             retry.rate_limit_scope(('111111111111', 'eu-west-1')):
+            lambda_function.sweep_and_submit(config_client, logs_client, 30, self.EVENT)
+        
+        assert scopes == {('111111111111', 'eu-west-1')}
+
+
+class TestClientReuse:
+    """Test that AWS clients are created once per container and reused by warm invocations"""
+    
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00Z'
+        }),
+        'resultToken': 'test-token',
+        'configRuleName': 'test-rule'
+    }
+    
+    @patch('lambda_function.boto3.client')
+    def test_clients_created_once_across_invocations(self, mock_boto_client):
+        """Test that repeated invocations reuse the clients built by the first one"""
+        logs_client = FakeLogsClient([{'logGroupName': '/app/one', 'retentionInDays': 30}])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        mock_boto_client.side_effect = lambda service_name, **kwargs: (
+            logs_client if service_name == 'logs' else config_client
+        )
+        
+        for _ in range(3):
+            lambda_handler(dict(self.EVENT), {})
+        
+        created = [call[0][0] for call in mock_boto_client.call_args_list]
+        assert sorted(created) == ['config', 'logs']
+        assert config_client.put_evaluations.call_count == 3
+    
+    @patch('lambda_function.boto3.client')
+    def test_client_config_sized_for_submit_concurrency(self, mock_boto_client):
+        """Test that clients keep enough pooled keep-alive connections for every submit worker"""
+        with patch.dict(os.environ, {'SUBMIT_CONCURRENCY': '16'}):
+            lambda_function.get_client('config')
+        
+        client_config = mock_boto_client.call_args[1]['config']
+        assert client_config.max_pool_connections == 16 + lambda_function.CLIENT_POOL_HEADROOM
+        assert client_config.tcp_keepalive is True
+
+class TestHybridMode:
+    """Test change-triggered evaluation with infrequent scheduled reconciliation"""
+    
+    @staticmethod
+    def _scheduled_event(timestamp):
+        return {
+            'invokingEvent': json.dumps({
+                'messageType': 'ScheduledNotification',
+                'notificationCreationTime': timestamp
+            }),
+            'resultToken': f'token-{timestamp}',
+            'configRuleName': 'test-rule'
+        }
+    
+    def _run(self, tmp_path, timestamp, interval='7'):
+        logs_client = FakeLogsClient([{'logGroupName': '/app/one', 'retentionInDays': 30}])
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path), 'RECONCILIATION_INTERVAL_DAYS': interval}), \
+             patch('lambda_function.boto3.client', side_effect=lambda service_name, **kwargs: (
+                 logs_client if service_name == 'logs' else config_client)):
+            result = lambda_handler(self._scheduled_event(timestamp), {})
+        return json.loads(result['body'])['evaluations_count']
+    
+    def test_sweeps_only_when_reconciliation_due(self, tmp_path):
+        """Test that daily notifications between reconciliation sweeps are skipped"""
+        runs = [
+            self._run(tmp_path, f'2024-03-{day:02d}T00:0{day % 5}:00Z')
+            for day in range(1, 16)
+        ]
+        
+        # Day 1 sweeps, days 2-7 skip, day 8 sweeps despite arriving a few minutes early, then day 15
+        assert [day for day, count in enumerate(runs, 1) if count] == [1, 8, 15]
+        document = FileStateStore(str(tmp_path)).load('test-rule/reconciliation.json')
+        assert document == {'completed_at': '2024-03-15T00:00:00Z'}
+    
+    def test_every_notification_sweeps_without_interval(self, tmp_path):
+        """Test that scheduled mode (interval 0) keeps sweeping daily and records nothing"""
+        runs = [self._run(tmp_path, f'2024-03-0{day}T00:00:00Z', interval='0') for day in range(1, 4)]
+        
+        assert runs == [1, 1, 1]
+        assert not (tmp_path / 'test-rule' / 'reconciliation.json').exists()
+    
+    def test_unreadable_reconciliation_record_runs_sweep(self, tmp_path):
+        """Test that a corrupt reconciliation record never suppresses a sweep"""
+        (tmp_path / 'test-rule').mkdir()
+        (tmp_path / 'test-rule' / 'reconciliation.json').write_text('{"completed_at": 5}')
+        
+        assert self._run(tmp_path, '2024-03-01T00:00:00Z') == 1
+    
+    def test_interrupted_sweep_is_not_recorded(self, tmp_path):
+        """Test that only a completed sweep postpones the next reconciliation"""
+        store = FileStateStore(str(tmp_path))
+        event = self._scheduled_event('2024-03-01T00:00:00Z')
+        
+        with patch.dict(os.environ, {'RECONCILIATION_INTERVAL_DAYS': '7'}):
+            assert lambda_function.is_reconciliation_due(store, event)
+            lambda_function.record_reconciliation(store, event)
+            assert not lambda_function.is_reconciliation_due(store, self._scheduled_event('2024-03-02T00:00:00Z'))
+            assert lambda_function.is_reconciliation_due(store, self._scheduled_event('2024-03-07T23:30:00Z'))
+    
+    def test_sharded_coordinator_records_dispatch(self, tmp_path):
+        """Test that a sharded reconciliation is recorded when it is dispatched and skipped afterwards"""
+        invoker = Mock()
+        with patch.dict(os.environ, {'STATE_DIRECTORY': str(tmp_path), 'RECONCILIATION_INTERVAL_DAYS': '7',
+                                     'SWEEP_SHARDS': '2'}), \
+             patch('lambda_function.boto3.client'), \
+             patch('lambda_function.get_self_invoker', return_value=invoker):
+            lambda_handler(self._scheduled_event('2024-03-01T00:00:00Z'), {})
+            lambda_handler(self._scheduled_event('2024-03-02T00:00:00Z'), {})
+        
+        assert invoker.invoke.call_count == 2
+
+
+class ChangeStreamReplayer:
+    """
+    Replays a recorded stream of Config change notifications through lambda_handler.
+    
+    Each record holds the Lambda event Config delivered, the configuration items
+    get_resource_config_history returned for oversized notifications, and the expected
+    compliance. Handler latency is measured per event with in-process API stand-ins.
+    """
+    
+    def __init__(self, records):
+        self.records = records
+        self.latencies = []
+        self.results = []
+        self.api_calls = 0
+    
+    @classmethod
+    def from_file(cls, path, repeat=1):
+        """Load a recording, optionally repeated with distinct resource IDs to build a longer stream"""
+        with open(path) as recording:
+            recorded = [json.loads(line) for line in recording if line.strip()]
+        records = []
+        for round_number in range(repeat):
+            for record in recorded:
+                records.append(cls._renamed(record, f'-{round_number}') if round_number else record)
+        return cls(records)
+    
+    @staticmethod
+    def _renamed(record, suffix):
+        """Copy a record with every log group name suffixed so repeated rounds hit distinct resources"""
+        text = json.dumps(record)
+        for name in {'/aws/lambda/orders-api', '/aws/ecs/payments', '/aws/eks/platform/cluster', '/app/batch/nightly'}:
+            text = text.replace(name, name + suffix)
+        return json.loads(text)
+    
+    def replay(self):
+        config_client = Mock()
+        config_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        history = {}
+        
+        def get_resource_config_history(resourceId, **kwargs):
+            return {'configurationItems': [dict(item) for item in history.get(resourceId, [])]}
+        
+        config_client.get_resource_config_history.side_effect = get_resource_config_history
+        
+        # The recorded notifications are minutes apart; replaying them back to back must not
+        # turn the client-side rate limiter into part of the measured latency
+        with patch('lambda_function.boto3.client', return_value=config_client), \
+             patch('lambda_function.time.sleep'):
+            for record in self.records:
+                invoking_event = json.loads(record['event']['invokingEvent'])
+                summary = invoking_event.get('configurationItemSummary')
+                if summary:
+                    history[summary['resourceId']] = record.get('configurationItems', [])
+                
+                calls_before = len(config_client.method_calls)
+                start = time.perf_counter()
+                lambda_handler(record['event'], {})
+                self.latencies.append(time.perf_counter() - start)
+                self.api_calls += len(config_client.method_calls) - calls_before
+                
+                submitted = config_client.put_evaluations.call_args[1]['Evaluations']
+                self.results.append((record['expected'], submitted[0]['ComplianceType']))
+        return self
+    
+    def percentile(self, fraction):
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class TestChangeStreamReplay:
+    """Replay recorded change-notification streams to check results and measure per-event latency"""
+    
+    RECORDING = os.path.join(os.path.dirname(__file__), 'fixtures', 'change_notifications.jsonl')
+    
+    def test_recorded_stream_matches_expected_compliance(self):
+        """Test every recorded notification produces its expected evaluation"""
+        replayer = ChangeStreamReplayer.from_file(self.RECORDING).replay()
+        
+        assert len(replayer.results) == 8
+        assert all(expected == actual for expected, actual in replayer.results)
+        # One put_evaluations per event, plus the history lookup for the oversized notification
+        assert replayer.api_calls == 9
+    
+    @pytest.mark.parametrize('repeat', [125])
+    def test_per_event_latency(self, repeat):
+        """Benchmark per-event handler latency over a 1,000 event replay"""
+        replayer = ChangeStreamReplayer.from_file(self.RECORDING, repeat=repeat).replay()
+        
+        print(f"\n{len(replayer.latencies)} change notifications: "
+              f"p50 {replayer.percentile(0.5) * 1000:.3f}ms, p95 {replayer.percentile(0.95) * 1000:.3f}ms, "
+              f"max {max(replayer.latencies) * 1000:.3f}ms, {replayer.api_calls / len(replayer.latencies):.3f} "
+              f"API calls per event")
+        assert len(replayer.results) == 8 * repeat
+        assert all(expected == actual for expected, actual in replayer.results)
 
 
 class TestLambdaHandler:
@@ -509,6 +2867,7 @@ class TestLambdaHandler:
         # Mock clients
         mock_logs_client = Mock()
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         mock_boto_client.side_effect = [mock_config_client, mock_logs_client, mock_config_client]  # Need config client twice now
         
         # Mock paginator
@@ -572,6 +2931,7 @@ class TestLambdaHandler:
     def test_lambda_handler_error_handling(self, mock_boto_client):
         """Test lambda handler error handling"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         mock_logs_client = Mock()
         mock_boto_client.side_effect = [mock_config_client, mock_logs_client]
         
@@ -605,6 +2965,7 @@ class TestLambdaHandler:
     def test_lambda_handler_configuration_change(self, mock_boto_client):
         """Test lambda handler with configuration change notification"""
         mock_config_client = Mock()
+        mock_config_client.put_evaluations.return_value = {'FailedEvaluations': []}
         mock_boto_client.return_value = mock_config_client
         
         event = {
@@ -655,8 +3016,8 @@ class TestLambdaHandler:
             }
             
             with patch('lambda_function.boto3.client'), \
-                 patch('lambda_function.evaluate_all_log_groups') as mock_eval:
-                mock_eval.return_value = []
+                 patch('lambda_function.iter_log_group_evaluations') as mock_eval:
+                mock_eval.return_value = iter([])
                 
                 lambda_handler(event, {})
                 
@@ -0,0 +1,172 @@
+"""
+Unit tests for the Embedded Metric Format instrumentation
+"""
+import sys
+import os
+import json
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import lambda_function
+from lambda_function import lambda_handler
+from metrics import (
+    MetricsRecorder,
+    NullMetricsBackend,
+    StdoutMetricsBackend,
+    get_metrics_backend,
+    metric_name,
+)
+
+
+class ListMetricsBackend:
+    """Keep emitted records in memory for inspection"""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture(autouse=True)
+def metrics_backend(reset_module_state, monkeypatch):
+    """Capture the EMF records flushed by the rule instead of discarding them"""
+    monkeypatch.setattr(lambda_function.METRICS, 'backend', ListMetricsBackend())
+
+
+def metric_values(records):
+    """Merge the metric values of EMF records into {name: [values]}"""
+    values = {}
+    for record in records:
+        for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']:
+            value = record[metric['Name']]
+            values.setdefault(metric['Name'], []).extend(value if isinstance(value, list) else [value])
+    return values
+
+
+class TestMetricsRecorder:
+    """Test accumulating and formatting metrics"""
+
+    def test_emf_record_structure(self):
+        """Test counters and timings become one valid EMF record with dimensions and properties"""
+        recorder = MetricsRecorder(backend=ListMetricsBackend(), namespace='Test')
+        recorder.count('LogGroups', 3)
+        recorder.count('LogGroups', 2)
+        recorder.record_time('SubmitBatch', 0.25)
+
+        records = recorder.flush({'ConfigRuleName': 'rule'}, {'MessageType': 'ScheduledNotification'})
+
+        assert recorder.backend.records == records
+        assert len(records) == 1
+        record = records[0]
+        assert record['_aws']['CloudWatchMetrics'] == [{
+            'Namespace': 'Test',
+            'Dimensions': [['ConfigRuleName']],
+            'Metrics': [{'Name': 'LogGroups', 'Unit': 'Count'}, {'Name': 'SubmitBatch', 'Unit': 'Milliseconds'}]
+        }]
+        assert record['ConfigRuleName'] == 'rule'
+        assert record['MessageType'] == 'ScheduledNotification'
+        assert record['LogGroups'] == 5
+        assert record['SubmitBatch'] == 250.0
+        assert recorder.build_records() == []
+
+    def test_samples_split_across_records(self):
+        """Test that no record carries more than 100 values for a metric"""
+        recorder = MetricsRecorder(backend=NullMetricsBackend())
+        recorder.count('LogGroups', 1)
+        for _ in range(250):
+            recorder.record_time('DescribeLogGroupsPage', 0.001)
+
+        records = recorder.flush()
+
+        assert len(records) == 3
+        assert [len(record['DescribeLogGroupsPage']) for record in records] == [100, 100, 50]
+        assert 'LogGroups' not in records[1]
+        assert metric_values(records)['LogGroups'] == [1]
+        assert len(metric_values(records)['DescribeLogGroupsPage']) == 250
+
+    def test_iter_timed_excludes_consumer_time(self):
+        """Test that only the time spent producing items is recorded"""
+        recorder = MetricsRecorder(backend=NullMetricsBackend())
+
+        for _ in recorder.iter_timed('Page', range(3)):
+            time.sleep(0.02)
+        for _ in recorder.iter_timed('Reconciliation', range(3), per_item=False):
+            time.sleep(0.02)
+
+        assert len(recorder.timings['Page']) == 3
+        assert len(recorder.timings['Reconciliation']) == 1
+        assert max(recorder.timings['Page'] + recorder.timings['Reconciliation']) < 20
+
+    def test_backend_selection(self):
+        """Test that METRICS_BACKEND=none disables output"""
+        with patch.dict(os.environ, {'METRICS_BACKEND': 'none'}):
+            assert isinstance(get_metrics_backend(), NullMetricsBackend)
+        with patch.dict(os.environ, {}, clear=True):
+            assert isinstance(get_metrics_backend(), StdoutMetricsBackend)
+
+    def test_metric_names(self):
+        """Test operation and compliance identifiers become CamelCase metric names"""
+        assert metric_name('put_evaluations', 'Calls') == 'PutEvaluationsCalls'
+        assert metric_name('NON_COMPLIANT', 'Evaluations') == 'NonCompliantEvaluations'
+
+
+class TestHandlerInstrumentation:
+    """Test the metrics emitted by a rule invocation"""
+
+    EVENT = {
+        'invokingEvent': json.dumps({
+            'messageType': 'ScheduledNotification',
+            'notificationCreationTime': '2024-01-01T00:00:00.000Z'
+        }),
+        'resultToken': 'test-token',
+        'configRuleName': 'test-rule'
+    }
+
+    def _run(self, pages):
+        mock_client = Mock()
+        mock_client.put_evaluations.return_value = {'FailedEvaluations': []}
+        mock_client.get_paginator.return_value.paginate.return_value = pages
+        mock_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': [
+            {'EvaluationResultIdentifier': {'EvaluationResultQualifier': {'ResourceId': '/gone'}}}
+        ]}
+        with patch('lambda_function.boto3.client', return_value=mock_client):
+            lambda_handler(self.EVENT, {})
+        return lambda_function.METRICS.backend.records
+
+    def test_scheduled_sweep_metrics(self):
+        """Test stage timings and counts of a scheduled sweep"""
+        pages = [
+            {'logGroups': [{'logGroupName': f'/ok-{i}', 'retentionInDays': 30} for i in range(150)]},
+            {'logGroups': [{'logGroupName': f'/bad-{i}'} for i in range(40)]},
+        ]
+
+        records = self._run(pages)
+        values = metric_values(records)
+
+        assert records[0]['ConfigRuleName'] == 'test-rule'
+        assert records[0]['MessageType'] == 'ScheduledNotification'
+        assert values['LogGroups'] == [190]
+        assert values['CompliantEvaluations'] == [150]
+        assert values['NonCompliantEvaluations'] == [40]
+        assert values['NotApplicableEvaluations'] == [1]
+        assert values['PutEvaluationsCalls'] == [2]
+        assert values['ApiCalls'] == [5]
+        assert values['ApiRetries'] == [0]
+        assert len(values['DescribeLogGroupsPage']) == 2
+        assert len(values['Reconciliation']) == 1
+        assert len(values['SubmitBatch']) == 2
+        assert len(values['Invocation']) == 1
+
+    def test_event_dump_behind_debug_level(self, capsys):
+        """Test that the full event is only logged at debug level"""
+        self._run([])
+        assert 'test-token' not in capsys.readouterr().out
+
+        with patch.dict(os.environ, {'LOG_LEVEL': 'DEBUG'}):
+            self._run([])
+        assert 'test-token' in capsys.readouterr().out
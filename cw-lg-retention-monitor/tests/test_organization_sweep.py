@@ -0,0 +1,474 @@
+"""
+Unit tests for the multi-account, multi-region organization sweep
+"""
+import sys
+import os
+import json
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+from botocore.exceptions import ClientError
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import organization_sweep
+import retry
+from organization_sweep import (
+    assume_account_role,
+    build_report,
+    get_member_role_arn,
+    list_organization_accounts,
+    organization_handler,
+    run_organization_sweep,
+)
+
+
+class StubLogsClient:
+    """CloudWatch Logs stand-in for one account and region, tracking calls in flight per account"""
+
+    def __init__(self, log_groups, tracker=None, account_id=None, delay=0.0):
+        self.log_groups = log_groups
+        self.tracker = tracker
+        self.account_id = account_id
+        self.delay = delay
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                if client.tracker is not None:
+                    client.tracker.enter(client.account_id)
+                try:
+                    time.sleep(client.delay)
+                finally:
+                    if client.tracker is not None:
+                        client.tracker.exit(client.account_id)
+                yield {'logGroups': client.log_groups}
+
+        return Paginator()
+
+
+class StubTaggingClient:
+    """Resource Groups Tagging API stand-in returning the tagged log groups of one account and region"""
+
+    def __init__(self, account_id, region_name, tags_by_name):
+        self.account_id = account_id
+        self.region_name = region_name
+        self.tags_by_name = tags_by_name
+
+    def get_resources(self, ResourceTypeFilters, TagFilters, ResourcesPerPage):
+        key = TagFilters[0]['Key']
+        return {'ResourceTagMappingList': [
+            {'ResourceARN': f'arn:aws:logs:{self.region_name}:{self.account_id}:log-group:{name}',
+             'Tags': [{'Key': tag_key, 'Value': value} for tag_key, value in tags.items()]}
+            for name, tags in self.tags_by_name.items() if key in tags
+        ]}
+
+
+class ConcurrencyTracker:
+    """Record the highest number of sweeps running at once per account and overall"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = {}
+        self.peak = {}
+        self.total = 0
+        self.peak_total = 0
+
+    def enter(self, account_id):
+        with self.lock:
+            self.running[account_id] = self.running.get(account_id, 0) + 1
+            self.peak[account_id] = max(self.peak.get(account_id, 0), self.running[account_id])
+            self.total += 1
+            self.peak_total = max(self.peak_total, self.total)
+
+    def exit(self, account_id):
+        with self.lock:
+            self.running[account_id] -= 1
+            self.total -= 1
+
+
+class StubSession:
+    """boto3.Session stand-in handing out per-region stub clients for one account"""
+
+    def __init__(self, account_id, inventory, tracker=None, delay=0.0, tags=None):
+        self.account_id = account_id
+        self.inventory = inventory
+        self.tracker = tracker
+        self.delay = delay
+        self.tags = tags or {}
+
+    def client(self, service_name, region_name=None, config=None):
+        if service_name == 'ec2':
+            ec2_client = Mock()
+            ec2_client.describe_regions.return_value = {
+                'Regions': [{'RegionName': region} for region in self.inventory[self.account_id]]
+            }
+            return ec2_client
+        if service_name == 'resourcegroupstaggingapi':
+            return StubTaggingClient(self.account_id, region_name, self.tags.get(self.account_id, {}).get(region_name, {}))
+        log_groups = self.inventory[self.account_id][region_name]
+        if isinstance(log_groups, Exception):
+            raise log_groups
+        return StubLogsClient(log_groups, self.tracker, self.account_id, self.delay)
+
+
+def stub_sts_client(denied=()):
+    """STS stand-in returning credentials tagged with the account whose role was assumed"""
+    sts_client = Mock()
+
+    def assume_role(RoleArn, RoleSessionName):
+        account_id = RoleArn.split(':')[4]
+        if account_id in denied:
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Not authorized'}}, 'AssumeRole')
+        return {'Credentials': {
+            'AccessKeyId': f'AKIA{account_id}',
+            'SecretAccessKey': 'secret',
+            'SessionToken': 'token'
+        }}
+
+    sts_client.assume_role.side_effect = assume_role
+    return sts_client
+
+
+def patch_sessions(inventory, tracker=None, delay=0.0, tags=None):
+    """Patch boto3.Session so each assumed role yields the stub session of its account"""
+    def session_factory(aws_access_key_id, **kwargs):
+        return StubSession(aws_access_key_id[len('AKIA'):], inventory, tracker, delay, tags)
+    return patch('organization_sweep.boto3.Session', side_effect=session_factory)
+
+
+def log_groups(compliant, non_compliant, prefix='/app'):
+    """Build describe_log_groups entries with the given number of compliant and infinite-retention groups"""
+    return (
+        [{'logGroupName': f'{prefix}/ok-{i}', 'retentionInDays': 30} for i in range(compliant)] +
+        [{'logGroupName': f'{prefix}/bad-{i}'} for i in range(non_compliant)]
+    )
+
+
+class TestRoleAssumption:
+    """Test entering member accounts"""
+
+    def test_member_role_arn(self):
+        """Test role ARNs are built from the account, role name and partition"""
+        assert get_member_role_arn('111111111111', 'auditor') == 'arn:aws:iam::111111111111:role/auditor'
+        assert get_member_role_arn('111111111111', 'auditor', 'aws-us-gov') == \
+            'arn:aws-us-gov:iam::111111111111:role/auditor'
+
+    def test_assume_account_role_builds_session_from_credentials(self):
+        """Test the assumed role's temporary credentials are used for the member session"""
+        sts_client = stub_sts_client()
+        with patch('organization_sweep.boto3.Session') as mock_session:
+            account_session = assume_account_role('111111111111', 'auditor', sts_client=sts_client)
+
+        assert account_session.account_id == '111111111111'
+        sts_client.assume_role.assert_called_once_with(
+            RoleArn='arn:aws:iam::111111111111:role/auditor',
+            RoleSessionName='cw-lg-retention-monitor'
+        )
+        mock_session.assert_called_once_with(
+            aws_access_key_id='AKIA111111111111',
+            aws_secret_access_key='secret',
+            aws_session_token='token'
+        )
+
+    def test_session_clients_created_one_at_a_time(self):
+        """Test worker threads never call the shared boto3 Session at once, and reuse its clients"""
+        lock = threading.Lock()
+        in_session = 0
+        overlaps = 0
+
+        def create_client(service_name, region_name=None, config=None):
+            nonlocal in_session, overlaps
+            with lock:
+                in_session += 1
+                overlaps += in_session > 1
+            time.sleep(0.005)
+            with lock:
+                in_session -= 1
+            return Mock()
+
+        with patch('organization_sweep.boto3.Session') as mock_session:
+            mock_session.return_value.client.side_effect = create_client
+            account_session = assume_account_role('111111111111', 'auditor', sts_client=stub_sts_client())
+            regions = ['us-east-1', 'eu-west-1', 'ap-south-1', 'us-west-2'] * 4
+            with organization_sweep.ThreadPoolExecutor(max_workers=8) as executor:
+                clients = list(executor.map(lambda region: account_session.client('logs', region), regions))
+
+        assert overlaps == 0
+        assert mock_session.return_value.client.call_count == 4
+        assert clients[0] is clients[4]
+
+    def test_list_organization_accounts_skips_inactive(self):
+        """Test account discovery pages through the organization and keeps active accounts only"""
+        organizations_client = Mock()
+        organizations_client.list_accounts.side_effect = [
+            {'Accounts': [{'Id': '1', 'Status': 'ACTIVE'}, {'Id': '2', 'Status': 'SUSPENDED'}], 'NextToken': 't'},
+            {'Accounts': [{'Id': '3', 'Status': 'ACTIVE'}]}
+        ]
+
+        assert list_organization_accounts(organizations_client) == ['1', '3']
+        assert organizations_client.list_accounts.call_args_list[1][1] == {'NextToken': 't'}
+
+
+class TestOrganizationSweep:
+    """Test sweeping many accounts and regions into one report"""
+
+    INVENTORY = {
+        '111111111111': {'us-east-1': log_groups(2, 1), 'eu-west-1': log_groups(1, 0)},
+        '222222222222': {'us-east-1': log_groups(0, 3), 'ca-central-1': log_groups(4, 0)},
+    }
+
+    def _sweep(self, inventory, denied=(), tags=None, **kwargs):
+        with patch('lambda_function.boto3.client', return_value=stub_sts_client(denied)), \
+             patch_sessions(inventory, tags=tags):
+            return run_organization_sweep(list(inventory), 30, role_name='auditor', **kwargs)
+
+    def test_consolidated_report(self):
+        """Test every enabled region of every account is evaluated and totalled"""
+        report = self._sweep(self.INVENTORY)
+
+        assert report['required_retention_days'] == 30
+        assert report['summary'] == {
+            'accounts': 2,
+            'regions_evaluated': 4,
+            'regions_failed': 0,
+            'log_groups': 11,
+            'COMPLIANT': 7,
+            'NON_COMPLIANT': 4,
+            'excess_stored_bytes': 0,
+        }
+        account = report['accounts']['222222222222']['regions']
+        assert sorted(account) == ['ca-central-1', 'us-east-1']
+        assert account['us-east-1']['non_compliant_log_groups'] == ['/app/bad-0', '/app/bad-1', '/app/bad-2']
+        assert json.loads(json.dumps(report)) == report
+
+    def test_excess_storage_totalled(self):
+        """Test storage kept beyond the maximum retention is summed per region and overall"""
+        over_retained = [{'logGroupName': '/app/old', 'retentionInDays': 120, 'storedBytes': 4000}]
+        inventory = {'111111111111': {'us-east-1': over_retained + log_groups(1, 0)}}
+
+        with patch.dict(os.environ, {'MAXIMUM_RETENTION_DAYS': '60'}):
+            report = self._sweep(inventory)
+
+        assert report['accounts']['111111111111']['regions']['us-east-1']['excess_stored_bytes'] == 2000
+        assert report['summary']['excess_stored_bytes'] == 2000
+        assert report['summary']['NON_COMPLIANT'] == 1
+
+    def test_tag_rules_use_member_account_tags(self):
+        """Test tag-based policy rules read the tags of each swept account and region"""
+        inventory = {
+            '111111111111': {'us-east-1': log_groups(2, 0), 'eu-west-1': log_groups(2, 0)},
+            '222222222222': {'us-east-1': log_groups(2, 0)},
+        }
+        tags = {
+            '111111111111': {'us-east-1': {'/app/ok-0': {'retention-class': 'audit'}}},
+            '222222222222': {'us-east-1': {'/app/ok-1': {'retention-class': 'audit'}}},
+        }
+        policy = [{'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 365}]
+
+        with patch.dict(os.environ, {'RETENTION_POLICY': json.dumps(policy)}):
+            report = self._sweep(inventory, tags=tags)
+
+        assert report['accounts']['111111111111']['regions']['us-east-1']['non_compliant_log_groups'] == ['/app/ok-0']
+        assert report['accounts']['111111111111']['regions']['eu-west-1']['NON_COMPLIANT'] == 0
+        assert report['accounts']['222222222222']['regions']['us-east-1']['non_compliant_log_groups'] == ['/app/ok-1']
+        assert report['summary']['NON_COMPLIANT'] == 2
+
+    def test_explicit_regions_override_enabled_regions(self):
+        """Test a region list limits the sweep to those regions"""
+        report = self._sweep(self.INVENTORY, regions=['us-east-1'])
+
+        assert report['summary']['regions_evaluated'] == 2
+        assert report['summary']['NON_COMPLIANT'] == 4
+
+    def test_failed_account_and_region_do_not_stop_sweep(self):
+        """Test an account whose role cannot be assumed and a failing region are reported as errors"""
+        inventory = {
+            '111111111111': {'us-east-1': log_groups(2, 0), 'eu-west-1': ValueError('Region unavailable')},
+            '222222222222': {'us-east-1': log_groups(1, 1)},
+            '333333333333': {'us-east-1': log_groups(5, 5)},
+        }
+        report = self._sweep(inventory, denied=('333333333333',))
+
+        assert 'AccessDenied' in report['accounts']['333333333333']['error']
+        assert report['accounts']['111111111111']['regions']['eu-west-1'] == {'error': 'Region unavailable'}
+        assert report['summary']['regions_evaluated'] == 2
+        assert report['summary']['regions_failed'] == 1
+        assert report['summary']['log_groups'] == 4
+
+    def test_per_account_concurrency_limit(self):
+        """Test no account runs more sweeps at once than its limit while accounts run in parallel"""
+        regions = [f'region-{i}' for i in range(6)]
+        inventory = {
+            account_id: {region: log_groups(1, 0) for region in regions}
+            for account_id in ('111111111111', '222222222222', '333333333333')
+        }
+        tracker = ConcurrencyTracker()
+
+        with patch('lambda_function.boto3.client', return_value=stub_sts_client()), \
+             patch_sessions(inventory, tracker, delay=0.02):
+            report = run_organization_sweep(
+                list(inventory), 1, sweep_concurrency=8, account_concurrency=2
+            )
+
+        assert report['summary']['regions_evaluated'] == 18
+        assert max(tracker.peak.values()) <= 2
+        assert tracker.peak_total > 2
+
+    def test_rate_limiters_scoped_per_account_and_region(self):
+        """Test each account and region is rate limited separately, matching per-region service quotas"""
+        self._sweep(self.INVENTORY)
+
+        scopes = {scope for scope, operation in retry.RATE_LIMITERS if operation == 'describe_log_groups'}
+        assert scopes == {
+            ('111111111111', 'us-east-1'), ('111111111111', 'eu-west-1'),
+            ('222222222222', 'us-east-1'), ('222222222222', 'ca-central-1'),
+        }
+
+    @pytest.mark.parametrize('account_count,region_count', [(50, 17), (300, 17)])
+    def test_organization_sweep_scaling(self, account_count, region_count):
+        """Benchmark scheduler overhead for a full organization with a fixed per-region API latency"""
+        regions = [f'region-{i}' for i in range(region_count)]
+        inventory = {
+            str(100000000000 + i): {region: log_groups(3, 1) for region in regions}
+            for i in range(account_count)
+        }
+
+        start = time.perf_counter()
+        with patch('lambda_function.boto3.client', return_value=stub_sts_client()), \
+             patch_sessions(inventory, delay=0.005):
+            report = run_organization_sweep(list(inventory), 30, sweep_concurrency=64, account_concurrency=4)
+        elapsed = time.perf_counter() - start
+
+        sequential = account_count * region_count * 0.005
+        print(f"\n{account_count} accounts x {region_count} regions: {elapsed:.2f}s "
+              f"(sequential lower bound {sequential:.2f}s)")
+        assert report['summary']['regions_evaluated'] == account_count * region_count
+        assert report['summary']['NON_COMPLIANT'] == account_count * region_count
+        assert elapsed < sequential
+
+
+class StubAggregatorConfigClient:
+    """Config stand-in answering aggregator advanced queries from an {account: {region: log groups}} inventory"""
+
+    def __init__(self, inventory, page_size=2):
+        self.results = [
+            json.dumps({'accountId': account_id, 'awsRegion': region, 'resourceId': log_group['logGroupName'],
+                        'configuration': {key: value for key, value in log_group.items() if key != 'logGroupName'}})
+            for account_id, regions in inventory.items()
+            for region, region_log_groups in regions.items()
+            for log_group in region_log_groups
+        ]
+        self.page_size = page_size
+        self.requests = []
+
+    def select_aggregate_resource_config(self, Expression, ConfigurationAggregatorName, Limit, NextToken='0'):
+        self.requests.append((Expression, ConfigurationAggregatorName))
+        start = int(NextToken)
+        response = {'Results': self.results[start:start + self.page_size]}
+        if start + self.page_size < len(self.results):
+            response['NextToken'] = str(start + self.page_size)
+        return response
+
+
+class TestAggregatorSweep:
+    """Test building the organization report from one Config aggregator query"""
+
+    def _sweep(self, inventory, account_ids=(), **kwargs):
+        config_client = StubAggregatorConfigClient(inventory)
+        sts_client = stub_sts_client()
+        clients = {'config': config_client, 'sts': sts_client}
+        with patch('lambda_function.boto3.client', side_effect=lambda name, **kwargs: clients[name]):
+            report = run_organization_sweep(list(account_ids), 30, aggregator_name='org-aggregator', **kwargs)
+        sts_client.assume_role.assert_not_called()
+        return report, config_client
+
+    def test_report_matches_member_sweeps(self):
+        """Test that one aggregator query gives the same report as sweeping every member"""
+        report, config_client = self._sweep(TestOrganizationSweep.INVENTORY)
+
+        with patch('lambda_function.boto3.client', return_value=stub_sts_client()), \
+             patch_sessions(TestOrganizationSweep.INVENTORY):
+            expected = run_organization_sweep(list(TestOrganizationSweep.INVENTORY), 30)
+        assert report['summary'] == expected['summary']
+        assert report['accounts'] == expected['accounts']
+        assert len(config_client.requests) == 6
+        assert config_client.requests[0] == (
+            "SELECT accountId, awsRegion, resourceId, configuration.retentionInDays "
+            "WHERE resourceType = 'AWS::Logs::LogGroup'", 'org-aggregator'
+        )
+
+    def test_accounts_and_regions_narrow_query(self):
+        """Test that requested accounts and regions become IN conditions and empty accounts are reported"""
+        report, config_client = self._sweep(
+            {'111111111111': {'us-east-1': log_groups(1, 1)}}, account_ids=['111111111111', '333333333333'],
+            regions=['us-east-1', 'eu-west-1']
+        )
+
+        assert config_client.requests[0][0].endswith(
+            "AND accountId IN ('111111111111', '333333333333') AND awsRegion IN ('us-east-1', 'eu-west-1')"
+        )
+        assert report['summary']['accounts'] == 2
+        assert report['accounts']['333333333333'] == {'regions': {}}
+        assert report['accounts']['111111111111']['regions']['us-east-1']['NON_COMPLIANT'] == 1
+
+    def test_handler_skips_account_discovery(self):
+        """Test that the handler with an aggregator neither lists accounts nor assumes roles"""
+        config_client = StubAggregatorConfigClient({'111111111111': {'us-east-1': log_groups(2, 1)}})
+        clients = {'config': config_client}
+
+        with patch.dict(os.environ, {'CONFIGURATION_AGGREGATOR_NAME': 'org-aggregator'}), \
+             patch('lambda_function.boto3.client', side_effect=lambda name, **kwargs: clients[name]):
+            result = organization_handler({'MinimumRetentionDays': 30}, {})
+
+        assert json.loads(result['body'])['summary']['NON_COMPLIANT'] == 1
+
+
+class TestOrganizationReport:
+    """Test report merging"""
+
+    def test_build_report_empty(self):
+        """Test an organization with no accounts yields an empty report"""
+        report = build_report({}, 7, '2024-01-01T00:00:00+00:00')
+        assert report['summary']['accounts'] == 0
+        assert report['accounts'] == {}
+
+    def test_non_compliant_names_capped(self):
+        """Test the per-region list of non-compliant names is capped while counts stay exact"""
+        inventory = {'111111111111': {'us-east-1': log_groups(0, organization_sweep.MAX_REPORTED_LOG_GROUPS + 5)}}
+        with patch('lambda_function.boto3.client', return_value=stub_sts_client()), patch_sessions(inventory):
+            report = run_organization_sweep(list(inventory), 30)
+
+        region = report['accounts']['111111111111']['regions']['us-east-1']
+        assert region['NON_COMPLIANT'] == organization_sweep.MAX_REPORTED_LOG_GROUPS + 5
+        assert len(region['non_compliant_log_groups']) == organization_sweep.MAX_REPORTED_LOG_GROUPS
+
+
+class TestOrganizationHandler:
+    """Test the organization sweep Lambda entry point"""
+
+    def test_handler_discovers_accounts_and_writes_report(self):
+        """Test accounts come from Organizations and the report is written to the report bucket"""
+        inventory = {'111111111111': {'us-east-1': log_groups(1, 1)}}
+        organizations_client = Mock()
+        organizations_client.list_accounts.return_value = {
+            'Accounts': [{'Id': '111111111111', 'Status': 'ACTIVE'}]
+        }
+        s3_client = Mock()
+        clients = {'sts': stub_sts_client(), 'organizations': organizations_client, 's3': s3_client}
+
+        with patch.dict(os.environ, {'REPORT_BUCKET': 'reports', 'REPORT_PREFIX': 'org/'}), \
+             patch('lambda_function.boto3.client', side_effect=lambda name, **kwargs: clients[name]), \
+             patch_sessions(inventory):
+            result = organization_handler({'MinimumRetentionDays': 14}, {})
+
+        body = json.loads(result['body'])
+        assert body['summary']['NON_COMPLIANT'] == 1
+        put = s3_client.put_object.call_args[1]
+        assert put['Bucket'] == 'reports'
+        assert put['Key'].startswith('org/organization-report-')
+        assert json.loads(put['Body'])['required_retention_days'] == 14
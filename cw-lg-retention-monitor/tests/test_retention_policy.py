@@ -0,0 +1,155 @@
+"""
+Unit tests for the compiled retention policy
+"""
+import sys
+import os
+import json
+import random
+import pytest
+from fnmatch import fnmatchcase
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_aws import SyntheticLogGroups, synthetic_policy
+from retention_policy import RetentionPolicy, RetentionRequirement
+
+DEFAULT = RetentionRequirement(30, None)
+
+
+def linear_match(rules, name, tags=None):
+    """Reference matcher testing every rule in order"""
+    for index, rule in enumerate(rules):
+        if 'Prefix' in rule and name.startswith(rule['Prefix']):
+            return index
+        if 'Pattern' in rule and fnmatchcase(name, rule['Pattern']):
+            return index
+        if 'Tags' in rule and tags and all(tags.get(key) == value for key, value in rule['Tags'].items()):
+            return index
+    return None
+
+
+class TestPolicyParsing:
+    """Test loading and validating policy documents"""
+
+    @pytest.mark.parametrize('document', [None, '', '   ', '[]'])
+    def test_empty_policy(self, document):
+        """Test that a missing or empty document returns the defaults for every log group"""
+        policy = RetentionPolicy.from_document(document)
+
+        assert not policy
+        assert policy.fingerprint is None
+        assert policy.requirement('/aws/cloudtrail/org', {'team': 'a'}, DEFAULT) is DEFAULT
+
+    @pytest.mark.parametrize('document, message', [
+        ('{not json', 'not valid JSON'),
+        ('{"Prefix": "/a"}', 'JSON list'),
+        ('["/a"]', 'not an object'),
+        ('[{"Prefix": "/a", "Retention": 7}]', 'unknown keys: Retention'),
+        ('[{"MinimumRetentionDays": 7}]', 'exactly one of'),
+        ('[{"Prefix": "/a", "Pattern": "/a*", "MinimumRetentionDays": 7}]', 'exactly one of'),
+        ('[{"Prefix": "", "MinimumRetentionDays": 7}]', 'non-empty string'),
+        ('[{"Tags": {}, "MinimumRetentionDays": 7}]', 'Tags must map'),
+        ('[{"Tags": {"team": 1}, "MinimumRetentionDays": 7}]', 'Tags must map'),
+        ('[{"Prefix": "/a", "MinimumRetentionDays": 0}]', 'positive number'),
+        ('[{"Prefix": "/a", "MinimumRetentionDays": true}]', 'positive number'),
+        ('[{"Prefix": "/a"}]', 'sets neither'),
+        ('[{"Prefix": "/a", "MinimumRetentionDays": 30, "MaximumRetentionDays": 7}]', 'below MinimumRetentionDays'),
+    ])
+    def test_invalid_policy_rejected(self, document, message):
+        """Test that invalid documents raise a ValueError naming the problem"""
+        with pytest.raises(ValueError, match=message):
+            RetentionPolicy.from_document(document)
+
+    def test_fingerprint_tracks_rules(self):
+        """Test that the fingerprint changes with the rules but not with key order"""
+        first = RetentionPolicy([{'Prefix': '/a', 'MinimumRetentionDays': 7}])
+        reordered = RetentionPolicy([{'MinimumRetentionDays': 7, 'Prefix': '/a'}])
+        changed = RetentionPolicy([{'Prefix': '/a', 'MinimumRetentionDays': 14}])
+
+        assert first.fingerprint == reordered.fingerprint
+        assert first.fingerprint != changed.fingerprint
+
+
+class TestPolicyMatching:
+    """Test rule precedence and requirements"""
+
+    RULES = [
+        {'Prefix': '/aws/cloudtrail', 'MinimumRetentionDays': 365},
+        {'Pattern': '/aws/lambda/dev-*', 'MinimumRetentionDays': 7, 'MaximumRetentionDays': 30},
+        {'Tags': {'retention-class': 'audit'}, 'MinimumRetentionDays': 2557},
+        {'Pattern': '*-debug', 'MaximumRetentionDays': 3},
+        {'Pattern': '*/tmp/*', 'MaximumRetentionDays': 1},
+        {'Prefix': '/aws/', 'MinimumRetentionDays': 60},
+    ]
+
+    @pytest.fixture
+    def policy(self):
+        return RetentionPolicy(self.RULES)
+
+    @pytest.mark.parametrize('name, tags, expected', [
+        ('/aws/cloudtrail/org', None, (365, None)),
+        ('/aws/lambda/dev-api', None, (7, 30)),
+        ('/aws/lambda/dev-api', {'retention-class': 'audit'}, (7, 30)),
+        ('/aws/lambda/prod-api', {'retention-class': 'audit'}, (2557, None)),
+        ('/app/worker-debug', None, (30, 3)),
+        ('/app/tmp/cache', None, (30, 1)),
+        ('/aws/ecs/cluster', None, (60, None)),
+        ('/app/worker', None, (30, None)),
+        ('/app/worker', {'retention-class': 'standard'}, (30, None)),
+    ])
+    def test_first_matching_rule_wins(self, policy, name, tags, expected):
+        """Test that the first rule in order sets the requirement, with defaults filling the gaps"""
+        assert policy.requirement(name, tags, DEFAULT) == expected
+
+    def test_prefix_rule_matches_exact_name(self, policy):
+        """Test that a prefix matches the log group named exactly like it"""
+        assert policy.match('/aws/cloudtrail') == 0
+
+    def test_tag_rule_requires_every_tag(self):
+        """Test that a tag rule with several tags matches only when all of them are present"""
+        policy = RetentionPolicy([
+            {'Tags': {'team': 'payments', 'env': 'prod'}, 'MinimumRetentionDays': 400},
+            {'Tags': {'team': 'payments'}, 'MinimumRetentionDays': 90},
+        ])
+
+        assert policy.match('/a', {'team': 'payments', 'env': 'prod'}) == 0
+        assert policy.match('/a', {'env': 'prod', 'team': 'payments'}) == 0
+        assert policy.match('/a', {'team': 'payments', 'env': 'dev'}) == 1
+        assert policy.match('/a', {'env': 'prod'}) is None
+        assert policy.tag_keys == {'team', 'env'}
+
+    def test_character_classes(self):
+        """Test that [...] classes are matched, including a class at the end of a pattern"""
+        policy = RetentionPolicy([
+            {'Pattern': '*-[0-9]', 'MinimumRetentionDays': 7},
+            {'Pattern': '*-[ab]x', 'MinimumRetentionDays': 14},
+            {'Pattern': '/svc/?[xy]*', 'MinimumRetentionDays': 21},
+        ])
+
+        assert policy.match('/app/shard-3') == 0
+        assert policy.match('/app/shard-ax') == 1
+        assert policy.match('/app/shard-cx') is None
+        assert policy.match('/svc/ay-logs') == 2
+        assert policy.match('/svc/az-logs') is None
+
+    def test_matches_linear_scan(self):
+        """Test that the compiled matcher agrees with testing every rule in order"""
+        log_groups = SyntheticLogGroups(20000)
+        rules = synthetic_policy(log_groups, 400, seed=7)
+        rules += [
+            {'Pattern': '*group-00*', 'MinimumRetentionDays': 180},
+            {'Pattern': '/aws/lambda/group-00[0-4]*', 'MaximumRetentionDays': 60},
+        ]
+        random.Random(7).shuffle(rules)
+        policy = RetentionPolicy(rules)
+
+        for index in range(0, len(log_groups), 7):
+            name, tags = log_groups.name(index), log_groups.tags(index)
+            assert policy.match(name, tags) == linear_match(rules, name, tags), name
+
+    def test_policy_round_trips_through_json(self):
+        """Test that a policy document compiles to the same matcher as its rules"""
+        rules = self.RULES
+        assert RetentionPolicy.from_document(json.dumps(rules)).fingerprint == RetentionPolicy(rules).fingerprint
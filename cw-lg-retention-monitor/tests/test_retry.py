@@ -0,0 +1,156 @@
+"""
+Unit tests for rate limiting and retries of AWS API calls
+"""
+import sys
+import os
+import json
+import pytest
+from unittest.mock import Mock, patch
+from botocore.exceptions import ClientError
+
+# Add src directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import retry
+from lambda_function import lambda_handler
+from retry import TokenBucket, call_with_retry, paginate_with_retry
+
+
+def throttling_error(code='ThrottlingException', operation='DescribeLogGroups'):
+    """Build a botocore throttling error"""
+    return ClientError({'Error': {'Code': code, 'Message': 'Rate exceeded'}}, operation)
+
+
+class TestRetryEngine:
+    """Test adaptive retry/backoff for throttled AWS calls"""
+    
+    @patch('retry.time.sleep')
+    def test_call_with_retry_recovers_from_throttling(self, mock_sleep):
+        """Test that throttled calls are retried with backoff and metrics recorded"""
+        mock_client = Mock()
+        mock_client.put_evaluations.side_effect = [
+            throttling_error(), throttling_error('LimitExceededException'), {'FailedEvaluations': []}
+        ]
+        
+        response = call_with_retry(mock_client, 'put_evaluations', Evaluations=[], ResultToken='t')
+        
+        assert response == {'FailedEvaluations': []}
+        assert mock_client.put_evaluations.call_count == 3
+        metrics = retry.RETRY_METRICS['put_evaluations']
+        assert metrics['calls'] == 3
+        assert metrics['retries'] == 2
+        assert metrics['throttle_seconds'] >= 0
+    
+    @patch('retry.time.sleep')
+    def test_backoff_is_jittered_and_bounded(self, mock_sleep):
+        """Test that backoff delays stay within the exponential envelope"""
+        mock_client = Mock()
+        mock_client.describe_log_groups.side_effect = [throttling_error()] * 4 + [{}]
+        
+        call_with_retry(mock_client, 'describe_log_groups')
+        
+        delays = [call[0][0] for call in mock_sleep.call_args_list]
+        for attempt, delay in enumerate(delays, 1):
+            assert 0 <= delay <= retry.BASE_BACKOFF_SECONDS * 2 ** (attempt - 1)
+    
+    def test_call_with_retry_raises_other_errors_immediately(self):
+        """Test that non-throttling errors are not retried"""
+        mock_client = Mock()
+        mock_client.put_evaluations.side_effect = ClientError(
+            {'Error': {'Code': 'InvalidResultTokenException', 'Message': 'bad'}}, 'PutEvaluations'
+        )
+        
+        with pytest.raises(ClientError):
+            call_with_retry(mock_client, 'put_evaluations', Evaluations=[], ResultToken='t')
+        
+        assert mock_client.put_evaluations.call_count == 1
+    
+    @patch('retry.time.sleep')
+    def test_call_with_retry_gives_up_after_max_attempts(self, mock_sleep):
+        """Test that persistent throttling is raised once the retry budget is spent"""
+        mock_client = Mock()
+        mock_client.get_resource_config_history.side_effect = throttling_error()
+        
+        with pytest.raises(ClientError):
+            call_with_retry(mock_client, 'get_resource_config_history')
+        
+        max_attempts = retry.API_RETRY_SETTINGS['get_resource_config_history']['max_attempts']
+        assert mock_client.get_resource_config_history.call_count == max_attempts
+    
+    @patch('retry.time.sleep')
+    def test_paginate_resumes_from_last_token(self, mock_sleep):
+        """Test that a throttled page restarts the paginator from the last token"""
+        mock_client = Mock()
+        paginator = mock_client.get_paginator.return_value
+        
+        def first_run(**kwargs):
+            yield {'logGroups': [{'logGroupName': '/a'}], 'nextToken': 'token1'}
+            raise throttling_error()
+        
+        paginator.paginate.side_effect = [
+            first_run(),
+            iter([{'logGroups': [{'logGroupName': '/b'}]}])
+        ]
+        
+        pages = list(paginate_with_retry(mock_client, 'describe_log_groups'))
+        
+        assert [page['logGroups'][0]['logGroupName'] for page in pages] == ['/a', '/b']
+        resume_kwargs = paginator.paginate.call_args_list[1][1]
+        assert resume_kwargs == {'PaginationConfig': {'StartingToken': 'token1'}}
+        assert retry.RETRY_METRICS['describe_log_groups']['retries'] == 1
+    
+    @patch('retry.time.sleep')
+    def test_token_bucket_limits_rate(self, mock_sleep):
+        """Test that the bucket allows a burst and then waits for refill"""
+        bucket = TokenBucket(rate=10.0, burst=2)
+        
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0
+        waited = bucket.acquire()
+        
+        assert waited == pytest.approx(0.1, abs=0.01)
+        mock_sleep.assert_called_once()
+    
+    def test_token_bucket_adapts_to_throttling(self):
+        """Test that throttling halves the rate and success recovers it"""
+        bucket = TokenBucket(rate=8.0, burst=1)
+        
+        bucket.throttled()
+        assert bucket.rate == 4.0
+        
+        for _ in range(20):
+            bucket.succeeded()
+        assert bucket.rate == 8.0
+    
+    @patch('retry.time.sleep')
+    @patch('lambda_function.boto3.client')
+    def test_sweep_survives_throttling(self, mock_boto_client, mock_sleep):
+        """Test that a throttle during a sweep no longer replaces results with an account-level error"""
+        mock_config_client = Mock()
+        mock_logs_client = Mock()
+        mock_boto_client.side_effect = [mock_config_client, mock_logs_client, mock_config_client]
+        
+        def throttled_pages():
+            raise throttling_error()
+            yield
+        
+        mock_logs_client.get_paginator.return_value.paginate.side_effect = [
+            throttled_pages(),
+            iter([{'logGroups': [{'logGroupName': '/test/log', 'retentionInDays': 30}]}])
+        ]
+        mock_config_client.put_evaluations.side_effect = [throttling_error(operation='PutEvaluations'), {}]
+        mock_config_client.get_compliance_details_by_config_rule.return_value = {'EvaluationResults': []}
+        
+        event = {
+            'invokingEvent': json.dumps({
+                'messageType': 'ScheduledNotification',
+                'notificationCreationTime': '2024-01-01T00:00:00Z'
+            }),
+            'resultToken': 'test-token',
+            'configRuleName': 'test-rule'
+        }
+        
+        lambda_handler(event, {})
+        
+        evaluations = mock_config_client.put_evaluations.call_args[1]['Evaluations']
+        assert [e['ComplianceResourceId'] for e in evaluations] == ['/test/log']